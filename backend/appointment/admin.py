@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment
+from .models import Appointment, AppointmentStatusEvent, DoctorQueueLoad, QueueCounter, SlotInventory
 
 
 @admin.register(Appointment)
@@ -14,7 +14,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_filter = ("status", "clinic", "doctor", "date", "created_by")
     search_fields = ("patient_full_name", "patient_phone", "doctor__full_name", "clinic__name")
     ordering = ("-date", "-time_start")
-    readonly_fields = ("created_at", "updated_at")
+    readonly_fields = ("created_at", "updated_at", "invited_at", "finished_at")
     date_hierarchy = "date"
 
     fieldsets = (
@@ -25,7 +25,7 @@ class AppointmentAdmin(admin.ModelAdmin):
             "fields": ("patient_full_name", "patient_phone", "date", "time_start")
         }),
         ("Статус", {
-            "fields": ("status", "number_coupon", "comment")
+            "fields": ("status", "number_coupon", "comment", "invited_at", "finished_at")
         }),
         ("Системная информация", {
             "fields": ("created_by", "source", "created_at", "updated_at"),
@@ -44,3 +44,46 @@ class AppointmentAdmin(admin.ModelAdmin):
         return obj.clinic.name
     clinic_name.short_description = "Клиника"
 
+
+@admin.register(SlotInventory)
+class SlotInventoryAdmin(admin.ModelAdmin):
+    list_display = ("doctor", "clinic", "date", "duration", "free_count", "taken_count", "updated_at")
+    list_filter = ("clinic", "date")
+    search_fields = ("doctor__full_name", "clinic__name")
+    ordering = ("date", "doctor")
+    readonly_fields = ("free_slots", "taken_slots", "free_count", "taken_count", "updated_at")
+    date_hierarchy = "date"
+
+
+@admin.register(QueueCounter)
+class QueueCounterAdmin(admin.ModelAdmin):
+    list_display = ("clinic", "date", "prefix", "last_number")
+    list_filter = ("clinic", "date")
+    ordering = ("-date", "clinic", "prefix")
+    readonly_fields = ("last_number",)
+    date_hierarchy = "date"
+
+
+@admin.register(DoctorQueueLoad)
+class DoctorQueueLoadAdmin(admin.ModelAdmin):
+    list_display = ("doctor", "date", "active_count")
+    list_filter = ("date",)
+    search_fields = ("doctor__full_name",)
+    ordering = ("-date", "doctor")
+    readonly_fields = ("active_count",)
+    date_hierarchy = "date"
+
+
+@admin.register(AppointmentStatusEvent)
+class AppointmentStatusEventAdmin(admin.ModelAdmin):
+    list_display = ("appointment", "doctor", "from_status", "to_status", "created_at")
+    list_filter = ("clinic", "to_status")
+    search_fields = ("appointment__patient_full_name", "doctor__full_name")
+    readonly_fields = ("appointment", "clinic", "doctor", "from_status", "to_status", "created_at")
+    date_hierarchy = "created_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
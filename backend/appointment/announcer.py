@@ -0,0 +1,188 @@
+"""
+Голосовые вызовы пациентов электронной очереди.
+
+Переход записи в статус invited обнаруживается один раз — в сигнале сохранения
+записи (signals.py), а не в каждом SSE-потоке. Речь синтезируется один раз на
+вызов в пуле потоков процесса, сохранившего запись; аудио сохраняется в
+core.tts_cache по хэшу содержимого, а всем экранам клиники через шину событий
+(events.broadcast, тип voice) рассылается только ссылка на него.
+
+Состояние хранится только пока идёт синтез (ключ клиника + запись), поэтому
+ничего не копится между днями.
+
+Предварительный синтез: после изменения очереди на сегодня (schedule_prefetch)
+Celery-задача prefetch_queue_announcements заранее синтезирует и кладёт в
+core.tts_cache вызовы ближайших TTS_PREFETCH_AHEAD ожидающих пациентов каждого
+врача. К моменту вызова аудио уже в кэше и воспроизводится без задержки.
+Для клиники одновременно работает одна задача и не больше
+TTS_PREFETCH_CONCURRENCY запросов к SpeechKit.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from core import metrics, tts_cache
+from core.utils import patient_call_audio_cached, patient_call_synthesis_in_memory
+
+from . import events
+from .models import Appointment
+from .queue_snapshot import queue_queryset
+
+
+logger = logging.getLogger(__name__)
+
+# Пул потоков для синтеза речи (SpeechKit API)
+_synth_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='speech_synth')
+
+PREFETCH_ENABLED = getattr(settings, 'TTS_PREFETCH_ENABLED', False)
+PREFETCH_AHEAD = getattr(settings, 'TTS_PREFETCH_AHEAD', 3)
+PREFETCH_CONCURRENCY = getattr(settings, 'TTS_PREFETCH_CONCURRENCY', 2)
+# Изменения очереди за это время объединяются в один запуск предсинтеза (секунды)
+PREFETCH_DEBOUNCE = 5
+# Блокировка клиники на время задачи; истекает сама, если воркер упал (секунды)
+PREFETCH_LOCK_TIMEOUT = 180
+
+PREFETCHED_METRIC = 'tts_prefetch_synthesized'
+metrics.register(PREFETCHED_METRIC)
+
+# Статусы пациентов, которых ещё вызовут
+_WAITING_STATUSES = (Appointment.Status.URGENT, Appointment.Status.CONFIRMED, Appointment.Status.PENDING)
+
+# (clinic_id, appointment_id) вызовов, для которых синтез уже идёт
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def announce_invite(appointment) -> None:
+    """
+    Поставить синтез вызова пациента в очередь; результат получат все экраны клиники.
+
+    Повторный вызов той же записи, пока её синтез не завершён, игнорируется.
+    """
+    key = (appointment.clinic_id, appointment.pk)
+    with _in_flight_lock:
+        if key in _in_flight:
+            return
+        _in_flight.add(key)
+
+    doctor = appointment.doctor
+    call = {
+        'call_id': uuid.uuid4().hex,
+        'appointment_id': appointment.pk,
+        'number_coupon': appointment.number_coupon or (
+            appointment.time_start.strftime("%H:%M") if appointment.time_start else ''
+        ),
+        'patient_name': appointment.patient_full_name,
+        'cabinet_number': getattr(doctor, 'cabinet_number', '') if doctor else '',
+    }
+    logger.info(f"[VOICE_TRIGGER] Запускаем синтез для пациента: {call['patient_name']}, талон: {appointment.number_coupon or 'без талона'}")
+    _synth_executor.submit(_synthesize_and_broadcast, key, appointment.number_coupon or '', call)
+
+
+def _synthesize_and_broadcast(key, coupon: str, call: dict) -> None:
+    started = time.monotonic()
+    try:
+        audio = patient_call_synthesis_in_memory(
+            patient_name=call['patient_name'],
+            number_coupon=coupon,
+            cabinet_number=call['cabinet_number'],
+        )
+        # Экраны получают только ссылку: аудио по хэшу содержимого отдаётся с долгим кэшированием
+        audio_key = tts_cache.put_audio(audio) if audio else None
+    except Exception as exc:
+        logger.error(f"[CALL] Ошибка синтеза для appointment {call['appointment_id']}: {exc}")
+        audio_key = None
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(key)
+
+    elapsed = time.monotonic() - started
+    if not audio_key:
+        logger.warning(f"[CALL] Не удалось синтезировать аудио для {call['patient_name']}, время синтеза: {elapsed:.3f}с")
+        return
+
+    logger.info(
+        f"[CALL] Синтезировано аудио для пациента: {call['patient_name']}, "
+        f"талон: {coupon or 'без талона'}, размер: {len(audio)} байт, "
+        f"время синтеза: {elapsed:.3f}с"
+    )
+    audio_url = reverse('tts_audio', args=[audio_key])
+    events.broadcast(key[0], {'type': 'voice', 'announcement': {**call, 'audio_url': audio_url}})
+
+
+def prefetch_queued_key(clinic_id: int) -> str:
+    return f"tts_prefetch:queued:{clinic_id}"
+
+
+def prefetch_lock_key(clinic_id: int) -> str:
+    return f"tts_prefetch:lock:{clinic_id}"
+
+
+def schedule_prefetch(clinic_id: int) -> None:
+    """Запланировать предсинтез вызовов клиники; частые изменения объединяются в один запуск."""
+    if not PREFETCH_ENABLED or clinic_id is None:
+        return
+    if not cache.add(prefetch_queued_key(clinic_id), 1, timeout=PREFETCH_DEBOUNCE * 2):
+        return
+    # Импортируем здесь, чтобы избежать циклических зависимостей
+    from .tasks import prefetch_queue_announcements
+
+    try:
+        prefetch_queue_announcements.apply_async(args=[clinic_id], countdown=PREFETCH_DEBOUNCE)
+    except Exception as e:
+        logger.warning(f"[PREFETCH] Не удалось поставить задачу предсинтеза для клиники {clinic_id}: {e}")
+        cache.delete(prefetch_queued_key(clinic_id))
+
+
+def upcoming_calls(clinic_id: int, day: date, ahead: int = PREFETCH_AHEAD) -> List[Tuple[str, str]]:
+    """
+    Фразы вызова (талон, кабинет) ближайших ожидающих пациентов каждого врача:
+    срочные первыми, затем в порядке очереди.
+    """
+    waiting = [apt for apt in queue_queryset(clinic_id, day) if apt.status in _WAITING_STATUSES]
+    waiting.sort(key=lambda apt: apt.status != Appointment.Status.URGENT)
+
+    per_doctor = {}
+    calls = []
+    for apt in waiting:
+        if per_doctor.get(apt.doctor_id, 0) >= ahead:
+            continue
+        per_doctor[apt.doctor_id] = per_doctor.get(apt.doctor_id, 0) + 1
+        # Те же аргументы синтеза, что и в announce_invite, — иначе ключ кэша не совпадёт
+        call = (
+            apt.number_coupon or '',
+            getattr(apt.doctor, 'cabinet_number', '') if apt.doctor else '',
+        )
+        if call not in calls:
+            calls.append(call)
+    return calls
+
+
+def prefetch_clinic(clinic_id: int, day: date) -> int:
+    """
+    Синтезировать в кэш отсутствующие вызовы ближайших пациентов клиники.
+
+    Returns:
+        Количество синтезированных фраз
+    """
+    missing = [call for call in upcoming_calls(clinic_id, day) if not patient_call_audio_cached(*call)]
+    if not missing:
+        return 0
+
+    def synthesize(call):
+        coupon, cabinet_number = call
+        return patient_call_synthesis_in_memory(patient_name='', number_coupon=coupon, cabinet_number=cabinet_number)
+
+    with ThreadPoolExecutor(max_workers=PREFETCH_CONCURRENCY, thread_name_prefix='speech_prefetch') as pool:
+        synthesized = sum(1 for audio in pool.map(synthesize, missing) if audio)
+    metrics.incr(PREFETCHED_METRIC, synthesized)
+    logger.info(f"[PREFETCH] Клиника {clinic_id}: синтезировано заранее {synthesized} из {len(missing)} вызовов")
+    return synthesized
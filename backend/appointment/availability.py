@@ -1,281 +1,469 @@
 """
 Сервис для работы с доступными временными слотами врачей.
 Чистая бизнес-логика без привязки к views или моделям.
+
+Занятость дня врача хранится как битовая маска на 1440 минут (DayOccupancy):
+рабочие часы, обед и записи накладываются побитовыми операциями, а свободные
+окна нужной длины ищутся сдвигами маски, без перебора слотов × записей.
 """
+import heapq
+from bisect import bisect_left
 from datetime import datetime, date, time, timedelta
-from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
 from django.db.models import Q
 
+from . import availability_cache, inventory
+from .schedule import WEEKDAY_CODES, get_doctor_schedule
+
+
+MINUTES_PER_DAY = 24 * 60
+
+# Предвычисленные подписи слотов "HH:MM" для каждой минуты суток
+SLOT_LABELS = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(MINUTES_PER_DAY)]
+
+
+class DayOccupancy:
+    """
+    Битовая карта одного дня врача: бит N соответствует минуте N от начала суток.
+
+    work  — минуты рабочего времени
+    lunch — минуты обеда
+    busy  — минуты, занятые активными записями
+    """
+    __slots__ = ('work', 'lunch', 'busy', 'work_start', 'work_end', 'lunch_start', 'lunch_end')
+
+    def __init__(self, work_start: int, work_end: int, lunch_start: Optional[int] = None, lunch_end: Optional[int] = None):
+        self.work_start = work_start
+        self.work_end = work_end
+        self.lunch_start = lunch_start
+        self.lunch_end = lunch_end
+        self.work = _range_mask(work_start, work_end)
+        self.lunch = _range_mask(lunch_start, lunch_end) if lunch_start is not None and lunch_end is not None else 0
+        self.busy = 0
+
+    def add_busy(self, start: int, end: int) -> None:
+        """Отметить интервал [start, end) как занятый."""
+        self.busy |= _range_mask(start, end)
+
+    @property
+    def free(self) -> int:
+        """Минуты, доступные для записи: рабочее время без обеда и занятых интервалов."""
+        return self.work & ~self.lunch & ~self.busy
+
+    def free_slot_starts(self, duration_minutes: int) -> List[int]:
+        """
+        Начала свободных слотов (в минутах) на сетке врача.
+
+        Сетка строится от начала рабочего дня с шагом duration_minutes,
+        после обеда отсчёт продолжается от его окончания.
+        """
+        grid = _slot_grid(self.work_start, self.work_end, self.lunch_start, self.lunch_end, duration_minutes)
+        return _iter_bits(_window_starts(self.free, duration_minutes) & grid)
+
+    def taken_slot_starts(self, duration_minutes: int) -> List[int]:
+        """Начала слотов сетки, которые были бы свободны, но заняты записями."""
+        grid = _slot_grid(self.work_start, self.work_end, self.lunch_start, self.lunch_end, duration_minutes)
+        bookable = _window_starts(self.work & ~self.lunch, duration_minutes) & grid
+        return _iter_bits(bookable & ~_window_starts(self.free, duration_minutes))
+
+    def check(self, start: int, duration_minutes: int) -> Optional[str]:
+        """
+        Проверить произвольный интервал [start, start + duration).
+        Возвращает код причины отказа ('hours', 'lunch', 'busy') или None, если интервал свободен.
+        """
+        end = start + duration_minutes
+        if start < 0 or end > MINUTES_PER_DAY:
+            return 'hours'
+        window = _range_mask(start, end)
+        if window & self.work != window:
+            return 'hours'
+        if window & self.lunch:
+            return 'lunch'
+        if window & self.busy:
+            return 'busy'
+        return None
+
 
 def get_available_slots(doctor, start_date: date, service=None, days_ahead: int = 7) -> Dict[str, List[Dict[str, str]]]:
     """
     Получить свободные временные слоты врача на N дней вперед.
-    
+
     Args:
         doctor: Объект Doctor
         start_date: Дата начала поиска
         service: Объект Service (опционально) - влияет на длительность приема
         days_ahead: Количество дней для поиска (по умолчанию 7)
-    
+
     Returns:
         Словарь вида {"2025-01-20": [{"time_start": "09:00", "time_end": "09:30"}, ...]}
     """
-    result = {}
-    
-    # Определяем длительность приема
-    duration_minutes = service.duration if service and hasattr(service, 'duration') else doctor.default_duration
-    
-    # Маппинг дней недели
-    weekday_map = {
-        0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu',
-        4: 'fri', 5: 'sat', 6: 'sun'
+    return get_available_slots_bulk([doctor], start_date, service=service, days_ahead=days_ahead)[doctor.id]
+
+
+def get_available_slots_bulk(doctors, start_date: date, service=None, days_ahead: int = 7) -> Dict[int, Dict[str, List[Dict[str, str]]]]:
+    """
+    Получить свободные слоты сразу для нескольких врачей.
+    Дни врачей берутся из кэша слотов и инвентаря; для непокрытых дней все
+    занятые записи загружаются одним запросом и группируются в памяти, поэтому
+    количество запросов к БД не зависит от числа врачей.
+
+    Args:
+        doctors: Итерируемый набор объектов Doctor
+        start_date: Дата начала поиска
+        service: Объект Service (опционально) - влияет на длительность приема
+        days_ahead: Количество дней для поиска (по умолчанию 7)
+
+    Returns:
+        Словарь вида {doctor_id: {"2025-01-20": [{"time_start": "09:00"}, ...]}}
+    """
+    return {
+        doctor_id: {
+            day: [{'time_start': SLOT_LABELS[start]} for start in starts]
+            for day, starts in days.items()
+        }
+        for doctor_id, days in get_free_minutes_bulk(doctors, start_date, service, days_ahead).items()
     }
-    
-    # Получаем все активные записи врача на период
-    end_date = start_date + timedelta(days=days_ahead - 1)
-    
-    # Импортируем здесь, чтобы избежать циклических зависимостей
-    from appointment.models import Appointment
-    
-    # Получаем только активные записи (исключаем отменённые и завершённые)
-    busy_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        date__gte=start_date,
-        date__lte=end_date
-    ).exclude(
-        status__in=['canceled', 'rejected', 'finished', 'no_show']
-    ).values('date', 'time_start')
-    
-    # Группируем записи по датам для быстрого доступа
-    busy_by_date = {}
-    for apt in busy_appointments:
-        date_str = apt['date'].isoformat()
-        if date_str not in busy_by_date:
-            busy_by_date[date_str] = []
-        busy_by_date[date_str].append(apt['time_start'])
-    
-    # Обрабатываем каждый день
-    current_date = start_date
-    for _ in range(days_ahead):
-        date_str = current_date.isoformat()
-        weekday = weekday_map[current_date.weekday()]
-        
-        # Проверяем, работает ли врач в этот день
-        if not doctor.working_days.get(weekday, False):
-            result[date_str] = []
-            current_date += timedelta(days=1)
-            continue
-        
-        # Получаем рабочие часы
-        working_hours = doctor.working_hours.get(weekday)
-        if not working_hours or len(working_hours) < 2:
-            result[date_str] = []
-            current_date += timedelta(days=1)
-            continue
-        
-        work_start = _parse_time(working_hours[0])
-        work_end = _parse_time(working_hours[1])
-        
-        # Получаем обеденное время
-        lunch_start = None
-        lunch_end = None
-        lunch_time = doctor.lunch_time.get(weekday)
-        if lunch_time and len(lunch_time) >= 2:
-            lunch_start = _parse_time(lunch_time[0])
-            lunch_end = _parse_time(lunch_time[1])
-        
-        # Получаем занятые слоты на этот день
-        busy_slots = busy_by_date.get(date_str, [])
-        
-        # Генерируем свободные слоты
-        available = _generate_slots(
-            work_start=work_start,
-            work_end=work_end,
-            lunch_start=lunch_start,
-            lunch_end=lunch_end,
-            duration_minutes=duration_minutes,
-            busy_slots=busy_slots,
-            current_date=current_date
-        )
-        
-        result[date_str] = available
-        current_date += timedelta(days=1)
-    
+
+
+def get_free_minutes_bulk(doctors, start_date: date, service=None, days_ahead: int = 7) -> Dict[int, Dict[str, List[int]]]:
+    """
+    То же, что get_available_slots_bulk, но начала слотов — минуты от полуночи.
+    Используется для компактных форматов ответа (см. slot_formats.py).
+
+    Returns:
+        Словарь вида {doctor_id: {"2025-01-20": [540, 570, ...]}}
+    """
+    doctors = list(doctors)
+    if not doctors:
+        return {}
+
+    days = [start_date + timedelta(days=offset) for offset in range(days_ahead)]
+    keys = [
+        (doctor.id, day, get_appointment_duration(doctor, service))
+        for doctor in doctors
+        for day in days
+    ]
+
+    free_starts = _get_free_starts({doctor.id: doctor for doctor in doctors}, keys)
+
+    now = datetime.now()
+    today = now.date()
+    now_minutes = now.hour * 60 + now.minute
+
+    result = {}
+    for doctor_id, day, duration_minutes in keys:
+        starts = free_starts[(doctor_id, day, duration_minutes)]
+        if day == today:
+            # Для сегодняшнего дня пропускаем уже прошедшие слоты
+            starts = starts[bisect_left(starts, now_minutes):]
+        result.setdefault(doctor_id, {})[day.isoformat()] = starts
     return result
 
 
-def is_slot_available(doctor, appointment_date: date, time_start: time, duration_minutes: int = None) -> Tuple[bool, Optional[str]]:
+def get_earliest_free_slots(doctors, start_date: date, service=None, days_ahead: int = 7, limit: Optional[int] = None) -> List[Tuple[object, date, str]]:
+    """
+    Врачи, отсортированные по ближайшему свободному слоту, без разворачивания всех слотов.
+
+    Ближайший слот каждого дня врача берётся из денормализованного поля
+    SlotInventory.first_free (одним запросом); непокрытые инвентарём дни
+    рассчитываются через кэш слотов. Топ-K выбирается кучей (heapq).
+
+    Args:
+        doctors: Итерируемый набор объектов Doctor
+        start_date: Дата начала поиска
+        service: Объект Service (опционально) - влияет на длительность приема
+        days_ahead: Количество дней для поиска
+        limit: Сколько врачей вернуть (None — всех со свободными слотами)
+
+    Returns:
+        Список (doctor, date, "HH:MM") по возрастанию даты и времени ближайшего слота
+    """
+    doctors_by_id = {doctor.id: doctor for doctor in doctors}
+    if not doctors_by_id:
+        return []
+
+    days = [start_date + timedelta(days=offset) for offset in range(days_ahead)]
+    keys = [
+        (doctor.id, day, get_appointment_duration(doctor, service))
+        for doctor in doctors_by_id.values()
+        for day in days
+    ]
+
+    now = datetime.now()
+    today = now.date()
+    now_minutes = now.hour * 60 + now.minute
+
+    earliest_by_key = inventory.read_earliest(keys, now_minutes, today=today)
+    uncovered = [key for key in keys if key not in earliest_by_key]
+    if uncovered:
+        for key, starts in _get_free_starts(doctors_by_id, uncovered).items():
+            if key[1] == today:
+                starts = starts[bisect_left(starts, now_minutes):]
+            earliest_by_key[key] = starts[0] if starts else None
+
+    # Ближайший слот врача — первый день (по порядку), где есть свободное время
+    candidates = []
+    for doctor_id, doctor in doctors_by_id.items():
+        duration_minutes = get_appointment_duration(doctor, service)
+        for day in days:
+            start = earliest_by_key.get((doctor_id, day, duration_minutes))
+            if start is not None:
+                candidates.append((day, start, doctor_id))
+                break
+
+    if limit is not None:
+        candidates = heapq.nsmallest(limit, candidates)
+    else:
+        candidates.sort()
+    return [(doctors_by_id[doctor_id], day, SLOT_LABELS[start]) for day, start, doctor_id in candidates]
+
+
+def get_appointment_duration(doctor, service=None) -> int:
+    """Длительность приёма в минутах: из услуги, если она её задаёт, иначе у врача по умолчанию."""
+    return service.duration if service and hasattr(service, 'duration') else doctor.default_duration
+
+
+def is_slot_available(doctor, appointment_date: date, time_start: time, duration_minutes: int = None, exclude_appointment_id: int = None) -> Tuple[bool, Optional[str]]:
     """
     Проверить, доступен ли конкретный временной слот для записи.
     Используется при создании Appointment для защиты от двойного бронирования.
-    
+    Работает на той же битовой карте дня, что и get_available_slots.
+
     Args:
         doctor: Объект Doctor
         appointment_date: Дата записи
         time_start: Время начала
         duration_minutes: Длительность приёма в минутах (по умолчанию берётся из doctor.default_duration)
-    
+        exclude_appointment_id: Запись, которая не считается занятостью (переносимая)
+
     Returns:
         Tuple (is_available: bool, error_message: Optional[str])
     """
     # Определяем длительность приема
     if duration_minutes is None:
         duration_minutes = doctor.default_duration
-    # Маппинг дней недели
-    weekday_map = {
-        0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu',
-        4: 'fri', 5: 'sat', 6: 'sun'
-    }
-    
-    weekday = weekday_map[appointment_date.weekday()]
-    
+
+    schedule = get_doctor_schedule(doctor)
+
     # 1. Проверяем, работает ли врач в этот день
-    if not doctor.working_days.get(weekday, False):
-        return False, f"Врач не работает в {_get_weekday_name(weekday)}"
-    
+    if not schedule.is_working_day(appointment_date):
+        return False, f"Врач не работает в {_get_weekday_name(WEEKDAY_CODES[appointment_date.weekday()])}"
+
     # 2. Проверяем рабочие часы
-    working_hours = doctor.working_hours.get(weekday)
-    if not working_hours or len(working_hours) < 2:
+    work_day = schedule.for_date(appointment_date)
+    if work_day is None:
         return False, "Не указаны рабочие часы для этого дня"
-    
-    work_start = _parse_time(working_hours[0])
-    work_end = _parse_time(working_hours[1])
-    
-    # Вычисляем время окончания приёма
-    time_start_minutes = _time_to_minutes(time_start)
-    time_end_minutes = time_start_minutes + duration_minutes
-    time_end = _minutes_to_time(time_end_minutes)
-    
-    if time_start < work_start or time_end > work_end:
-        return False, f"Время вне рабочих часов ({working_hours[0]} - {working_hours[1]})"
-    
-    # 3. Проверяем обеденное время
-    lunch_time = doctor.lunch_time.get(weekday)
-    if lunch_time and len(lunch_time) >= 2:
-        lunch_start = _parse_time(lunch_time[0])
-        lunch_end = _parse_time(lunch_time[1])
-        
-        if _times_overlap(time_start, time_end, lunch_start, lunch_end):
-            return False, f"Время пересекается с обедом ({lunch_time[0]} - {lunch_time[1]})"
-    
-    # 4. Проверяем существующие записи (исключаем отменённые и завершённые)
-    from appointment.models import Appointment
-    
-    # Получаем все активные записи на эту дату
-    existing_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        date=appointment_date
-    ).exclude(
-        status__in=['canceled', 'rejected', 'finished', 'no_show']
-    ).values('time_start')
-    
-    # Проверяем пересечения с существующими записями
-    for apt in existing_appointments:
-        apt_start_minutes = _time_to_minutes(apt['time_start'])
-        apt_end_minutes = apt_start_minutes + duration_minutes
-        
-        # Проверяем пересечение временных интервалов
-        if time_start_minutes < apt_end_minutes and apt_start_minutes < time_end_minutes:
-            return False, "Это время уже занято"
-    
-    return True, None
 
+    # 3. Проверяем интервал приёма по рабочим часам и обеду
+    start_minutes = _time_to_minutes(time_start)
+    occupancy = build_day_occupancy(doctor, appointment_date, (), duration_minutes)
+    reason = occupancy.check(start_minutes, duration_minutes)
+    if reason == 'hours':
+        return False, f"Время вне рабочих часов ({work_day.hours_label})"
+    if reason == 'lunch':
+        return False, f"Время пересекается с обедом ({work_day.lunch_label})"
 
-def _parse_time(time_str: str) -> time:
-    """Преобразовать строку времени в объект time."""
-    return datetime.strptime(time_str, "%H:%M").time()
+    # 4. Пересечение с активными записями — одним диапазонным запросом в БД
+    if _has_overlapping_appointment(doctor, appointment_date, start_minutes, start_minutes + duration_minutes, exclude_appointment_id):
+        return False, "Это время уже занято"
 
+    return True, None
 
-def _time_to_minutes(t: time) -> int:
-    """Преобразовать time в минуты от начала дня."""
-    return t.hour * 60 + t.minute
 
+def _get_free_starts(doctors_by_id: Dict[int, object], keys: List[Tuple[int, date, int]]) -> Dict[Tuple[int, date, int], List[int]]:
+    """
+    Начала свободных слотов (без учёта текущего времени) для набора (врач, дата, длительность).
+    Сначала кэш, затем инвентарь слотов, и только для непокрытых дней — расчёт.
+    """
+    free_starts, cache_keys = availability_cache.get_many(keys)
+    missing = [key for key in keys if key not in free_starts]
+    if missing:
+        loaded = inventory.read(missing)
+        uncovered = [key for key in missing if key not in loaded]
+        if uncovered:
+            occupancies = compute_day_occupancies(doctors_by_id, uncovered)
+            inventory.write(doctors_by_id, occupancies, overwrite=False)
+            for key, occupancy in occupancies.items():
+                loaded[key] = occupancy.free_slot_starts(key[2]) if occupancy is not None else []
+        availability_cache.set_many(loaded, cache_keys)
+        free_starts.update(loaded)
+    return free_starts
 
-def _minutes_to_time(minutes: int) -> time:
-    """Преобразовать минуты от начала дня в time."""
-    return time(hour=minutes // 60, minute=minutes % 60)
 
+def compute_day_occupancies(doctors_by_id: Dict[int, object], keys: List[Tuple[int, date, int]]) -> Dict[Tuple[int, date, int], Optional[DayOccupancy]]:
+    """
+    Построить битовые карты для набора (врач, дата, длительность).
+    Занятые записи всех врачей загружаются одним запросом.
+    Для дней, когда врач не работает, значение — None.
+    """
+    busy_by_doctor = _load_busy_intervals(
+        list({doctor_id for doctor_id, _, _ in keys}),
+        min(day for _, day, _ in keys),
+        max(day for _, day, _ in keys),
+    )
 
-def _times_overlap(start1: time, end1: time, start2: time, end2: time) -> bool:
-    """Проверить, пересекаются ли два временных интервала."""
-    return start1 < end2 and start2 < end1
+    return {
+        key: build_day_occupancy(
+            doctors_by_id[key[0]], key[1], busy_by_doctor.get(key[0], {}).get(key[1], ()), key[2]
+        )
+        for key in keys
+    }
 
 
-def _generate_slots(
-    work_start: time,
-    work_end: time,
-    lunch_start: Optional[time],
-    lunch_end: Optional[time],
-    duration_minutes: int,
-    busy_slots: List[time],
-    current_date: date
-) -> List[Dict[str, str]]:
+def build_day_occupancy(doctor, day: date, busy_intervals: Iterable[Tuple[int, Optional[int]]], duration_minutes: int) -> Optional[DayOccupancy]:
     """
-    Генерировать свободные временные слоты.
-    
+    Построить битовую карту дня врача.
+    Возвращает None, если врач в этот день не работает или не указаны рабочие часы.
+
     Args:
-        work_start: Начало рабочего дня
-        work_end: Конец рабочего дня
-        lunch_start: Начало обеда (опционально)
-        lunch_end: Конец обеда (опционально)
-        duration_minutes: Длительность приема
-        busy_slots: Список занятых time_start (объекты time)
-        current_date: Текущая дата (для фильтрации прошедших слотов)
-    
+        doctor: Объект Doctor
+        day: Дата
+        busy_intervals: (начало, окончание) активных записей на эту дату в минутах
+        duration_minutes: Длительность приёма; для старых записей без окончания
+            считается, что запись занимает столько же
+    """
+    work_day = get_doctor_schedule(doctor).for_date(day)
+    if work_day is None:
+        return None
+
+    occupancy = DayOccupancy(
+        work_start=work_day.work_start,
+        work_end=work_day.work_end,
+        lunch_start=work_day.lunch_start,
+        lunch_end=work_day.lunch_end,
+    )
+    for busy_start, busy_end in busy_intervals:
+        occupancy.add_busy(busy_start, busy_end if busy_end is not None else busy_start + duration_minutes)
+    return occupancy
+
+
+def _load_busy_intervals(doctor_ids: List[int], start_date: date, end_date: date) -> Dict[int, Dict[date, List[Tuple[int, Optional[int]]]]]:
+    """
+    Загрузить одним запросом активные записи врачей за период.
+
     Returns:
-        Список свободных слотов (только time_start)
+        Словарь вида {doctor_id: {date: [(начало, окончание или None), ...]}} в минутах
     """
-    slots = []
-    
-    # Преобразуем время в минуты для удобства работы
-    current_minutes = _time_to_minutes(work_start)
-    end_minutes = _time_to_minutes(work_end)
-    
-    # Получаем текущее время
-    now = datetime.now()
-    is_today = current_date == now.date()
-    current_time_minutes = _time_to_minutes(now.time()) if is_today else 0
-    
-    # Преобразуем занятые слоты в минуты для быстрой проверки
-    busy_intervals = []
-    for busy_start in busy_slots:
-        busy_start_minutes = _time_to_minutes(busy_start)
-        busy_end_minutes = busy_start_minutes + duration_minutes
-        busy_intervals.append((busy_start_minutes, busy_end_minutes))
-    
-    while current_minutes + duration_minutes <= end_minutes:
-        slot_start = _minutes_to_time(current_minutes)
-        slot_end_minutes = current_minutes + duration_minutes
-        
-        # Пропускаем прошедшие слоты для сегодняшнего дня
-        if is_today and current_minutes < current_time_minutes:
-            current_minutes += duration_minutes
+    # Импортируем здесь, чтобы избежать циклических зависимостей
+    from appointment.models import Appointment
+
+    busy_appointments = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        date__gte=start_date,
+        date__lte=end_date
+    ).exclude(
+        status__in=Appointment.INACTIVE_STATUSES
+    ).values_list('doctor_id', 'date', 'time_start', 'time_end')
+
+    busy_by_doctor = {}
+    for doctor_id, apt_date, apt_time_start, apt_time_end in busy_appointments:
+        busy_by_doctor.setdefault(doctor_id, {}).setdefault(apt_date, []).append(
+            (_time_to_minutes(apt_time_start), _end_to_minutes(apt_time_end))
+        )
+    return busy_by_doctor
+
+
+def _has_overlapping_appointment(doctor, day: date, start: int, end: int, exclude_appointment_id: int = None) -> bool:
+    """
+    Есть ли активная запись врача, пересекающая интервал [start, end) в минутах.
+
+    Проверка выполняется в БД по индексу (doctor, date, time_start, time_end).
+    Старые записи без time_end считаются длительностью врача по умолчанию.
+    """
+    # Импортируем здесь, чтобы избежать циклических зависимостей
+    from appointment.models import Appointment
+
+    legacy_overlap = Q(time_end__isnull=True)
+    legacy_start = start - doctor.default_duration
+    if legacy_start >= 0:
+        legacy_overlap &= Q(time_start__gt=_minutes_to_time(legacy_start))
+
+    overlapping = Appointment.objects.filter(
+        doctor_id=doctor.id,
+        date=day,
+        time_start__lt=_minutes_to_time(end),
+    ).filter(
+        Q(time_end__gt=_minutes_to_time(start)) | legacy_overlap
+    ).exclude(
+        status__in=Appointment.INACTIVE_STATUSES
+    )
+    if exclude_appointment_id is not None:
+        overlapping = overlapping.exclude(pk=exclude_appointment_id)
+    return overlapping.exists()
+
+
+def _range_mask(start: int, end: int) -> int:
+    """Битовая маска минут [start, end), обрезанная границами суток."""
+    start = max(start, 0)
+    end = min(end, MINUTES_PER_DAY)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def _window_starts(mask: int, length: int) -> int:
+    """
+    Маска минут, с которых начинается непрерывное окно из length единиц.
+    Окно удваивается сдвигами, поэтому операций O(log length), а не O(length).
+    """
+    if length <= 0:
+        return mask
+    covered = 1
+    while covered * 2 <= length:
+        mask &= mask >> covered
+        covered *= 2
+    if covered < length:
+        mask &= mask >> (length - covered)
+    return mask
+
+
+@lru_cache(maxsize=1024)
+def _slot_grid(work_start: int, work_end: int, lunch_start: Optional[int], lunch_end: Optional[int], duration_minutes: int) -> int:
+    """Маска допустимых начал слотов: шаг duration от начала дня, после обеда — от его конца."""
+    grid = 0
+    if duration_minutes <= 0:
+        return grid
+    current = work_start
+    while current + duration_minutes <= work_end:
+        if lunch_start is not None and lunch_end is not None and current < lunch_end and lunch_start < current + duration_minutes:
+            # Перепрыгиваем на конец обеда, а не на один шаг
+            current = lunch_end
             continue
-        
-        # Проверяем, не попадает ли слот в обед
-        if lunch_start and lunch_end:
-            lunch_start_minutes = _time_to_minutes(lunch_start)
-            lunch_end_minutes = _time_to_minutes(lunch_end)
-            if current_minutes < lunch_end_minutes and lunch_start_minutes < slot_end_minutes:
-                # Перепрыгиваем на конец обеда, а не на один шаг
-                current_minutes = lunch_end_minutes
-                continue
-        
-        # Проверяем, не занят ли слот
-        is_busy = False
-        for busy_start_min, busy_end_min in busy_intervals:
-            if current_minutes < busy_end_min and busy_start_min < slot_end_minutes:
-                is_busy = True
-                break
-        
-        if not is_busy:
-            slots.append({
-                'time_start': slot_start.strftime('%H:%M')
-            })
-        
-        current_minutes += duration_minutes
-    
-    return slots
+        grid |= 1 << current
+        current += duration_minutes
+    return grid
+
+
+def _iter_bits(mask: int) -> List[int]:
+    """Номера установленных битов маски по возрастанию."""
+    result = []
+    while mask:
+        lowest = mask & -mask
+        result.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return result
+
+
+def _minutes_to_time(minutes: int) -> time:
+    """Минуты от начала суток -> time; конец суток (1440) -> time.max."""
+    if minutes >= MINUTES_PER_DAY:
+        return time.max
+    return time(minutes // 60, minutes % 60)
+
+
+def _end_to_minutes(t: Optional[time]) -> Optional[int]:
+    """Окончание записи в минутах; time.max (конец суток) -> 1440."""
+    if t is None:
+        return None
+    if t == time.max:
+        return MINUTES_PER_DAY
+    return _time_to_minutes(t)
+
+
+def _time_to_minutes(t: time) -> int:
+    """Преобразовать time в минуты от начала дня."""
+    return t.hour * 60 + t.minute
 
 
 def _get_weekday_name(weekday_code: str) -> str:
@@ -0,0 +1,116 @@
+"""
+Кэш свободных слотов врачей в настроенном бэкенде CACHES.
+
+Ключ записи: врач + дата + длительность приёма + версии врача и дня.
+Вместо удаления ключей инвалидация меняет версию: сохранение или удаление
+Appointment меняет версию своего дня врача, изменение Doctor — версию врача.
+Так сбрасываются только затронутые дни, а ключи всех длительностей устаревают разом.
+Версии хранятся VERSION_TIMEOUT (дольше записей — на горизонт бронирования);
+если версии нет в кэше (истекла или вытеснена), она создаётся заново текущим
+временем, а не считается нулевой — иначе могла бы ожить старая запись.
+В кэше лежат начала слотов в минутах без учёта текущего времени — прошедшие
+слоты сегодняшнего дня отсекаются при чтении.
+"""
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+
+CACHE_TIMEOUT = getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 600)
+# Версии живут дольше записей: на горизонт бронирования (SLOT_INVENTORY_HORIZON_DAYS) с запасом в день
+VERSION_TIMEOUT = max(
+    CACHE_TIMEOUT * 2,
+    (getattr(settings, 'SLOT_INVENTORY_HORIZON_DAYS', 30) + 1) * 24 * 60 * 60,
+)
+
+HITS_METRIC = 'availability_cache_hits'
+MISSES_METRIC = 'availability_cache_misses'
+metrics.register(HITS_METRIC, MISSES_METRIC)
+
+# (doctor_id, date, duration_minutes)
+SlotKey = Tuple[int, date, int]
+
+
+def _doctor_version_key(doctor_id) -> str:
+    return f"availability:ver:{doctor_id}"
+
+
+def _day_version_key(doctor_id, day: date) -> str:
+    return f"availability:ver:{doctor_id}:{day.isoformat()}"
+
+
+def get_many(keys: Iterable[SlotKey]) -> Tuple[Dict[SlotKey, List[int]], Dict[SlotKey, str]]:
+    """
+    Прочитать слоты для набора (врач, дата, длительность) за два обращения к кэшу.
+
+    Returns:
+        (найденные значения, ключи кэша для всех запрошенных записей — для последующего set_many)
+    """
+    keys = list(keys)
+    if not keys:
+        return {}, {}
+
+    version_keys = set()
+    for doctor_id, day, _ in keys:
+        version_keys.add(_doctor_version_key(doctor_id))
+        version_keys.add(_day_version_key(doctor_id, day))
+    versions = cache.get_many(list(version_keys))
+    missing = version_keys - versions.keys()
+    if missing:
+        # add, а не set: параллельный запрос мог уже создать версию — берём её
+        fresh = time.time_ns()
+        for version_key in missing:
+            cache.add(version_key, fresh, timeout=VERSION_TIMEOUT)
+        versions.update(cache.get_many(list(missing)))
+        for version_key in missing:
+            # Кэш не сохранил версию (например, DummyCache) — записи всё равно не найдутся
+            versions.setdefault(version_key, fresh)
+
+    cache_keys = {}
+    for key in keys:
+        doctor_id, day, duration = key
+        doctor_version = versions[_doctor_version_key(doctor_id)]
+        day_version = versions[_day_version_key(doctor_id, day)]
+        cache_keys[key] = f"availability:{doctor_id}:{day.isoformat()}:{duration}:{doctor_version}:{day_version}"
+
+    found = cache.get_many(list(cache_keys.values()))
+    result = {key: found[cache_key] for key, cache_key in cache_keys.items() if cache_key in found}
+
+    metrics.incr(HITS_METRIC, len(result))
+    metrics.incr(MISSES_METRIC, len(keys) - len(result))
+    return result, cache_keys
+
+
+def set_many(values: Dict[SlotKey, List[int]], cache_keys: Dict[SlotKey, str]) -> None:
+    """Сохранить рассчитанные слоты под ключами, полученными из get_many."""
+    if values:
+        cache.set_many({cache_keys[key]: slots for key, slots in values.items()}, timeout=CACHE_TIMEOUT)
+
+
+def invalidate_day(doctor_id, day: Optional[date]) -> None:
+    """Сбросить слоты одного дня врача (все длительности)."""
+    if doctor_id is None or day is None:
+        return
+    cache.set(_day_version_key(doctor_id, day), time.time_ns(), timeout=VERSION_TIMEOUT)
+
+
+def invalidate_doctor(doctor_id) -> None:
+    """Сбросить все закэшированные дни врача (изменилось расписание)."""
+    if doctor_id is None:
+        return
+    cache.set(_doctor_version_key(doctor_id), time.time_ns(), timeout=VERSION_TIMEOUT)
+
+
+def get_stats() -> Dict[str, float]:
+    """Счётчики попаданий/промахов кэша слотов."""
+    counters = metrics.get_counters([HITS_METRIC, MISSES_METRIC])
+    return {
+        'hits': counters[HITS_METRIC],
+        'misses': counters[MISSES_METRIC],
+        'hit_ratio': metrics.hit_ratio(counters[HITS_METRIC], counters[MISSES_METRIC]),
+    }
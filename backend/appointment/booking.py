@@ -0,0 +1,167 @@
+"""
+Бронирование слота врача без двойных записей.
+
+Все записи одного дня врача создаются под блокировкой (doctor_id, date):
+на PostgreSQL — транзакционная advisory-блокировка pg_advisory_xact_lock,
+на остальных СУБД — select_for_update строки нагрузки врача за этот день
+(DoctorQueueLoad, см. queue_load.lock_day). Внутри блокировки слот
+проверяется одним запросом к записям дня (is_slot_available) и сразу
+сохраняется, поэтому конкурентные запросы на один день выполняются по очереди,
+а запросы к разным врачам и дням не мешают друг другу. Перенос записи на
+другого врача, день или время (reschedule_appointment) проходит тот же путь.
+На PostgreSQL дополнительно действует exclusion-ограничение (см. constraints.py).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import IntegrityError, connection, transaction
+
+from .availability import get_appointment_duration, is_slot_available
+from .constraints import is_overlap_violation
+from .models import Appointment
+from .queue_load import lock_day
+
+
+logger = logging.getLogger(__name__)
+
+# Полосы локальных блокировок процесса: дополнительно упорядочивают потоки одного
+# процесса на СУБД без строковых блокировок (SQLite в разработке)
+_LOCAL_LOCK_STRIPES = 64
+_local_locks = [threading.Lock() for _ in range(_LOCAL_LOCK_STRIPES)]
+
+
+class SlotUnavailable(Exception):
+    """Слот нельзя забронировать: занят, вне рабочих часов или на обеде."""
+
+    def __init__(self, message: str = None):
+        self.message = message or 'Выбранный временной слот недоступен'
+        super().__init__(self.message)
+
+
+def _lock_doctor_day_in_db(doctor_id: int, day: date) -> None:
+    """Блокировка (врач, день) до конца текущей транзакции."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [doctor_id, day.toordinal()])
+    else:
+        lock_day(doctor_id, day)
+
+
+@contextmanager
+def doctor_day_lock(doctor_id: int, day: date):
+    """
+    Транзакция, в которой день врача заблокирован для других бронирований.
+
+    Блокировка держится до фиксации транзакции; при вызове внутри внешнего
+    atomic() — до фиксации внешней транзакции. Локальная блокировка процесса
+    снимается сразу после фиксации, до остальных on_commit-обработчиков
+    (обновление инвентаря, события очереди): они не задерживают следующее
+    бронирование того же дня. Во вложенном atomic() она снимается на выходе из блока.
+    """
+    stripe = _local_locks[hash((doctor_id, day)) % _LOCAL_LOCK_STRIPES]
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            stripe.release()
+
+    stripe.acquire()
+    try:
+        with transaction.atomic():
+            # Регистрируется первым, поэтому выполняется раньше обработчиков, добавленных внутри блока
+            transaction.on_commit(release)
+            _lock_doctor_day_in_db(doctor_id, day)
+            yield
+    finally:
+        release()
+
+
+def book_appointment(serializer, **save_kwargs):
+    """
+    Проверить слот и сохранить запись из провалидированного сериализатора.
+
+    Args:
+        serializer: AppointmentCreateSerializer после is_valid()
+        **save_kwargs: Дополнительные поля для serializer.save()
+
+    Returns:
+        Созданный Appointment
+
+    Raises:
+        SlotUnavailable: слот занят или не входит в расписание врача
+    """
+    data = serializer.validated_data
+    doctor = data['doctor']
+    appointment_date = data['date']
+    time_start = data['time_start']
+    duration_minutes = get_appointment_duration(doctor, data.get('service'))
+
+    with doctor_day_lock(doctor.id, appointment_date):
+        is_available, error_message = is_slot_available(
+            doctor=doctor,
+            appointment_date=appointment_date,
+            time_start=time_start,
+            duration_minutes=duration_minutes
+        )
+        if not is_available:
+            logger.debug(f"Попытка забронировать занятый слот: Врач {doctor.full_name}, Дата {appointment_date}, Время {time_start}")
+            raise SlotUnavailable(error_message)
+        return _save(serializer, **save_kwargs)
+
+
+def reschedule_appointment(serializer, **save_kwargs):
+    """
+    Сохранить изменения записи из провалидированного AppointmentUpdateSerializer.
+
+    Если запись занимает новый слот (другой врач, дата или время либо возврат
+    из неактивного статуса), слот проверяется и запись сохраняется под
+    блокировкой дня врача — как при бронировании.
+
+    Raises:
+        SlotUnavailable: новый слот занят или не входит в расписание врача
+    """
+    appointment = serializer.instance
+    data = serializer.validated_data
+    doctor = data.get('doctor', appointment.doctor)
+    appointment_date = data.get('date', appointment.date)
+    time_start = data.get('time_start', appointment.time_start)
+
+    appointment.load_origin()
+    new_status = data.get('status', appointment.status)
+    moved = (doctor.pk, appointment_date, time_start) != (appointment.doctor_id, appointment.date, appointment.time_start)
+    reactivated = appointment._origin_status in Appointment.INACTIVE_STATUSES
+    if new_status in Appointment.INACTIVE_STATUSES or not (moved or reactivated):
+        return _save(serializer, **save_kwargs)
+
+    if doctor.pk == appointment.doctor_id and appointment.duration:
+        duration_minutes = appointment.duration
+    else:
+        duration_minutes = get_appointment_duration(doctor, appointment.service)
+
+    with doctor_day_lock(doctor.id, appointment_date):
+        is_available, error_message = is_slot_available(
+            doctor=doctor,
+            appointment_date=appointment_date,
+            time_start=time_start,
+            duration_minutes=duration_minutes,
+            exclude_appointment_id=appointment.pk
+        )
+        if not is_available:
+            logger.debug(f"Попытка перенести запись {appointment.pk} на занятый слот: Врач {doctor.full_name}, Дата {appointment_date}, Время {time_start}")
+            raise SlotUnavailable(error_message)
+        return _save(serializer, **save_kwargs)
+
+
+def _save(serializer, **save_kwargs):
+    try:
+        with transaction.atomic():
+            return serializer.save(**save_kwargs)
+    except IntegrityError as e:
+        # Пересечение, которое пропустила проверка (запись изменена в обход блокировки)
+        if is_overlap_violation(e):
+            raise SlotUnavailable('Это время уже занято')
+        raise
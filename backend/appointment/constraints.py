@@ -0,0 +1,64 @@
+"""
+Ограничение на уровне БД против пересекающихся записей врача (только PostgreSQL).
+
+EXCLUDE USING gist по (doctor_id, tsrange(date + time_start, date + time_end))
+для активных записей с заполненным time_end, кроме электронной очереди —
+её талоны выдаются на текущее время и по определению идут друг за другом.
+Миграции в репозитории не хранятся, поэтому ограничение создаётся
+обработчиком post_migrate (см. signals.py) и только если его ещё нет.
+"""
+import logging
+
+from django.db import DatabaseError, connections, transaction
+
+from .models import Appointment
+
+
+logger = logging.getLogger(__name__)
+
+OVERLAP_CONSTRAINT_NAME = 'appointment_doctor_no_overlap'
+
+# SQLSTATE exclusion_violation
+_EXCLUSION_VIOLATION = '23P01'
+
+
+def ensure_overlap_constraint(using: str = 'default') -> bool:
+    """
+    Создать exclusion-ограничение, если БД — PostgreSQL и его ещё нет.
+
+    Returns:
+        True, если ограничение есть или создано
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+
+    table = Appointment._meta.db_table
+    inactive = ', '.join(f"'{status}'" for status in Appointment.INACTIVE_STATUSES)
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', [OVERLAP_CONSTRAINT_NAME])
+            if cursor.fetchone():
+                return True
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+            cursor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {OVERLAP_CONSTRAINT_NAME} '
+                f'EXCLUDE USING gist ('
+                f"doctor_id WITH =, tsrange(date + time_start, date + time_end, '[)') WITH &&"
+                f') WHERE ('
+                f'time_end IS NOT NULL AND status NOT IN ({inactive}) '
+                f"AND (source IS NULL OR source <> 'electronic_queue'))"
+            )
+    except DatabaseError as e:
+        # Например, в БД уже есть пересекающиеся записи или нет прав на CREATE EXTENSION
+        logger.warning(f"Не удалось создать ограничение {OVERLAP_CONSTRAINT_NAME}: {e}")
+        return False
+
+    logger.info(f"Создано ограничение {OVERLAP_CONSTRAINT_NAME} против пересекающихся записей")
+    return True
+
+
+def is_overlap_violation(exc: Exception) -> bool:
+    """Вызвана ли ошибка БД нарушением ограничения на пересечение записей."""
+    cause = getattr(exc, '__cause__', None)
+    return getattr(cause, 'pgcode', None) == _EXCLUSION_VIOLATION
@@ -0,0 +1,71 @@
+"""
+Номера талонов электронной очереди.
+
+Для каждой клиники, дня и буквы талона хранится последний выданный номер
+(QueueCounter). Новый номер — атомарный UPDATE last_number = last_number + 1:
+строка остаётся заблокированной до конца транзакции, номер читается в ней же,
+поэтому выдача талона не сканирует записи дня и два администратора не получат
+одинаковый талон.
+
+Строка счётчика создаётся при первом талоне дня; если на этот день уже есть
+талоны с этой буквой (выданные до появления счётчика), нумерация продолжается
+после них. Счётчики прошедших дней удаляет ночная задача обслуживания.
+"""
+import logging
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Appointment, QueueCounter
+
+
+logger = logging.getLogger(__name__)
+
+
+def coupon_prefix(doctor) -> str:
+    """Буква талона — первая буква ФИО врача (пусто, если ФИО не заполнено)."""
+    name_parts = (doctor.full_name or '').strip().split()
+    return name_parts[0][0].upper() if name_parts else ''
+
+
+def next_coupon_number(clinic_id: int, day: date, prefix: str) -> int:
+    """Следующий номер талона клиники за день по букве; уникален при параллельной выдаче."""
+    counter = QueueCounter.objects.filter(clinic_id=clinic_id, date=day, prefix=prefix)
+    with transaction.atomic():
+        # UPDATE первым запросом: строка блокируется до конца транзакции, и параллельные
+        # выдачи ждут друг друга (на SQLite — сразу берётся блокировка записи)
+        if not counter.update(last_number=F('last_number') + 1):
+            try:
+                with transaction.atomic():
+                    QueueCounter.objects.create(
+                        clinic_id=clinic_id,
+                        date=day,
+                        prefix=prefix,
+                        last_number=_issued_before_counter(clinic_id, day, prefix) + 1,
+                    )
+            except IntegrityError:
+                # Счётчик дня только что создал параллельный запрос
+                counter.update(last_number=F('last_number') + 1)
+        return counter.values_list('last_number', flat=True).get()
+
+
+def _issued_before_counter(clinic_id: int, day: date, prefix: str) -> int:
+    """Талоны дня с этой буквой, выданные до создания счётчика (один раз на клинику/день/букву)."""
+    return Appointment.objects.filter(
+        clinic_id=clinic_id,
+        date=day,
+        number_coupon__startswith=prefix,
+    ).count()
+
+
+def issue_coupon(clinic_id: int, day: date, doctor) -> str:
+    """Талон вида «А07»: буква врача и следующий номер."""
+    prefix = coupon_prefix(doctor)
+    return f"{prefix}{next_coupon_number(clinic_id, day, prefix):02d}"
+
+
+def purge_counters_before(day: date) -> int:
+    """Удалить счётчики дней раньше day. Возвращает количество удалённых строк."""
+    deleted, _ = QueueCounter.objects.filter(date__lt=day).delete()
+    return deleted
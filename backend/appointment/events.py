@@ -0,0 +1,371 @@
+"""
+Шина событий электронной очереди.
+
+Изменения записей публикуются в канал клиники Redis pub/sub
+(medbooker:queue:clinic:<id>). В каждом процессе один фоновый поток слушает
+все каналы клиник по шаблону и раздаёт события подписчикам процесса —
+SSE-потокам, которые ждут событий вместо опроса БД. Без Redis
+(QUEUE_EVENTS_REDIS_URL не задан) события доставляются только внутри процесса.
+
+Для каждой клиники процесс ведёт счётчик полученных событий (clinic_version),
+по которому SSE-потоки одной клиники переиспользуют один запрос к БД.
+
+Каждое опубликованное событие получает номер версии очереди клиники
+(поле version, INCR в Redis medbooker:queue:version:<id>). Версия растёт с
+каждым изменением и передаётся клиентам SSE вместе с дельтами. Версия,
+запись в журнал и публикация выполняются одним Lua-скриптом (_PUBLISH_SCRIPT),
+поэтому события клиники публикуются строго в порядке версий.
+
+Последние события клиники хранятся в ограниченном журнале (sorted set
+medbooker:queue:log:<id> по версии, QUEUE_EVENT_LOG_SIZE записей; без Redis —
+в памяти процесса). По нему переподключившийся SSE-клиент получает только
+пропущенные события (events_since), а не всю очередь заново.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import redis
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = getattr(settings, 'QUEUE_EVENTS_REDIS_URL', None)
+CHANNEL_PREFIX = 'medbooker:queue:clinic:'
+VERSION_PREFIX = 'medbooker:queue:version:'
+LOG_PREFIX = 'medbooker:queue:log:'
+
+# Журнал последних событий клиники для возобновления SSE после переподключения
+EVENT_LOG_SIZE = getattr(settings, 'QUEUE_EVENT_LOG_SIZE', 500)
+_EVENT_LOG_TTL = 24 * 60 * 60
+
+# Сколько событий может накопиться у медленного подписчика; при переполнении он получает resync
+_SUBSCRIBER_QUEUE_SIZE = 1000
+_RECONNECT_MAX_DELAY = 30
+
+# Атомарно: следующая версия, запись события в журнал и публикация.
+# ARGV[1] — JSON события без закрывающей скобки, заканчивается на '"version": ';
+# номер версии дописывается в скрипте. KEYS: версия, журнал; ARGV: префикс,
+# размер журнала, TTL журнала, канал клиники.
+_PUBLISH_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+local message = ARGV[1] .. version .. '}'
+redis.call('ZADD', KEYS[2], version, message)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('PUBLISH', ARGV[4], message)
+return version
+"""
+
+
+class Subscription:
+    """Подписка одного SSE-потока на события клиники."""
+
+    def __init__(self, hub, clinic_id: int):
+        self._hub = hub
+        self.clinic_id = clinic_id
+        self._queue = queue.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        self._overflow = False
+
+    def push(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._overflow = True
+
+    def wait(self, timeout: float) -> List[dict]:
+        """
+        Дождаться событий не дольше timeout секунд.
+
+        Returns:
+            Все накопившиеся события (пустой список — таймаут)
+        """
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if self._overflow:
+            self._overflow = False
+            events.append({'type': 'resync'})
+        return events
+
+    def close(self) -> None:
+        self._hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncSubscription(Subscription):
+    """
+    Подписка для async-потоков (ASGI): события передаются в цикл событий
+    через call_soon_threadsafe, ожидание не занимает поток.
+    """
+
+    def __init__(self, hub, clinic_id: int, loop: asyncio.AbstractEventLoop):
+        self._hub = hub
+        self.clinic_id = clinic_id
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        self._overflow = False
+
+    def push(self, event: dict) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Цикл событий уже закрыт — поток завершился
+            pass
+
+    def _put(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflow = True
+
+    async def wait(self, timeout: float) -> List[dict]:
+        try:
+            events = [await asyncio.wait_for(self._queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self._queue.empty():
+            events.append(self._queue.get_nowait())
+        if self._overflow:
+            self._overflow = False
+            events.append({'type': 'resync'})
+        return events
+
+
+class _Hub:
+    """Подписчики процесса и поток, слушающий Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, set] = {}
+        self._versions: Dict[int, int] = {}
+        self._queue_versions: Dict[int, int] = {}
+        self._event_logs: Dict[int, deque] = {}
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, clinic_id: int, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        if loop is not None:
+            subscription = AsyncSubscription(self, clinic_id, loop)
+        else:
+            subscription = Subscription(self, clinic_id)
+        with self._lock:
+            self._subscribers.setdefault(clinic_id, set()).add(subscription)
+            if REDIS_URL and (self._listener is None or not self._listener.is_alive()):
+                self._listener = threading.Thread(target=self._listen, name='queue_events', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.clinic_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.clinic_id]
+
+    def version(self, clinic_id: int) -> int:
+        return self._versions.get(clinic_id, 0)
+
+    def next_queue_version(self, clinic_id: int) -> int:
+        """Версия очереди без Redis — счётчик процесса."""
+        with self._lock:
+            version = self._queue_versions.get(clinic_id, 0) + 1
+            self._queue_versions[clinic_id] = version
+        return version
+
+    def queue_version(self, clinic_id: int) -> int:
+        return self._queue_versions.get(clinic_id, 0)
+
+    def log_event(self, clinic_id: int, event: dict) -> None:
+        with self._lock:
+            self._event_logs.setdefault(clinic_id, deque(maxlen=EVENT_LOG_SIZE)).append(event)
+
+    def event_log(self, clinic_id: int) -> List[dict]:
+        with self._lock:
+            return list(self._event_logs.get(clinic_id, ()))
+
+    def dispatch(self, clinic_id: int, event: dict) -> None:
+        with self._lock:
+            # Кэш очереди устаревает только от изменений записей (и resync), не от broadcast
+            if 'version' in event or event.get('type') == 'resync':
+                self._versions[clinic_id] = self._versions.get(clinic_id, 0) + 1
+            subscribers = list(self._subscribers.get(clinic_id, ()))
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def dispatch_all(self, event: dict) -> None:
+        """Событие всем подписчикам процесса (после переподключения к Redis могли быть пропуски)."""
+        with self._lock:
+            clinic_ids = set(self._subscribers) | set(self._versions)
+        for clinic_id in clinic_ids:
+            self.dispatch(clinic_id, event)
+
+    def _listen(self) -> None:
+        delay = 1
+        reconnect = False
+        while True:
+            try:
+                client = redis.Redis.from_url(REDIS_URL, health_check_interval=30)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                if reconnect:
+                    logger.info("[queue_events] Подключение к Redis восстановлено")
+                    self.dispatch_all({'type': 'resync'})
+                delay = 1
+                for message in pubsub.listen():
+                    try:
+                        channel = message['channel'].decode()
+                        clinic_id = int(channel[len(CHANNEL_PREFIX):])
+                        event = json.loads(message['data'])
+                    except (ValueError, TypeError, AttributeError) as e:
+                        logger.warning(f"[queue_events] Некорректное сообщение: {e}")
+                        continue
+                    self.dispatch(clinic_id, event)
+            except Exception as e:
+                logger.warning(f"[queue_events] Потеряно подключение к Redis: {e}. Повтор через {delay}с")
+                reconnect = True
+                time.sleep(delay)
+                delay = min(delay * 2, _RECONNECT_MAX_DELAY)
+
+
+_hub = _Hub()
+_publisher = None
+_publish_script = None
+_publisher_lock = threading.Lock()
+
+
+def _get_publisher():
+    global _publisher, _publish_script
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                client = redis.Redis.from_url(REDIS_URL, socket_timeout=2)
+                # EVALSHA с повторной загрузкой скрипта, если Redis его не знает
+                _publish_script = client.register_script(_PUBLISH_SCRIPT)
+                _publisher = client
+    return _publisher
+
+
+def publish(clinic_id: int, event: dict) -> None:
+    """
+    Опубликовать событие клиники.
+
+    Событию присваивается следующая версия очереди клиники. При недоступном
+    Redis событие доставляется хотя бы подписчикам текущего процесса.
+    """
+    if clinic_id is None:
+        return
+    event = {**event, 'clinic_id': clinic_id}
+    if REDIS_URL:
+        try:
+            _get_publisher()
+            # Версия дописывается скриптом последним полем: {..., "version": N}
+            message_prefix = json.dumps(event)[:-1] + ', "version": '
+            _publish_script(
+                keys=[f'{VERSION_PREFIX}{clinic_id}', f'{LOG_PREFIX}{clinic_id}'],
+                args=[message_prefix, EVENT_LOG_SIZE, _EVENT_LOG_TTL, f'{CHANNEL_PREFIX}{clinic_id}'],
+            )
+            return
+        except Exception as e:
+            logger.warning(f"[queue_events] Не удалось опубликовать событие в Redis: {e}")
+    event.setdefault('version', _hub.next_queue_version(clinic_id))
+    _hub.log_event(clinic_id, event)
+    _hub.dispatch(clinic_id, event)
+
+
+def broadcast(clinic_id: int, event: dict) -> None:
+    """
+    Разослать событие подписчикам клиники без версии и записи в журнал —
+    для событий, которые не меняют очередь (например, голосовой вызов).
+    """
+    if clinic_id is None:
+        return
+    event = {**event, 'clinic_id': clinic_id}
+    if REDIS_URL:
+        try:
+            _get_publisher().publish(f'{CHANNEL_PREFIX}{clinic_id}', json.dumps(event))
+            return
+        except Exception as e:
+            logger.warning(f"[queue_events] Не удалось разослать событие через Redis: {e}")
+    _hub.dispatch(clinic_id, event)
+
+
+def subscribe(clinic_id: int) -> Subscription:
+    """Подписаться на события клиники; подписку нужно закрыть (close() или with)."""
+    return _hub.subscribe(clinic_id)
+
+
+def subscribe_async(clinic_id: int) -> AsyncSubscription:
+    """Подписка для async-генераторов; вызывать из работающего цикла событий."""
+    return _hub.subscribe(clinic_id, loop=asyncio.get_running_loop())
+
+
+def queue_version(clinic_id: int) -> int:
+    """Текущая версия очереди клиники (номер последнего опубликованного события)."""
+    if REDIS_URL:
+        try:
+            return int(_get_publisher().get(f'{VERSION_PREFIX}{clinic_id}') or 0)
+        except Exception as e:
+            logger.warning(f"[queue_events] Не удалось прочитать версию очереди из Redis: {e}")
+    return _hub.queue_version(clinic_id)
+
+
+def events_since(clinic_id: int, version: int) -> Optional[List[dict]]:
+    """
+    События клиники с версией больше version — для возобновления SSE-потока.
+
+    Returns:
+        Список событий по возрастанию версии ([] — клиент ничего не пропустил)
+        или None, если журнал их уже не содержит (или версия неизвестна) —
+        тогда клиенту нужен полный снимок.
+    """
+    if REDIS_URL:
+        try:
+            log_key = f'{LOG_PREFIX}{clinic_id}'
+            pipe = _get_publisher().pipeline(transaction=False)
+            pipe.get(f'{VERSION_PREFIX}{clinic_id}')
+            pipe.zrange(log_key, 0, 0, withscores=True)
+            pipe.zrangebyscore(log_key, f'({version}', '+inf')
+            current, oldest, missed = pipe.execute()
+            current = int(current or 0)
+            oldest_version = int(oldest[0][1]) if oldest else None
+            missed = [json.loads(message) for message in missed]
+        except Exception as e:
+            logger.warning(f"[queue_events] Не удалось прочитать журнал событий из Redis: {e}")
+            return None
+    else:
+        current = _hub.queue_version(clinic_id)
+        log = _hub.event_log(clinic_id)
+        oldest_version = log[0]['version'] if log else None
+        missed = [event for event in log if event['version'] > version]
+
+    if version > current:
+        # Счётчик сброшен (например, Redis перезапущен) — версии клиента не сопоставимы
+        return None
+    if version == current:
+        return []
+    if oldest_version is None or oldest_version > version + 1:
+        return None
+    return missed
+
+
+def clinic_version(clinic_id: int) -> int:
+    """Количество событий клиники, полученных процессом."""
+    return _hub.version(clinic_id)
@@ -0,0 +1,201 @@
+"""
+Материализованный инвентарь слотов (SlotInventory).
+
+Для каждого дня врача на горизонт SLOT_INVENTORY_HORIZON_DAYS хранит свободные и
+занятые слоты при длительности приёма врача по умолчанию. Строки обновляются
+точечно при изменении записей и врачей (см. signals.py) и пересчитываются целиком
+ночной Celery-задачей. Поиск читает инвентарь одним индексным запросом, если
+нужного дня нет в кэше слотов, и считает на лету только непокрытые дни.
+"""
+import logging
+from bisect import bisect_left
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from core.models import Doctor
+
+from .models import SlotInventory
+
+
+logger = logging.getLogger(__name__)
+
+HORIZON_DAYS = getattr(settings, 'SLOT_INVENTORY_HORIZON_DAYS', 30)
+
+# (doctor_id, date, duration_minutes)
+SlotKey = Tuple[int, date, int]
+
+_UPDATE_FIELDS = ['clinic', 'duration', 'free_slots', 'taken_slots', 'free_count', 'taken_count', 'first_free', 'updated_at']
+
+
+def in_horizon(day: date, today: Optional[date] = None) -> bool:
+    """Входит ли дата в горизонт инвентаря."""
+    today = today or date.today()
+    return today <= day < today + timedelta(days=HORIZON_DAYS)
+
+
+def read(keys: Iterable[SlotKey]) -> Dict[SlotKey, List[int]]:
+    """Свободные слоты из инвентаря для набора (врач, дата, длительность) одним запросом."""
+    wanted = set(keys)
+    if not wanted:
+        return {}
+
+    rows = SlotInventory.objects.filter(
+        doctor_id__in={doctor_id for doctor_id, _, _ in wanted},
+        date__gte=min(day for _, day, _ in wanted),
+        date__lte=max(day for _, day, _ in wanted),
+    ).values_list('doctor_id', 'date', 'duration', 'free_slots')
+
+    return {
+        (doctor_id, day, duration): free_slots
+        for doctor_id, day, duration, free_slots in rows
+        if (doctor_id, day, duration) in wanted
+    }
+
+
+def read_earliest(keys: Iterable[SlotKey], now_minutes: int, today: Optional[date] = None) -> Dict[SlotKey, Optional[int]]:
+    """
+    Ближайший свободный слот (в минутах) для набора (врач, дата, длительность) без чтения списков слотов.
+
+    Для будущих дней используется денормализованное поле first_free; списки
+    free_slots читаются только для сегодняшних строк, где нужно отсечь прошедшее время.
+    Ключи без строки в инвентаре в результат не попадают; None — свободных слотов нет.
+    """
+    today = today or date.today()
+    wanted = set(keys)
+    if not wanted:
+        return {}
+
+    doctor_ids = {doctor_id for doctor_id, _, _ in wanted}
+    rows = SlotInventory.objects.filter(
+        doctor_id__in=doctor_ids,
+        date__gte=min(day for _, day, _ in wanted),
+        date__lte=max(day for _, day, _ in wanted),
+    ).values_list('doctor_id', 'date', 'duration', 'first_free', 'free_count')
+
+    result = {}
+    today_with_free = []
+    for doctor_id, day, duration, first_free, free_count in rows:
+        key = (doctor_id, day, duration)
+        if key not in wanted:
+            continue
+        if day == today and free_count and first_free < now_minutes:
+            today_with_free.append(key)
+        else:
+            result[key] = first_free
+
+    if today_with_free:
+        today_slots = dict(SlotInventory.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _, _ in today_with_free},
+            date=today,
+        ).values_list('doctor_id', 'free_slots'))
+        for key in today_with_free:
+            free_slots = today_slots.get(key[0], [])
+            position = bisect_left(free_slots, now_minutes)
+            result[key] = free_slots[position] if position < len(free_slots) else None
+    return result
+
+
+def write(doctors_by_id: Dict[int, Doctor], occupancies: Dict[SlotKey, object], overwrite: bool = True) -> int:
+    """
+    Сохранить рассчитанные дни врачей в инвентарь.
+
+    Сохраняются только дни в пределах горизонта и только для длительности врача
+    по умолчанию. При overwrite=False существующие строки не перезаписываются —
+    так расчёт на пути чтения не может затереть более свежий пересчёт после записи.
+
+    Args:
+        doctors_by_id: Врачи по id
+        occupancies: {(doctor_id, date, duration): DayOccupancy или None (врач не работает)}
+        overwrite: Обновлять ли уже существующие строки
+
+    Returns:
+        Количество сохранённых строк
+    """
+    today = date.today()
+    rows = []
+    for (doctor_id, day, duration), occupancy in occupancies.items():
+        doctor = doctors_by_id.get(doctor_id)
+        if doctor is None or duration != doctor.default_duration or not in_horizon(day, today):
+            continue
+        free_slots = occupancy.free_slot_starts(duration) if occupancy is not None else []
+        taken_slots = occupancy.taken_slot_starts(duration) if occupancy is not None else []
+        rows.append(SlotInventory(
+            doctor_id=doctor_id,
+            clinic_id=doctor.clinic_id,
+            date=day,
+            duration=duration,
+            free_slots=free_slots,
+            taken_slots=taken_slots,
+            free_count=len(free_slots),
+            taken_count=len(taken_slots),
+            first_free=free_slots[0] if free_slots else None,
+        ))
+
+    if not rows:
+        return 0
+    if overwrite:
+        SlotInventory.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['doctor', 'date'],
+            update_fields=_UPDATE_FIELDS,
+        )
+    else:
+        SlotInventory.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def refresh_days(pairs: Iterable[Tuple[int, date]]) -> int:
+    """Пересчитать отдельные дни врачей (после изменения записей)."""
+    from .availability import compute_day_occupancies
+
+    today = date.today()
+    pairs = {(doctor_id, day) for doctor_id, day in pairs if doctor_id is not None and day is not None and in_horizon(day, today)}
+    if not pairs:
+        return 0
+
+    doctors_by_id = Doctor.objects.in_bulk({doctor_id for doctor_id, _ in pairs})
+    keys = [
+        (doctor_id, day, doctors_by_id[doctor_id].default_duration)
+        for doctor_id, day in pairs
+        if doctor_id in doctors_by_id
+    ]
+    if not keys:
+        return 0
+    return write(doctors_by_id, compute_day_occupancies(doctors_by_id, keys))
+
+
+def refresh_doctors(doctors: Iterable[Doctor], start_date: Optional[date] = None) -> int:
+    """Пересчитать весь горизонт инвентаря для набора врачей."""
+    from .availability import compute_day_occupancies
+
+    start_date = start_date or date.today()
+    doctors_by_id = {doctor.id: doctor for doctor in doctors}
+    if not doctors_by_id:
+        return 0
+
+    days = [start_date + timedelta(days=offset) for offset in range(HORIZON_DAYS)]
+    keys = [(doctor.id, day, doctor.default_duration) for doctor in doctors_by_id.values() for day in days]
+    return write(doctors_by_id, compute_day_occupancies(doctors_by_id, keys))
+
+
+def refresh_all(batch_size: int = 200) -> Dict[str, int]:
+    """Полный пересчёт инвентаря активных врачей и удаление прошедших дней."""
+    today = date.today()
+    deleted, _ = SlotInventory.objects.filter(date__lt=today).delete()
+
+    doctors = Doctor.objects.filter(is_active=True, available_for_booking=True).order_by('id')
+    refreshed = 0
+    batch = []
+    for doctor in doctors.iterator(chunk_size=batch_size):
+        batch.append(doctor)
+        if len(batch) >= batch_size:
+            refreshed += refresh_doctors(batch, start_date=today)
+            batch = []
+    if batch:
+        refreshed += refresh_doctors(batch, start_date=today)
+
+    logger.info(f"[inventory] Пересчитано строк инвентаря: {refreshed}, удалено прошедших: {deleted}")
+    return {'refreshed': refreshed, 'deleted': deleted}
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from appointment.models import Appointment
+
+
+class Command(BaseCommand):
+    help = 'Заполняет duration и time_end у записей, созданных до появления этих полей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = Appointment.objects.filter(time_end__isnull=True).select_related('doctor', 'service').order_by('id')
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for appointment in batch:
+                appointment.fill_time_end()
+            # bulk_update не вызывает сигналы: слоты при этом не меняются
+            updated += Appointment.objects.bulk_update(batch, ['duration', 'time_end'])
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено записей: {updated}"))
@@ -0,0 +1,74 @@
+import random
+import timeit
+from datetime import time
+
+from django.core.management.base import BaseCommand
+
+from appointment.availability import DayOccupancy, SLOT_LABELS
+
+
+def legacy_generate_slots(work_start, work_end, lunch_start, lunch_end, duration_minutes, busy_starts):
+    """Прежний алгоритм: перебор слотов с проверкой каждого по всем занятым интервалам."""
+    slots = []
+    busy_intervals = [(start, start + duration_minutes) for start in busy_starts]
+    current = work_start
+    while current + duration_minutes <= work_end:
+        slot_start = time(hour=current // 60, minute=current % 60)
+        slot_end = current + duration_minutes
+        if lunch_start is not None and current < lunch_end and lunch_start < slot_end:
+            current = lunch_end
+            continue
+        is_busy = False
+        for busy_start, busy_end in busy_intervals:
+            if current < busy_end and busy_start < slot_end:
+                is_busy = True
+                break
+        if not is_busy:
+            slots.append({'time_start': slot_start.strftime('%H:%M')})
+        current += duration_minutes
+    return slots
+
+
+def bitmap_generate_slots(work_start, work_end, lunch_start, lunch_end, duration_minutes, busy_starts):
+    """Новый алгоритм на битовой карте дня."""
+    occupancy = DayOccupancy(work_start, work_end, lunch_start, lunch_end)
+    for start in busy_starts:
+        occupancy.add_busy(start, start + duration_minutes)
+    return [{'time_start': SLOT_LABELS[start]} for start in occupancy.free_slot_starts(duration_minutes)]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость расчёта свободных слотов: прежний цикл против битовой карты дня'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2000, help='Количество сгенерированных дней врачей')
+        parser.add_argument('--durations', default='5,10,15,30', help='Длительности приёма через запятую')
+        parser.add_argument('--density', type=float, default=0.6, help='Доля занятых слотов (0..1)')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        durations = [int(value) for value in options['durations'].split(',')]
+
+        for duration in durations:
+            days = []
+            for _ in range(options['days']):
+                # Плотное расписание: 07:00–21:00, обед 13:00–14:00
+                work_start, work_end, lunch_start, lunch_end = 7 * 60, 21 * 60, 13 * 60, 14 * 60
+                grid = list(range(work_start, work_end - duration + 1, duration))
+                busy = rng.sample(grid, int(len(grid) * options['density']))
+                days.append((work_start, work_end, lunch_start, lunch_end, duration, busy))
+
+            for day in days:
+                if legacy_generate_slots(*day) != bitmap_generate_slots(*day):
+                    self.stderr.write(self.style.ERROR(f'Результаты расходятся для длительности {duration}: {day[:5]}'))
+                    return
+
+            legacy = min(timeit.repeat(lambda: [legacy_generate_slots(*day) for day in days], number=1, repeat=options['repeat']))
+            bitmap = min(timeit.repeat(lambda: [bitmap_generate_slots(*day) for day in days], number=1, repeat=options['repeat']))
+            self.stdout.write(
+                f"duration={duration:>3} мин, дней={len(days)}: "
+                f"цикл {legacy * 1000:.1f} мс, битовая карта {bitmap * 1000:.1f} мс, "
+                f"ускорение x{legacy / bitmap:.1f}"
+            )
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест SSE-потока очереди: сколько одновременных подключений выдерживает сервер'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8001/api/appointment/clinic/queue/sse/', help='URL SSE-потока')
+        parser.add_argument('--user', required=True, help='Email администратора клиники, от имени которого открываются потоки')
+        parser.add_argument('--connections', type=int, default=500)
+        parser.add_argument('--ramp', type=int, default=100, help='Новых подключений в секунду')
+        parser.add_argument('--duration', type=int, default=60, help='Сколько секунд держать подключения')
+        parser.add_argument('--pid', type=int, help='PID процесса сервера — выводить его RSS')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Поддерживается только http://')
+
+        self.cookie = f"access={AccessToken.for_user(user)}"
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.path = url.path + (f'?{url.query}' if url.query else '')
+        self.stats = {'active': 0, 'peak': 0, 'connected': 0, 'failed': 0, 'closed': 0, 'events': 0, 'keepalive': 0}
+        self.errors = {}
+
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        started = time.monotonic()
+        deadline = started + options['duration']
+        tasks = []
+        reporter = asyncio.create_task(self._report(started, options.get('pid')))
+
+        for index in range(options['connections']):
+            tasks.append(asyncio.create_task(self._stream(deadline)))
+            if (index + 1) % options['ramp'] == 0:
+                await asyncio.sleep(1)
+
+        await asyncio.gather(*tasks)
+        reporter.cancel()
+        self._print_line(time.monotonic() - started, options.get('pid'))
+
+        connected = self.stats['connected']
+        style = self.style.SUCCESS if connected == options['connections'] else self.style.WARNING
+        self.stdout.write(style(
+            f"Подключено {connected} из {options['connections']} (одновременно до {self.stats['peak']}), ошибок {self.stats['failed']}, "
+            f"оборвано сервером {self.stats['closed']}"
+        ))
+        for error, count in sorted(self.errors.items(), key=lambda item: -item[1])[:5]:
+            self.stdout.write(f"  {count} × {error}")
+
+    async def _stream(self, deadline):
+        writer = None
+        counted = False
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.write(
+                f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\nCookie: {self.cookie}\r\n"
+                f"Accept: text/event-stream\r\n\r\n".encode()
+            )
+            await writer.drain()
+
+            status_line = await asyncio.wait_for(reader.readline(), timeout=30)
+            if b' 200 ' not in status_line:
+                raise ConnectionError(status_line.decode(errors='replace').strip() or 'пустой ответ')
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    line = await asyncio.wait_for(reader.readline(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    self.stats['closed'] += 1
+                    break
+                if line.startswith(b'data:'):
+                    self.stats['events'] += 1
+                    if not counted and b'"connected"' in line:
+                        counted = True
+                        self.stats['connected'] += 1
+                        self.stats['active'] += 1
+                        self.stats['peak'] = max(self.stats['peak'], self.stats['active'])
+                elif line.startswith(b': keep-alive'):
+                    self.stats['keepalive'] += 1
+        except Exception as exc:
+            self.stats['failed'] += 1
+            error = f"{type(exc).__name__}: {exc}"[:120]
+            self.errors[error] = self.errors.get(error, 0) + 1
+        finally:
+            if counted:
+                self.stats['active'] -= 1
+            if writer is not None:
+                writer.close()
+
+    async def _report(self, started, pid):
+        while True:
+            await asyncio.sleep(5)
+            self._print_line(time.monotonic() - started, pid)
+
+    def _print_line(self, elapsed, pid):
+        rss = f", RSS сервера {self._rss_mb(pid):.0f} МБ" if pid else ''
+        self.stdout.write(
+            f"[{elapsed:5.0f}с] открыто {self.stats['active']}, подключено всего {self.stats['connected']}, ошибок {self.stats['failed']}, "
+            f"событий {self.stats['events']}, keep-alive {self.stats['keepalive']}{rss}"
+        )
+
+    @staticmethod
+    def _rss_mb(pid):
+        try:
+            with open(f'/proc/{pid}/status') as status_file:
+                for line in status_file:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
@@ -0,0 +1,131 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from core.models import Doctor
+from appointment.availability import get_appointment_duration, get_free_minutes_bulk
+from appointment.booking import SlotUnavailable, book_appointment
+from appointment.models import Appointment
+from appointment.schedule import get_doctor_schedule
+from appointment.serializers import AppointmentCreateSerializer
+
+
+STRESS_COMMENT = 'stress_booking'
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест бронирования: параллельные попытки записи на один день врача, проверка отсутствия двойных записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, required=True, help='ID врача')
+        parser.add_argument('--date', help='Дата YYYY-MM-DD (по умолчанию — ближайший рабочий день со свободными слотами)')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=50, help='Попыток записи на поток')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные тестовые записи')
+
+    def handle(self, *args, **options):
+        try:
+            doctor = Doctor.objects.select_related('clinic').get(pk=options['doctor'])
+        except Doctor.DoesNotExist:
+            raise CommandError(f"Врач {options['doctor']} не найден")
+
+        day = self._resolve_date(doctor, options['date'])
+        duration = get_appointment_duration(doctor)
+        free = get_free_minutes_bulk([doctor], day, days_ahead=1)[doctor.id][day.isoformat()]
+        if not free:
+            raise CommandError(f"У врача нет свободных слотов на {day}")
+
+        self.stdout.write(
+            f"Врач {doctor.id}, {day}: свободных слотов {len(free)}, длительность {duration} мин, "
+            f"потоков {options['threads']} × {options['attempts']} попыток ({connection.vendor})"
+        )
+
+        counters = {'booked': 0, 'conflicts': 0, 'errors': 0}
+        counters_lock = threading.Lock()
+        start_barrier = threading.Barrier(options['threads'])
+
+        def worker(index):
+            rng = random.Random(options['seed'] + index)
+            try:
+                start_barrier.wait()
+                for _ in range(options['attempts']):
+                    minute = rng.choice(free)
+                    serializer = AppointmentCreateSerializer(data={
+                        'patient_full_name': f'Stress {index}',
+                        'patient_phone': '+992000000000',
+                        'clinic': doctor.clinic_id,
+                        'doctor': doctor.id,
+                        'date': day.isoformat(),
+                        'time_start': f'{minute // 60:02d}:{minute % 60:02d}',
+                        'comment': STRESS_COMMENT,
+                        'source': STRESS_COMMENT,
+                    })
+                    outcome = 'errors'
+                    try:
+                        if serializer.is_valid():
+                            book_appointment(serializer, created_by='patient', status='pending')
+                            outcome = 'booked'
+                    except SlotUnavailable:
+                        outcome = 'conflicts'
+                    except Exception as exc:
+                        self.stderr.write(f"[поток {index}] {exc}")
+                    with counters_lock:
+                        counters[outcome] += 1
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        attempts = sum(counters.values())
+        overlaps = self._find_overlaps(doctor, day, duration)
+        self.stdout.write(
+            f"Попыток {attempts} за {elapsed:.2f} с ({attempts / elapsed:.0f}/с): "
+            f"записано {counters['booked']}, отказов {counters['conflicts']}, ошибок {counters['errors']}"
+        )
+        if counters['booked'] > len(free):
+            self.stdout.write(self.style.ERROR(f"Записей больше, чем свободных слотов ({len(free)})"))
+
+        if not options['keep']:
+            deleted, _ = Appointment.objects.filter(doctor=doctor, date=day, comment=STRESS_COMMENT).delete()
+            self.stdout.write(f"Удалено тестовых записей: {deleted}")
+
+        if overlaps:
+            raise CommandError(f"Обнаружены двойные записи: {overlaps}")
+        self.stdout.write(self.style.SUCCESS('Двойных записей нет'))
+
+    def _resolve_date(self, doctor, value):
+        if value:
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                raise CommandError('Неверный формат даты. Используйте YYYY-MM-DD')
+
+        schedule = get_doctor_schedule(doctor)
+        day = date.today() + timedelta(days=1)
+        for _ in range(14):
+            if schedule.is_working_day(day):
+                return day
+            day += timedelta(days=1)
+        raise CommandError('Врач не работает ближайшие две недели')
+
+    def _find_overlaps(self, doctor, day, duration):
+        """Пары пересекающихся активных записей дня врача."""
+        intervals = sorted(
+            (start.hour * 60 + start.minute, end.hour * 60 + end.minute if end else start.hour * 60 + start.minute + duration)
+            for start, end in Appointment.objects.filter(doctor=doctor, date=day)
+            .exclude(status__in=Appointment.INACTIVE_STATUSES)
+            .values_list('time_start', 'time_end')
+        )
+        return [(a, b) for a, b in zip(intervals, intervals[1:]) if b[0] < a[1]]
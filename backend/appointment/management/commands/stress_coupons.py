@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from core.models import Doctor
+from appointment.coupons import coupon_prefix, issue_coupon
+from appointment.models import QueueCounter
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест выдачи талонов: параллельная выдача по одной букве, проверка уникальности номеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, required=True, help='ID врача (буква талона и клиника)')
+        parser.add_argument('--date', help='Дата YYYY-MM-DD (по умолчанию — через год, чтобы не задеть настоящую очередь)')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--coupons', type=int, default=50, help='Талонов на поток')
+        parser.add_argument('--keep', action='store_true', help='Не удалять счётчик тестового дня')
+
+    def handle(self, *args, **options):
+        try:
+            doctor = Doctor.objects.get(pk=options['doctor'])
+        except Doctor.DoesNotExist:
+            raise CommandError(f"Врач {options['doctor']} не найден")
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else date.today() + timedelta(days=365)
+        except ValueError:
+            raise CommandError('Неверный формат даты. Используйте YYYY-MM-DD')
+
+        self.stdout.write(
+            f"Клиника {doctor.clinic_id}, {day}, буква «{coupon_prefix(doctor)}»: "
+            f"потоков {options['threads']} × {options['coupons']} талонов ({connection.vendor})"
+        )
+
+        issued = []
+        issued_lock = threading.Lock()
+        errors = []
+        start_barrier = threading.Barrier(options['threads'])
+
+        def worker(index):
+            try:
+                start_barrier.wait()
+                for _ in range(options['coupons']):
+                    try:
+                        coupon = issue_coupon(doctor.clinic_id, day, doctor)
+                    except Exception as exc:
+                        errors.append(exc)
+                        self.stderr.write(f"[поток {index}] {exc}")
+                        continue
+                    with issued_lock:
+                        issued.append(coupon)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        duplicates = {coupon: count for coupon, count in Counter(issued).items() if count > 1}
+        self.stdout.write(
+            f"Выдано {len(issued)} талонов за {elapsed:.2f} с ({len(issued) / elapsed:.0f}/с), ошибок {len(errors)}"
+        )
+
+        if not options['keep']:
+            QueueCounter.objects.filter(clinic_id=doctor.clinic_id, date=day).delete()
+
+        if duplicates:
+            raise CommandError(f"Обнаружены повторяющиеся талоны: {duplicates}")
+        self.stdout.write(self.style.SUCCESS('Повторяющихся талонов нет'))
@@ -1,4 +1,7 @@
+from datetime import time
+
 from django.db import models
+from django.utils import timezone
 from core.models import Clinic, Doctor, Service
 
 
@@ -21,6 +24,8 @@ class Appointment(models.Model):
 
     date = models.DateField(db_index=True)
     time_start = models.TimeField()
+    duration = models.PositiveIntegerField(null=True, blank=True, help_text="Длительность приёма в минутах на момент записи")
+    time_end = models.TimeField(null=True, blank=True, help_text="Окончание приёма (не позже конца суток), заполняется при сохранении")
 
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     number_coupon = models.CharField(max_length=20, blank=True, null=True)
@@ -39,10 +44,77 @@ class Appointment(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    invited_at = models.DateTimeField(null=True, blank=True, help_text="Когда пациента пригласили в кабинет (последний вызов)")
+    finished_at = models.DateTimeField(null=True, blank=True, help_text="Когда приём завершён")
+
+    # Статусы, в которых запись не занимает время врача
+    INACTIVE_STATUSES = ('canceled', 'rejected', 'finished', 'no_show')
+
+    # Допустимые переходы статуса. Из завершающих статусов можно только вернуть
+    # запись в очередь (ошибочное нажатие администратора), а finished — снова в invited
+    ALLOWED_TRANSITIONS = {
+        'pending': {'confirmed', 'urgent', 'invited', 'canceled', 'rejected', 'no_show'},
+        'confirmed': {'pending', 'urgent', 'invited', 'canceled', 'rejected', 'no_show'},
+        'urgent': {'confirmed', 'invited', 'finished', 'canceled', 'rejected', 'no_show'},
+        'invited': {'confirmed', 'urgent', 'finished', 'canceled', 'rejected', 'no_show'},
+        'finished': {'invited'},
+        'canceled': {'pending', 'confirmed'},
+        'rejected': {'pending', 'confirmed'},
+        'no_show': {'confirmed', 'invited'},
+    }
 
     def __str__(self):
         return f"Запись {self.patient_full_name} → {self.doctor} ({self.date} {self.time_start})"
 
+    def save(self, *args, **kwargs):
+        self.load_origin()
+        self.fill_time_end()
+        self.fill_status_timestamps()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'doctor', 'service', 'time_start', 'duration'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'duration', 'time_end'}
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'invited_at', 'finished_at'}
+        super().save(*args, **kwargs)
+
+    def load_origin(self):
+        """Дочитать из БД исходных врача, дату и статус, если при загрузке поля были отложены (defer/only)."""
+        # _origin и _origin_status запоминаются сигналом post_init (signals.py); None — поле не загружалось
+        if self._state.adding or self.pk is None or (None not in self._origin and self._origin_status is not None):
+            return
+        origin = type(self)._base_manager.filter(pk=self.pk).values_list('doctor_id', 'date', 'status').first()
+        if origin is not None:
+            self._origin = origin[:2]
+            self._origin_status = origin[2]
+
+    def can_change_status(self, new_status) -> bool:
+        """Допустим ли переход из текущего сохранённого статуса в new_status."""
+        self.load_origin()
+        current = self._origin_status if self._origin_status is not None else self.status
+        return new_status == current or new_status in self.ALLOWED_TRANSITIONS.get(current, ())
+
+    def fill_status_timestamps(self):
+        """Отметить время приглашения и завершения приёма при смене статуса."""
+        # _origin_status — статус из БД, запоминается сигналом post_init (signals.py)
+        if not self._state.adding and self.status == self._origin_status:
+            return
+        if self.status == self.Status.INVITED:
+            self.invited_at = timezone.now()
+            self.finished_at = None
+        elif self.status == self.Status.FINISHED:
+            self.finished_at = timezone.now()
+
+    def fill_time_end(self):
+        """Зафиксировать длительность приёма и вычислить время окончания."""
+        if self.duration is None and self.doctor_id is not None:
+            # Импортируем здесь, чтобы избежать циклических зависимостей
+            from .availability import get_appointment_duration
+            self.duration = get_appointment_duration(self.doctor, self.service)
+        if self.time_start is None or not self.duration:
+            return
+        end = self.time_start.hour * 60 + self.time_start.minute + self.duration
+        self.time_end = time.max if end >= 24 * 60 else time(end // 60, end % 60)
+
     class Meta:
         verbose_name = "Запись"
         verbose_name_plural = "Записи"
@@ -53,7 +125,95 @@ class Appointment(models.Model):
             models.Index(fields=['date', 'status']),
             models.Index(fields=['clinic', 'date']),
             models.Index(fields=['doctor', 'date']), 
+            models.Index(fields=['doctor', 'date', 'time_start', 'time_end']),
             models.Index(fields=['-created_at']), 
             models.Index(fields=['clinic', 'status', 'date']), 
         ]
 
+
+class SlotInventory(models.Model):
+    """Материализованные слоты дня врача (на горизонт SLOT_INVENTORY_HORIZON_DAYS дней вперёд)"""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slot_inventory')
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='slot_inventory')
+    date = models.DateField()
+    duration = models.PositiveIntegerField(help_text="Длительность приёма, для которой рассчитаны слоты (минуты)")
+
+    free_slots = models.JSONField(default=list, help_text="Начала свободных слотов в минутах от начала дня")
+    taken_slots = models.JSONField(default=list, help_text="Начала занятых слотов в минутах от начала дня")
+    free_count = models.PositiveIntegerField(default=0)
+    taken_count = models.PositiveIntegerField(default=0)
+    first_free = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Начало первого свободного слота (минуты), для поиска ближайшего приёма")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Слоты {self.doctor} на {self.date}: свободно {self.free_count}"
+
+    class Meta:
+        verbose_name = "Слоты врача на день"
+        verbose_name_plural = "Слоты врачей"
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date'], name='unique_slot_inventory_doctor_date'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'free_count']),
+            models.Index(fields=['doctor', 'date', 'first_free']),
+            models.Index(fields=['clinic', 'date']),
+        ]
+
+
+class QueueCounter(models.Model):
+    """Последний выданный номер талона электронной очереди клиники за день (по букве талона)"""
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='queue_counters')
+    date = models.DateField()
+    prefix = models.CharField(max_length=5, blank=True, help_text="Буква талона (первая буква ФИО врача)")
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Талоны {self.prefix or '-'} {self.clinic} на {self.date}: {self.last_number}"
+
+    class Meta:
+        verbose_name = "Счётчик талонов"
+        verbose_name_plural = "Счётчики талонов"
+        constraints = [
+            models.UniqueConstraint(fields=['clinic', 'date', 'prefix'], name='unique_queue_counter_clinic_date_prefix'),
+        ]
+
+
+class DoctorQueueLoad(models.Model):
+    """Текущая нагрузка врача за день: активные записи (ожидают, подтверждены, приглашены)"""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='queue_loads')
+    date = models.DateField()
+    active_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Нагрузка {self.doctor} на {self.date}: {self.active_count}"
+
+    class Meta:
+        verbose_name = "Нагрузка врача"
+        verbose_name_plural = "Нагрузка врачей"
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date'], name='unique_doctor_queue_load_doctor_date'),
+        ]
+
+
+class AppointmentStatusEvent(models.Model):
+    """Переход статуса записи (журнал только на добавление)"""
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='status_events')
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='appointment_status_events')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='appointment_status_events')
+    from_status = models.CharField(max_length=20, blank=True, help_text="Пусто — запись создана")
+    to_status = models.CharField(max_length=20)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.appointment_id}: {self.from_status or '—'} → {self.to_status} ({self.created_at})"
+
+    class Meta:
+        verbose_name = "Смена статуса записи"
+        verbose_name_plural = "Смены статусов записей"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['clinic', 'created_at']),
+            models.Index(fields=['appointment', 'created_at']),
+        ]
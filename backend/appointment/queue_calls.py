@@ -0,0 +1,80 @@
+"""
+Вызов следующего пациента электронной очереди — общий для веба и Telegram-бота.
+
+call_next выбирает и приглашает пациента в одной транзакции:
+- день врача блокируется той же блокировкой, что и бронирование
+  (booking.doctor_day_lock), поэтому два одновременных нажатия «Следующий»
+  у одного врача выполняются по очереди;
+- кандидат выбирается SELECT ... FOR UPDATE SKIP LOCKED: запись, которую
+  сейчас меняет другая транзакция (например, администратор в вебе), не
+  ждётся, а пропускается;
+- порядок: срочные первыми, затем по времени начала;
+- если пациент этого врача приглашён меньше CALL_NEXT_DEBOUNCE секунд назад,
+  повторное нажатие возвращает его же, а не приглашает следующего.
+
+Статус меняется через save(), поэтому событие очереди, голосовой вызов и
+счётчики нагрузки обновляются сигналами записи при фиксации транзакции.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from .booking import doctor_day_lock
+from .models import Appointment
+
+
+logger = logging.getLogger(__name__)
+
+# Повторный вызов за это время считается двойным нажатием (секунды)
+CALL_NEXT_DEBOUNCE = 3
+
+# Пациенты, которых можно вызвать
+CALLABLE_STATUSES = (Appointment.Status.URGENT, Appointment.Status.CONFIRMED, Appointment.Status.PENDING)
+
+
+def call_next(doctor, day: date = None) -> Tuple[Optional[Appointment], bool]:
+    """
+    Пригласить следующего пациента врача за день.
+
+    Returns:
+        (запись, приглашён_сейчас): (None, False) — ожидающих нет;
+        (запись, False) — повторное нажатие, запись приглашена только что
+    """
+    day = day or date.today()
+    with doctor_day_lock(doctor.id, day):
+        just_invited = (
+            Appointment.objects.filter(
+                doctor_id=doctor.id,
+                date=day,
+                status=Appointment.Status.INVITED,
+                invited_at__gte=timezone.now() - timedelta(seconds=CALL_NEXT_DEBOUNCE),
+            )
+            .order_by('-invited_at')
+            .first()
+        )
+        if just_invited:
+            logger.info(f"[CALL_NEXT] Повторный вызов у врача {doctor.id}: пациент {just_invited.pk} уже приглашён")
+            return just_invited, False
+
+        appointment = (
+            Appointment.objects.select_for_update(skip_locked=True)
+            .filter(doctor_id=doctor.id, date=day, status__in=CALLABLE_STATUSES)
+            .annotate(call_order=Case(
+                When(status=Appointment.Status.URGENT, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ))
+            .order_by('call_order', 'time_start', 'pk')
+            .first()
+        )
+        if appointment is None:
+            return None, False
+
+        # Через save(), а не queryset.update: сигналы публикуют событие очереди и запускают голосовой вызов
+        appointment.status = Appointment.Status.INVITED
+        appointment.save(update_fields=['status', 'updated_at'])
+    logger.info(f"[CALL_NEXT] Врач {doctor.id} пригласил пациента {appointment.pk} (талон {appointment.number_coupon or '-'})")
+    return appointment, True
@@ -0,0 +1,139 @@
+"""
+Нагрузка врачей электронной очереди и выбор врача при записи по услуге.
+
+Для каждого врача и дня хранится число активных записей (DoctorQueueLoad):
+ожидают, подтверждены, приглашены. Счётчик меняется в сигнале сохранения и
+удаления записи (signals.py) в той же транзакции — F()-обновлением на ±1 при
+создании, смене статуса, переносе на другой день или к другому врачу. Поэтому
+выбор врача читает готовые числа одним запросом, а не считает записи дня.
+
+Строка создаётся при первом изменении дня пересчётом записей, так что
+счётчики, появившиеся посреди дня, сразу верны. Массовые queryset.update()
+сигналов не вызывают — после них нужен recount. Строки прошедших дней удаляет
+ночная задача обслуживания.
+
+Политика выбора — QUEUE_ASSIGNMENT_POLICY:
+    least_busy — врач с наименьшим числом активных записей;
+    shortest_wait — врач с наименьшим ожидаемым временем ожидания
+                    (активные записи × длительность приёма врача).
+"""
+import logging
+from datetime import date
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.models import Doctor
+
+from .models import Appointment, DoctorQueueLoad
+
+
+logger = logging.getLogger(__name__)
+
+# Записи, которые занимают врача (как в прежнем подсчёте при выборе врача)
+LOAD_STATUSES = (Appointment.Status.PENDING, Appointment.Status.INVITED, Appointment.Status.CONFIRMED)
+
+POLICY_LEAST_BUSY = 'least_busy'
+POLICY_SHORTEST_WAIT = 'shortest_wait'
+ASSIGNMENT_POLICY = getattr(settings, 'QUEUE_ASSIGNMENT_POLICY', POLICY_LEAST_BUSY)
+
+
+def load_key(doctor_id, day, status) -> Optional[Tuple[int, date]]:
+    """Ключ счётчика, который занимает запись, или None, если запись не нагружает врача."""
+    if doctor_id is None or day is None or status not in LOAD_STATUSES:
+        return None
+    return doctor_id, day
+
+
+def apply_change(old_key: Optional[Tuple[int, date]], new_key: Optional[Tuple[int, date]]) -> None:
+    """Перенести единицу нагрузки со старого ключа на новый (внутри транзакции сохранения записи)."""
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        _add(old_key, -1)
+    if new_key is not None:
+        _add(new_key, 1)
+
+
+def _add(key: Tuple[int, date], delta: int) -> None:
+    doctor_id, day = key
+    rows = DoctorQueueLoad.objects.filter(doctor_id=doctor_id, date=day)
+    if rows.update(active_count=F('active_count') + delta) or delta < 0:
+        # Без строки уменьшать нечего: её создаст пересчётом следующее увеличение
+        return
+    try:
+        with transaction.atomic():
+            # Строки ещё нет: пересчёт уже учитывает сохраняемую запись
+            DoctorQueueLoad.objects.create(doctor_id=doctor_id, date=day, active_count=_count(doctor_id, day))
+    except IntegrityError:
+        # Параллельная транзакция создала строку, не видя нашей незафиксированной записи
+        rows.update(active_count=F('active_count') + delta)
+
+
+def _count(doctor_id: int, day: date) -> int:
+    return Appointment.objects.filter(doctor_id=doctor_id, date=day, status__in=LOAD_STATUSES).count()
+
+
+def recount(doctor_id: int, day: date) -> int:
+    """Пересчитать нагрузку врача за день по записям (после массовых изменений в обход сигналов)."""
+    active_count = _count(doctor_id, day)
+    DoctorQueueLoad.objects.update_or_create(doctor_id=doctor_id, date=day, defaults={'active_count': active_count})
+    return active_count
+
+
+def lock_day(doctor_id: int, day: date) -> None:
+    """
+    Заблокировать строку нагрузки врача за день до конца транзакции.
+
+    Блокировка — пустым UPDATE строки: на SQLite он сразу берёт блокировку записи
+    (SELECT ... FOR UPDATE там не поддерживается, а чтение не повышается до записи
+    при параллельных транзакциях). Нет строки — создаётся пересчётом, как при первом
+    изменении дня. Служит блокировкой дня врача при бронировании на СУБД без
+    advisory-блокировок.
+    """
+    rows = DoctorQueueLoad.objects.filter(doctor_id=doctor_id, date=day)
+    if rows.update(active_count=F('active_count')):
+        return
+    try:
+        with transaction.atomic():
+            DoctorQueueLoad.objects.create(doctor_id=doctor_id, date=day, active_count=_count(doctor_id, day))
+    except IntegrityError:
+        # Строку создала параллельная транзакция — ждём её блокировку
+        rows.update(active_count=F('active_count'))
+
+
+def doctor_load(doctor_id: int, day: date) -> int:
+    """Активных записей врача за день."""
+    return DoctorQueueLoad.objects.filter(doctor_id=doctor_id, date=day).values_list('active_count', flat=True).first() or 0
+
+
+def pick_doctor(clinic, service, day: date, policy: str = None) -> Optional[Doctor]:
+    """
+    Врач клиники для записи по услуге согласно политике — одним запросом.
+
+    У выбранного врача заполнен атрибут queue_load (активные записи за день).
+    """
+    policy = policy or ASSIGNMENT_POLICY
+    load = DoctorQueueLoad.objects.filter(doctor=OuterRef('pk'), date=day).values('active_count')[:1]
+    doctors = Doctor.objects.filter(
+        clinic=clinic,
+        services=service,
+        is_active=True,
+    ).annotate(queue_load=Coalesce(Subquery(load), Value(0)))
+
+    if policy == POLICY_SHORTEST_WAIT:
+        doctors = doctors.annotate(expected_wait=F('queue_load') * F('default_duration')).order_by('expected_wait', 'queue_load', 'pk')
+    else:
+        if policy != POLICY_LEAST_BUSY:
+            logger.warning(f"Неизвестная политика выбора врача {policy}, используем {POLICY_LEAST_BUSY}")
+        doctors = doctors.order_by('queue_load', 'pk')
+    return doctors.first()
+
+
+def purge_before(day: date) -> int:
+    """Удалить нагрузку дней раньше day. Возвращает количество удалённых строк."""
+    deleted, _ = DoctorQueueLoad.objects.filter(date__lt=day).delete()
+    return deleted
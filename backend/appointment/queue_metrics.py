@@ -0,0 +1,84 @@
+"""
+Показатели электронной очереди клиники за день по врачам.
+
+Считаются агрегатами в БД по отметкам времени записи (invited_at, finished_at):
+    waiting / in_service / finished — пациентов ждёт, на приёме, принято;
+    avg_wait_seconds — от постановки в электронную очередь (created_at) до
+                       приглашения; записи онлайн созданы заранее, поэтому в
+                       среднее ожидание входят только записи электронной очереди;
+    avg_service_seconds — от приглашения до завершения приёма;
+    throughput_per_hour — завершённых приёмов за последний час.
+
+Результат кэшируется на METRICS_CACHE_TTL секунд: экран администратора
+опрашивает показатели часто, а точность до секунд им не нужна.
+"""
+from datetime import date, timedelta
+from typing import Optional
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from .models import Appointment
+
+
+METRICS_CACHE_TTL = 5
+
+_WAITING_STATUSES = (Appointment.Status.PENDING, Appointment.Status.CONFIRMED, Appointment.Status.URGENT)
+
+
+def _seconds(duration: Optional[timedelta]) -> Optional[int]:
+    return round(duration.total_seconds()) if duration is not None else None
+
+
+def metrics_cache_key(clinic_id: int, day: date) -> str:
+    return f"queue_metrics:{clinic_id}:{day.isoformat()}"
+
+
+def clinic_queue_metrics(clinic_id: int, day: date) -> dict:
+    """Показатели очереди клиники за день: итог и по каждому врачу."""
+    key = metrics_cache_key(clinic_id, day)
+    result = cache.get(key)
+    if result is None:
+        result = _compute(clinic_id, day)
+        cache.set(key, result, METRICS_CACHE_TTL)
+    return result
+
+
+def _compute(clinic_id: int, day: date) -> dict:
+    hour_ago = timezone.now() - timedelta(hours=1)
+    wait = ExpressionWrapper(F('invited_at') - F('created_at'), output_field=DurationField())
+    service = ExpressionWrapper(F('finished_at') - F('invited_at'), output_field=DurationField())
+    aggregates = {
+        'waiting': Count('id', filter=Q(status__in=_WAITING_STATUSES)),
+        'in_service': Count('id', filter=Q(status=Appointment.Status.INVITED)),
+        'finished': Count('id', filter=Q(status=Appointment.Status.FINISHED)),
+        'finished_last_hour': Count('id', filter=Q(status=Appointment.Status.FINISHED, finished_at__gte=hour_ago)),
+        'avg_wait': Avg(wait, filter=Q(source='electronic_queue', invited_at__isnull=False)),
+        'avg_service': Avg(service, filter=Q(
+            status=Appointment.Status.FINISHED, invited_at__isnull=False, finished_at__isnull=False,
+        )),
+    }
+    appointments = Appointment.objects.filter(clinic_id=clinic_id, date=day)
+
+    def row(values: dict) -> dict:
+        return {
+            'waiting': values['waiting'],
+            'in_service': values['in_service'],
+            'finished': values['finished'],
+            'avg_wait_seconds': _seconds(values['avg_wait']),
+            'avg_service_seconds': _seconds(values['avg_service']),
+            'throughput_per_hour': values['finished_last_hour'],
+        }
+
+    doctors = [
+        {'doctor_id': values['doctor_id'], 'doctor_name': values['doctor__full_name'], **row(values)}
+        for values in appointments.values('doctor_id', 'doctor__full_name').annotate(**aggregates).order_by('doctor__full_name')
+    ]
+    return {
+        'clinic_id': clinic_id,
+        'date': day.isoformat(),
+        'generated_at': timezone.now().isoformat(),
+        'total': row(appointments.aggregate(**aggregates)),
+        'doctors': doctors,
+    }
@@ -0,0 +1,156 @@
+"""
+Общий снимок электронной очереди клиники для SSE-потоков.
+
+Очередь клиники на день выбирается и сериализуется один раз на каждое
+изменение (версия событий клиники в процессе), а все подписчики клиники
+отправляют одни и те же заранее закодированные байты: стоимость
+сериализации пропорциональна числу клиник, а не числу открытых экранов.
+
+Кадры initial и delta несут SSE id вида "<дата>:<версия>" (frame_id), по
+которому переподключившийся клиент получает только пропущенные изменения.
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import events
+from .models import Appointment
+from .serializers import AppointmentSerializer
+
+
+# Сколько разных дельт помнит один снимок (потоки, разбуженные одним событием, получают одну и ту же)
+_DELTA_CACHE_SIZE = 32
+
+
+def sse_payload(message: str, event_id: Optional[str] = None) -> bytes:
+    """Кадр SSE с одним сообщением data (и id, если задан)."""
+    id_line = f"id: {event_id}\n" if event_id else ''
+    return f"{id_line}data: {message}\n\n".encode()
+
+
+def frame_id(day: date, version: int) -> str:
+    """SSE id кадра: день очереди и версия, которую отражает состояние клиента."""
+    return f"{day.isoformat()}:{version}"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Разобрать Last-Event-ID; None — отсутствует или некорректен."""
+    if not value:
+        return None
+    day, _, version = value.strip().partition(':')
+    try:
+        return date.fromisoformat(day).isoformat(), int(version)
+    except ValueError:
+        return None
+
+
+class QueueSnapshot:
+    """Записи очереди клиники на день с предварительно закодированным JSON."""
+
+    def __init__(self, appointments: List[Appointment], version: int, day: date):
+        self.appointments = appointments
+        self.version = version
+        self.day = day
+        self.ids = {apt.id for apt in appointments}
+        self._items: Dict[int, str] = {
+            item['id']: json.dumps(item)
+            for item in AppointmentSerializer(appointments, many=True).data
+        }
+        self.initial_payload = sse_payload(
+            f'{{"type": "initial", "version": {version}, "appointments": [{", ".join(self._items.values())}]}}',
+            frame_id(day, version),
+        )
+        self._deltas: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def delta_payload(self, upsert_ids: Iterable[int], removed_ids: List[int], version: int) -> bytes:
+        """
+        Кадр delta: изменённые записи (в порядке очереди) и удалённые id.
+
+        Одинаковые дельты кэшируются: все потоки клиники отправляют одни и те же байты.
+        """
+        upsert_ids = set(upsert_ids)
+        key: Tuple = (tuple(sorted(upsert_ids)), tuple(removed_ids), version)
+        with self._lock:
+            payload = self._deltas.get(key)
+        if payload is not None:
+            return payload
+
+        upsert = ', '.join(self._items[apt.id] for apt in self.appointments if apt.id in upsert_ids)
+        payload = sse_payload(
+            f'{{"type": "delta", "version": {version}, "upsert": [{upsert}], "remove": {json.dumps(removed_ids)}}}',
+            frame_id(self.day, version),
+        )
+        with self._lock:
+            self._deltas[key] = payload
+            while len(self._deltas) > _DELTA_CACHE_SIZE:
+                self._deltas.popitem(last=False)
+        return payload
+
+
+# Кадры голосовых вызовов по call_id: аудио кодируется один раз для всех экранов процесса
+_voice_frames: OrderedDict = OrderedDict()
+_voice_frames_lock = threading.Lock()
+_VOICE_FRAMES_SIZE = 16
+
+
+def voice_payload(announcement: dict) -> bytes:
+    """Кадр voice со ссылкой на аудио вызова (без id: на версию очереди не влияет)."""
+    call_id = announcement.get('call_id')
+    with _voice_frames_lock:
+        payload = _voice_frames.get(call_id)
+    if payload is not None:
+        return payload
+
+    payload = sse_payload(json.dumps({'type': 'voice', 'voice_announcements': [announcement]}))
+    if call_id:
+        with _voice_frames_lock:
+            _voice_frames[call_id] = payload
+            while len(_voice_frames) > _VOICE_FRAMES_SIZE:
+                _voice_frames.popitem(last=False)
+    return payload
+
+
+# (clinic_id, day) -> (QueueSnapshot, версия событий клиники в процессе)
+_snapshots: Dict[Tuple[int, date], Tuple[QueueSnapshot, int]] = {}
+_snapshots_lock = threading.Lock()
+
+
+def queue_queryset(clinic_id: int, day: date):
+    """Записи очереди клиники на день в порядке очереди (по времени начала)."""
+    return (
+        Appointment.objects.filter(clinic_id=clinic_id, date=day)
+        .select_related('doctor', 'clinic', 'service')
+        .order_by('time_start')
+    )
+
+
+def get_queue_snapshot(clinic_id: int, day: date) -> QueueSnapshot:
+    """
+    Снимок очереди клиники на день из кэша процесса или из БД.
+
+    Кэш действителен, пока процесс не получил новое событие клиники
+    (events.clinic_version), поэтому потоки, разбуженные одним событием,
+    делают один запрос и одну сериализацию.
+    """
+    key = (clinic_id, day)
+    generation = events.clinic_version(clinic_id)
+    with _snapshots_lock:
+        entry = _snapshots.get(key)
+        if entry and entry[1] == generation:
+            return entry[0]
+
+    # Версию читаем до выборки: снимок содержит как минимум все изменения до неё.
+    # Запрос и сериализация — вне блокировки, чтобы не держать lock во время IO
+    version = events.queue_version(clinic_id)
+    appointments = list(queue_queryset(clinic_id, day))
+    snapshot = QueueSnapshot(appointments, version, day)
+
+    with _snapshots_lock:
+        # Снимки прошедших дней больше не понадобятся
+        for stale_key in [k for k in _snapshots if k[1] != day]:
+            del _snapshots[stale_key]
+        _snapshots[key] = (snapshot, generation)
+    return snapshot
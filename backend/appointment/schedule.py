@@ -0,0 +1,115 @@
+"""
+Скомпилированное расписание врача.
+
+Doctor.working_days / working_hours / lunch_time хранятся как JSON со строками "HH:MM".
+DoctorSchedule один раз переводит их в целочисленные минуты по дням недели и
+кэшируется в памяти процесса по id врача. Кэш сбрасывается сигналом при сохранении
+или удалении врача, а дополнительно сверяется с исходным JSON, поэтому изменение,
+сделанное в другом процессе, тоже не приводит к устаревшему расписанию.
+"""
+import copy
+import threading
+from datetime import date, datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+WEEKDAY_CODES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+class WorkDay(NamedTuple):
+    """Рабочий день врача в минутах от начала суток."""
+    work_start: int
+    work_end: int
+    lunch_start: Optional[int]
+    lunch_end: Optional[int]
+    hours_label: str
+    lunch_label: Optional[str]
+
+
+class DoctorSchedule:
+    """Расписание врача по дням недели (0 — понедельник)."""
+    __slots__ = ('doctor_id', 'source', 'working_days', 'days')
+
+    def __init__(self, doctor_id, source: Tuple[dict, dict, dict]):
+        self.doctor_id = doctor_id
+        self.source = copy.deepcopy(source)
+        working_days, working_hours, lunch_time = self.source
+
+        self.working_days = tuple(bool(working_days.get(code, False)) for code in WEEKDAY_CODES)
+        self.days = tuple(_compile_day(working_hours.get(code), lunch_time.get(code)) for code in WEEKDAY_CODES)
+
+    def is_working_day(self, day: date) -> bool:
+        """Отмечен ли день недели как рабочий в working_days."""
+        return self.working_days[day.weekday()]
+
+    def for_date(self, day: date) -> Optional[WorkDay]:
+        """Рабочие часы на дату или None, если врач не принимает в этот день."""
+        weekday = day.weekday()
+        if not self.working_days[weekday]:
+            return None
+        return self.days[weekday]
+
+    def is_lunch_time(self, day: date, minute: int) -> bool:
+        """Попадает ли минута дня в обеденный перерыв (по lunch_time, независимо от рабочих дней)."""
+        work_day = self.days[day.weekday()]
+        return (
+            work_day is not None
+            and work_day.lunch_start is not None
+            and work_day.lunch_start <= minute < work_day.lunch_end
+        )
+
+    def matches(self, doctor) -> bool:
+        """Совпадает ли расписание с текущими JSON-полями врача."""
+        return self.source == (doctor.working_days, doctor.working_hours, doctor.lunch_time)
+
+
+_schedules: Dict[int, DoctorSchedule] = {}
+_schedules_lock = threading.Lock()
+
+
+def get_doctor_schedule(doctor) -> DoctorSchedule:
+    """Получить скомпилированное расписание врача (из кэша процесса или скомпилировать)."""
+    schedule = _schedules.get(doctor.pk)
+    if schedule is not None and schedule.matches(doctor):
+        return schedule
+
+    schedule = DoctorSchedule(doctor.pk, (doctor.working_days or {}, doctor.working_hours or {}, doctor.lunch_time or {}))
+    if doctor.pk is not None:
+        with _schedules_lock:
+            _schedules[doctor.pk] = schedule
+    return schedule
+
+
+def invalidate_doctor_schedule(doctor_id) -> None:
+    """Сбросить кэш расписания врача (вызывается сигналами Doctor)."""
+    with _schedules_lock:
+        _schedules.pop(doctor_id, None)
+
+
+def _compile_day(working_hours, lunch_time) -> Optional[WorkDay]:
+    """Перевести рабочие часы и обед одного дня недели в минуты."""
+    if not working_hours or len(working_hours) < 2:
+        return None
+
+    lunch_start = None
+    lunch_end = None
+    lunch_label = None
+    if lunch_time and len(lunch_time) >= 2:
+        lunch_start = _parse_minutes(lunch_time[0])
+        lunch_end = _parse_minutes(lunch_time[1])
+        lunch_label = f"{lunch_time[0]} - {lunch_time[1]}"
+
+    return WorkDay(
+        work_start=_parse_minutes(working_hours[0]),
+        work_end=_parse_minutes(working_hours[1]),
+        lunch_start=lunch_start,
+        lunch_end=lunch_end,
+        hours_label=f"{working_hours[0]} - {working_hours[1]}",
+        lunch_label=lunch_label,
+    )
+
+
+def _parse_minutes(time_str: str) -> int:
+    """Преобразовать строку "HH:MM" в минуты от начала дня."""
+    parsed = datetime.strptime(time_str, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
@@ -19,9 +19,9 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'service', 'service_name',
             'date', 'time_start',
             'number_coupon', 'status', 'comment',
-            'created_at', 'updated_at', 'source'
+            'created_at', 'updated_at', 'invited_at', 'finished_at', 'source'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at', 'invited_at', 'finished_at']
     
     def get_doctor_cabinet_number(self, obj):
         """Безопасное получение номера кабинета врача"""
@@ -43,6 +43,21 @@ class AppointmentUpdateSerializer(serializers.ModelSerializer):
             'status', 'comment'
         ]
 
+    def validate_status(self, value):
+        """Проверка допустимости перехода статуса"""
+        if self.instance is not None and not self.instance.can_change_status(value):
+            raise serializers.ValidationError(
+                f"Нельзя изменить статус с «{self.instance.get_status_display()}» на «{Appointment.Status(value).label}»"
+            )
+        return value
+
+    def update(self, instance, validated_data):
+        doctor = validated_data.get('doctor')
+        if doctor is not None and doctor.pk != instance.doctor_id:
+            # Длительность фиксируется на момент записи и зависит от врача — пересчитывается при сохранении
+            instance.duration = None
+        return super().update(instance, validated_data)
+
 
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания записи"""
@@ -63,7 +78,7 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
     
     def validate(self, attrs):
         """Валидация данных перед созданием записи"""
-        from datetime import datetime, date as dt_date
+        from datetime import date as dt_date
         
         # Проверка, что дата не в прошлом
         appointment_date = attrs.get('date')
@@ -72,38 +87,7 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
                 'date': 'Нельзя записаться на прошедшую дату'
             })
         
-        # Проверка времени
-        time_start = attrs.get('time_start')
-        service = attrs.get('service')
-        doctor = attrs.get('doctor')
-        
-        # Определяем длительность приёма
-        duration_minutes = service.duration if service and hasattr(service, 'duration') else doctor.default_duration
-        
-        # Вычисляем время окончания
-        from datetime import datetime, time as dt_time
-        time_start_minutes = time_start.hour * 60 + time_start.minute
-        time_end_minutes = time_start_minutes + duration_minutes
-        
-        # Проверка, что слот не занят (исключаем отменённые и завершённые)
-        existing_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            date=appointment_date
-        ).exclude(
-            status__in=['canceled', 'rejected', 'finished', 'no_show']
-        ).values('time_start')
-        
-        # Проверяем пересечения с существующими записями
-        for apt in existing_appointments:
-            apt_start_minutes = apt['time_start'].hour * 60 + apt['time_start'].minute
-            apt_end_minutes = apt_start_minutes + duration_minutes
-            
-            # Проверяем пересечение временных интервалов
-            if time_start_minutes < apt_end_minutes and apt_start_minutes < time_end_minutes:
-                raise serializers.ValidationError({
-                    'time_start': 'Этот временной слот уже занят'
-                })
-        
+        # Занятость слота проверяется при сохранении под блокировкой дня врача (booking.book_appointment)
         return attrs
 
 
@@ -0,0 +1,127 @@
+"""
+Сигналы приложения appointment: поддержание производных данных в актуальном состоянии.
+"""
+from datetime import date
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.models import Doctor
+
+from . import announcer, availability_cache, events, inventory, queue_load
+from .constraints import ensure_overlap_constraint
+from .models import Appointment, AppointmentStatusEvent
+from .schedule import invalidate_doctor_schedule
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    """
+    После изменения врача сбрасываем скомпилированное расписание, пересчитываем
+    инвентарь слотов на горизонт и только затем сбрасываем кэш слотов —
+    иначе промах кэша успел бы прочитать из инвентаря устаревшие данные.
+    """
+    invalidate_doctor_schedule(instance.pk)
+
+    def refresh():
+        inventory.refresh_doctors([instance])
+        availability_cache.invalidate_doctor(instance.pk)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_delete, sender=Doctor)
+def doctor_deleted(sender, instance, **kwargs):
+    """Сбрасываем расписание и кэш слотов удалённого врача (инвентарь удаляется каскадно)."""
+    invalidate_doctor_schedule(instance.pk)
+    doctor_id = instance.pk
+    transaction.on_commit(lambda: availability_cache.invalidate_doctor(doctor_id))
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_origin(sender, instance, **kwargs):
+    """
+    Запоминаем исходные врача и дату записи, чтобы при переносе сбросить и старый день,
+    и статус — чтобы вызвать пациента один раз при переходе в invited.
+
+    Врач, дата и статус берутся из __dict__: обращение к отложенному полю (defer/only)
+    загрузило бы его новым экземпляром и снова вызвало бы post_init. Отложенные
+    значения остаются None и дочитываются перед сохранением (Appointment.load_origin).
+    """
+    instance._origin = (instance.__dict__.get('doctor_id'), instance.__dict__.get('date'))
+    instance._origin_status = instance.__dict__.get('status')
+
+
+@receiver(pre_delete, sender=Appointment)
+def load_deleted_appointment_origin(sender, instance, **kwargs):
+    """Дочитываем отложенные исходные поля, пока запись ещё есть в БД."""
+    instance.load_origin()
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    """
+    Обновляем нагрузку врачей (queue_load) и журнал смены статусов, а после
+    фиксации транзакции публикуем событие очереди клиники, пересчитываем
+    инвентарь слотов затронутых дней врача и сбрасываем их кэш.
+    """
+    affected = {instance._origin, (instance.doctor_id, instance.date)}
+    previous_date = instance._origin[1]
+
+    # Нагрузка врачей и журнал статусов — в той же транзакции, что и сама запись
+    deleted = kwargs.get('signal') is post_delete
+    queue_load.apply_change(
+        None if kwargs.get('created') else queue_load.load_key(*instance._origin, instance._origin_status),
+        None if deleted else queue_load.load_key(instance.doctor_id, instance.date, instance.status),
+    )
+    if not deleted and (kwargs.get('created') or instance.status != instance._origin_status):
+        AppointmentStatusEvent.objects.create(
+            appointment_id=instance.pk,
+            clinic_id=instance.clinic_id,
+            doctor_id=instance.doctor_id,
+            from_status='' if kwargs.get('created') else instance._origin_status,
+            to_status=instance.status,
+        )
+    instance._origin = (instance.doctor_id, instance.date)
+    invited = (
+        kwargs.get('signal') is post_save
+        and instance.status == Appointment.Status.INVITED
+        and instance._origin_status != Appointment.Status.INVITED
+    )
+    instance._origin_status = instance.__dict__.get('status')
+
+    # Экраны очереди клиники узнают об изменении сразу после фиксации, не дожидаясь пересчёта слотов
+    event = {
+        'type': 'appointment',
+        'action': 'deleted' if deleted else ('created' if kwargs.get('created') else 'updated'),
+        'appointment_id': instance.pk,
+        'date': str(instance.date) if instance.date else None,
+        # При переносе запись должна исчезнуть из очереди старого дня
+        'previous_date': str(previous_date) if previous_date and previous_date != instance.date else None,
+        'status': instance.status,
+    }
+    clinic_id = instance.clinic_id
+    transaction.on_commit(lambda: events.publish(clinic_id, event))
+    if invited:
+        # Один синтез на вызов: результат получат все экраны клиники
+        transaction.on_commit(lambda: announcer.announce_invite(instance))
+    if date.today() in (instance.date, previous_date):
+        # Очередь на сегодня изменилась — заранее синтезируем вызовы следующих пациентов
+        transaction.on_commit(lambda: announcer.schedule_prefetch(clinic_id))
+
+    def refresh():
+        # Сначала инвентарь, затем кэш: промах кэша должен читать уже обновлённый инвентарь
+        inventory.refresh_days(affected)
+        for doctor_id, day in affected:
+            availability_cache.invalidate_day(doctor_id, day)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_migrate)
+def create_overlap_constraint(sender, using='default', **kwargs):
+    """После миграций приложения appointment добавляем ограничение против пересечений (PostgreSQL)."""
+    if sender.name == 'appointment':
+        ensure_overlap_constraint(using)
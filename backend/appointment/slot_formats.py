@@ -0,0 +1,90 @@
+"""
+Форматы передачи свободных слотов в ответах API.
+
+- objects (по умолчанию): [{"time_start": "09:00"}, ...] — исходный формат;
+- ranges: [[start_minute, step, count], ...] — арифметические серии начал слотов,
+  например [[540, 30, 6], [840, 30, 8]] — 09:00…11:30 и 14:00…17:30 с шагом 30 минут;
+- bitmap: base64 от 180 байт (1440 бит на сутки, little-endian) — бит N байта B
+  установлен, если слот начинается в минуту B * 8 + N.
+
+Формат выбирается параметром запроса ?slots_format=... или заголовком
+Accept: application/json; slots=ranges.
+"""
+import base64
+from typing import Dict, List, Optional
+
+from .availability import MINUTES_PER_DAY, SLOT_LABELS
+
+
+SLOT_FORMATS = ('objects', 'ranges', 'bitmap')
+DEFAULT_SLOT_FORMAT = 'objects'
+
+_BITMAP_BYTES = MINUTES_PER_DAY // 8
+
+
+def encode_objects(starts: List[int]) -> List[Dict[str, str]]:
+    """[540, 570] -> [{"time_start": "09:00"}, {"time_start": "09:30"}]"""
+    return [{'time_start': SLOT_LABELS[start]} for start in starts]
+
+
+def encode_ranges(starts: List[int]) -> List[List[int]]:
+    """
+    Свернуть отсортированные начала слотов в серии [start, step, count].
+    Одиночный слот кодируется как [start, 0, 1].
+    """
+    runs = []
+    index, total = 0, len(starts)
+    while index < total:
+        start = starts[index]
+        if index + 1 == total:
+            runs.append([start, 0, 1])
+            break
+        step = starts[index + 1] - start
+        count = 2
+        while index + count < total and starts[index + count] - starts[index + count - 1] == step:
+            count += 1
+        runs.append([start, step, count])
+        index += count
+    return runs
+
+
+def encode_bitmap(starts: List[int]) -> str:
+    """Начала слотов -> base64 битовой карты суток."""
+    mask = 0
+    for start in starts:
+        mask |= 1 << start
+    return base64.b64encode(mask.to_bytes(_BITMAP_BYTES, 'little')).decode('ascii')
+
+
+_ENCODERS = {
+    'objects': encode_objects,
+    'ranges': encode_ranges,
+    'bitmap': encode_bitmap,
+}
+
+
+def encode_days(days: Dict[str, List[int]], slots_format: str = DEFAULT_SLOT_FORMAT) -> Dict[str, object]:
+    """{дата: [минуты]} -> {дата: слоты в формате slots_format}"""
+    encoder = _ENCODERS[slots_format]
+    return {day: encoder(starts) for day, starts in days.items()}
+
+
+def negotiate_slots_format(request) -> Optional[str]:
+    """
+    Формат слотов из параметра slots_format или параметра slots заголовка Accept.
+
+    Returns:
+        Имя формата или None, если запрошен неизвестный формат
+    """
+    slots_format = request.query_params.get('slots_format')
+    if not slots_format:
+        for media_range in request.META.get('HTTP_ACCEPT', '').split(','):
+            for param in media_range.split(';')[1:]:
+                key, _, value = param.partition('=')
+                if key.strip() == 'slots':
+                    slots_format = value.strip().strip('"')
+                    break
+            if slots_format:
+                break
+    slots_format = slots_format or DEFAULT_SLOT_FORMAT
+    return slots_format if slots_format in SLOT_FORMATS else None
@@ -0,0 +1,64 @@
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(
+    name='appointment.tasks.refresh_slot_inventory',
+    bind=True,
+    max_retries=2,
+    default_retry_delay=300,  # 5 минут между повторами
+    soft_time_limit=1200,     # 20 минут — мягкий лимит
+    time_limit=1500,          # 25 минут — жёсткий лимит
+)
+def refresh_slot_inventory(self):
+    """Пересчитывает инвентарь слотов на горизонт вперёд и удаляет прошедшие дни (и счётчики очереди)."""
+    from datetime import date
+
+    from .coupons import purge_counters_before
+    from .inventory import refresh_all
+    from .queue_load import purge_before
+
+    try:
+        purged = purge_counters_before(date.today())
+        if purged:
+            logger.info(f'[coupons] Удалено счётчиков талонов прошедших дней: {purged}')
+        purged = purge_before(date.today())
+        if purged:
+            logger.info(f'[queue_load] Удалено счётчиков нагрузки прошедших дней: {purged}')
+        return refresh_all()
+    except Exception as exc:
+        logger.error(f'[inventory] Ошибка пересчёта инвентаря слотов: {exc}')
+        raise self.retry(exc=exc)
+
+
+@shared_task(
+    name='appointment.tasks.prefetch_queue_announcements',
+    bind=True,
+    max_retries=5,
+    soft_time_limit=120,      # 2 минуты — мягкий лимит
+    time_limit=180,           # 3 минуты — жёсткий лимит
+)
+def prefetch_queue_announcements(self, clinic_id):
+    """Заранее синтезирует вызовы ближайших пациентов клиники; одна задача на клинику одновременно."""
+    from datetime import date
+
+    from django.core.cache import cache
+
+    from .announcer import PREFETCH_DEBOUNCE, PREFETCH_LOCK_TIMEOUT, prefetch_clinic, prefetch_lock_key, prefetch_queued_key
+
+    # Изменения после этого момента поставят новую задачу
+    cache.delete(prefetch_queued_key(clinic_id))
+
+    lock_key = prefetch_lock_key(clinic_id)
+    if not cache.add(lock_key, 1, timeout=PREFETCH_LOCK_TIMEOUT):
+        # Для клиники уже идёт предсинтез — повторяем после него, чтобы учесть новые изменения
+        raise self.retry(countdown=PREFETCH_DEBOUNCE * 2)
+    try:
+        return prefetch_clinic(clinic_id, date.today())
+    except Exception as exc:
+        logger.error(f'[PREFETCH] Ошибка предсинтеза для клиники {clinic_id}: {exc}')
+        return 0
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,138 @@
+from datetime import date, time, timedelta
+from unittest import mock
+
+from django.test import TestCase
+
+from core.models import Clinic, Doctor, Service
+
+from . import queue_load
+from .booking import SlotUnavailable, reschedule_appointment
+from .models import Appointment, AppointmentStatusEvent
+from .serializers import AppointmentUpdateSerializer
+
+
+WEEK = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def create_doctor(clinic, service, full_name, default_duration=30):
+    doctor = Doctor.objects.create(
+        full_name=full_name,
+        clinic=clinic,
+        specialty='Терапевт',
+        working_days={day: True for day in WEEK},
+        working_hours={day: ['09:00', '18:00'] for day in WEEK},
+        default_duration=default_duration,
+    )
+    doctor.services.add(service)
+    return doctor
+
+
+class AppointmentTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name='Консультация')
+        cls.clinic = Clinic.objects.create(
+            name='Клиника',
+            city='Душанбе',
+            address='ул. Тестовая, 1',
+            phone_number='+992000000000',
+            email='clinic@example.com',
+            is_active=True,
+            is_online_booking=True,
+            is_electronic_queue=True,
+        )
+        cls.doctor = create_doctor(cls.clinic, cls.service, 'Иванов Иван')
+        cls.day = date.today() + timedelta(days=1)
+
+    def create_appointment(self, **kwargs):
+        data = {
+            'patient_full_name': 'Пациент',
+            'patient_phone': '+992111111111',
+            'clinic': self.clinic,
+            'doctor': self.doctor,
+            'service': self.service,
+            'date': self.day,
+            'time_start': time(10, 0),
+            'created_by': 'admin',
+        }
+        data.update(kwargs)
+        return Appointment.objects.create(**data)
+
+
+class DeferredFieldsTests(AppointmentTestCase):
+    def test_only_id_queryset_loads(self):
+        self.create_appointment()
+        self.create_appointment(time_start=time(11, 0))
+
+        self.assertEqual(len(list(Appointment.objects.only('id'))), 2)
+        self.assertEqual(len(list(Appointment.objects.defer('date', 'doctor'))), 2)
+
+    def test_move_with_deferred_origin_updates_both_days(self):
+        appointment = self.create_appointment()
+        next_day = self.day + timedelta(days=1)
+
+        moved = Appointment.objects.only('id').get(pk=appointment.pk)
+        moved.date = next_day
+        moved.save()
+
+        self.assertEqual(queue_load.doctor_load(self.doctor.id, self.day), 0)
+        self.assertEqual(queue_load.doctor_load(self.doctor.id, next_day), 1)
+
+    def test_deferred_status_invite_is_announced_once(self):
+        appointment = self.create_appointment()
+
+        with mock.patch('appointment.announcer.announce_invite') as announce_invite:
+            with self.captureOnCommitCallbacks(execute=True):
+                invited = Appointment.objects.defer('status').get(pk=appointment.pk)
+                invited.status = Appointment.Status.INVITED
+                invited.save(update_fields=['status', 'updated_at'])
+            with self.captureOnCommitCallbacks(execute=True):
+                again = Appointment.objects.defer('status').get(pk=appointment.pk)
+                again.comment = 'Повторное сохранение'
+                again.save()
+
+        self.assertEqual(announce_invite.call_count, 1)
+        invited.refresh_from_db()
+        self.assertIsNotNone(invited.invited_at)
+        self.assertEqual(
+            list(AppointmentStatusEvent.objects.filter(appointment=appointment).order_by('pk').values_list('from_status', 'to_status')),
+            [('', 'pending'), ('pending', 'invited')],
+        )
+
+
+class AppointmentUpdateTests(AppointmentTestCase):
+    def test_move_to_doctor_recomputes_duration(self):
+        appointment = self.create_appointment(service=None)
+        self.assertEqual((appointment.duration, appointment.time_end), (30, time(10, 30)))
+        long_doctor = create_doctor(self.clinic, self.service, 'Петров Пётр', default_duration=60)
+
+        serializer = AppointmentUpdateSerializer(appointment, data={'doctor': long_doctor.pk}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.duration, appointment.time_end), (60, time(11, 0)))
+
+    def reschedule(self, appointment, **data):
+        serializer = AppointmentUpdateSerializer(appointment, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return reschedule_appointment(serializer)
+
+    def test_reschedule_checks_new_slot(self):
+        self.create_appointment(time_start=time(11, 0))
+        appointment = self.create_appointment()
+
+        with self.assertRaises(SlotUnavailable):
+            self.reschedule(appointment, time_start='11:15')
+        # Сдвиг внутри собственного интервала — не пересечение с самим собой
+        self.reschedule(appointment, time_start='10:15')
+
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.time_start, appointment.time_end), (time(10, 15), time(10, 45)))
+
+    def test_reactivation_checks_slot(self):
+        canceled = self.create_appointment(status=Appointment.Status.CANCELED)
+        self.create_appointment()
+
+        with self.assertRaises(SlotUnavailable):
+            self.reschedule(canceled, status=Appointment.Status.CONFIRMED)
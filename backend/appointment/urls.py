@@ -12,6 +12,10 @@ urlpatterns = [
     path('clinic/queue-settings/', get_clinic_queue_settings, name='get_clinic_queue_settings_auto'),
     path('clinic/<int:clinic_id>/queue/create/', create_queue_appointment_by_admin, name='create_queue_appointment_by_admin'),
     path('clinic/queue/create/', create_queue_appointment_by_admin, name='create_queue_appointment_by_admin_auto'),
+    path('clinic/<int:clinic_id>/queue/doctor/<int:doctor_id>/call-next/', call_next_queue_patient, name='call_next_queue_patient'),
+    path('clinic/queue/doctor/<int:doctor_id>/call-next/', call_next_queue_patient, name='call_next_queue_patient_auto'),
+    path('clinic/<int:clinic_id>/queue/metrics/', get_queue_metrics, name='get_queue_metrics'),
+    path('clinic/queue/metrics/', get_queue_metrics, name='get_queue_metrics_auto'),
     path('clinic/<int:clinic_id>/queue/sse/', queue_appointments_sse, name='queue_appointments_sse'),
     path('clinic/queue/sse/', queue_appointments_sse, name='queue_appointments_sse_auto'),
 
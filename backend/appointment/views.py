@@ -1,11 +1,12 @@
+import asyncio
 import json
 import time
 import logging
-import threading
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
 from django.db import transaction
 from django.db.models import Q
 from django.db.models import Count as _Count
@@ -21,46 +22,35 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import AccessToken 
 
 from core.models import Clinic, Doctor, Service
-from core.utils import patient_call_synthesis_in_memory
 from users.models import User
 
-from .availability import get_available_slots, is_slot_available
+from . import events
+from .availability import get_earliest_free_slots, get_free_minutes_bulk
+from .booking import SlotUnavailable, book_appointment, reschedule_appointment
+from .coupons import issue_coupon
 from .models import Appointment
+from .queue_calls import call_next
+from .queue_load import doctor_load, pick_doctor
+from .queue_metrics import clinic_queue_metrics
+from .queue_snapshot import get_queue_snapshot, parse_event_id, voice_payload
+from .schedule import get_doctor_schedule
+from .slot_formats import SLOT_FORMATS, encode_days, negotiate_slots_format
 from .serializers import *
 
 
 sse_clients = {}
-# Глобальный словарь для отслеживания статусов записей (чтобы не синтезировать повторно)
-appointment_statuses = {}
 logger = logging.getLogger(__name__)
 
-# Кэш результатов запроса очереди: clinic_key -> (list[Appointment], timestamp)
-# Позволяет N SSE-клиентам одной клиники делать 1 запрос вместо N запросов в секунду
-_queue_cache: dict = {}
-_queue_cache_lock = threading.Lock()
-_QUEUE_CACHE_TTL = 0.8  # секунды
-
-# Пул потоков для неблокирующего синтеза речи (SpeechKit API)
-_synth_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='speech_synth')
-
-
-def _get_queue_appointments(clinic_id, today):
-    """Возвращает список записей из кэша или из БД (если кэш устарел)."""
-    cache_key = f"{clinic_id}_{today}"
-    now = time.monotonic()
-    with _queue_cache_lock:
-        entry = _queue_cache.get(cache_key)
-        if entry and (now - entry[1]) < _QUEUE_CACHE_TTL:
-            return entry[0]
-    # Запрос вне блокировки, чтобы не держать lock во время IO
-    fresh_data = list(
-        Appointment.objects.filter(clinic_id=clinic_id, date=today)
-        .select_related('doctor', 'clinic', 'service')
-        .order_by('time_start')
-    )
-    with _queue_cache_lock:
-        _queue_cache[cache_key] = (fresh_data, time.monotonic())
-    return fresh_data
+# Keep-alive комментарий SSE, когда событий нет (секунды)
+QUEUE_SSE_KEEPALIVE = getattr(settings, 'QUEUE_SSE_KEEPALIVE', 15)
+
+# Размер выдачи поиска в режиме sort='earliest'
+SEARCH_TOP_DEFAULT = 10
+SEARCH_TOP_MAX = 100
+
+# Потоковый поиск (stream=true): врачи обрабатываются пачками по id
+SEARCH_STREAM_CHUNK = 50
+SEARCH_STREAM_LIMIT_MAX = 500
 
 
 def resolve_admin_clinic(user, clinic_id=None, required_roles=None):
@@ -88,16 +78,127 @@ def resolve_admin_clinic(user, clinic_id=None, required_roles=None):
     return clinic, None
 
 
+def _search_doctor_data(doctor, free_minutes, slots_format):
+    """Данные врача для ответа поиска; слоты кодируются в формате slots_format."""
+    return {
+        'id': doctor.id,
+        'full_name': doctor.full_name,
+        'specialty': doctor.specialty,
+        'work_experience': doctor.work_experience,
+        'price': float(doctor.price),
+        'rating': doctor.rating,
+        'clinic': {
+            'id': doctor.clinic.id,
+            'name': doctor.clinic.name,
+            'address': doctor.clinic.address,
+            'city': doctor.clinic.city,
+        },
+        'slots': encode_days(free_minutes, slots_format)  # Слоты на 3 дня
+    }
+
+
+def _stream_search_results(doctors, search_date, service, slots_format, limit=None, cursor=None):
+    """
+    Генератор NDJSON-строк потокового поиска.
+
+    Врачи читаются пачками по SEARCH_STREAM_CHUNK в порядке id (keyset по cursor),
+    слоты считаются на пачку и строки отдаются сразу, поэтому в памяти держится
+    только одна пачка. Последняя строка — {"type": "end"} с курсором следующей страницы.
+    """
+    sent = 0
+    last_id = cursor or 0
+    next_cursor = None
+    try:
+        while True:
+            chunk = list(doctors.filter(id__gt=last_id).order_by('id')[:SEARCH_STREAM_CHUNK])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            slots_by_doctor = get_free_minutes_bulk(
+                doctors=chunk,
+                start_date=search_date,
+                service=service,
+                days_ahead=3
+            )
+            for doctor in chunk:
+                slots = slots_by_doctor[doctor.id]
+                if not any(day_slots for day_slots in slots.values()):
+                    continue
+                yield json.dumps({'type': 'doctor', 'doctor': _search_doctor_data(doctor, slots, slots_format)}, ensure_ascii=False) + '\n'
+                sent += 1
+                if limit and sent >= limit:
+                    next_cursor = doctor.id
+                    break
+            if next_cursor is not None or len(chunk) < SEARCH_STREAM_CHUNK:
+                break
+    except Exception as e:
+        logger.error(f"Ошибка потокового поиска врачей: {e}", exc_info=True)
+        yield json.dumps({'type': 'error', 'message': 'Ошибка поиска врачей'}, ensure_ascii=False) + '\n'
+        return
+
+    yield json.dumps({'type': 'end', 'count': sent, 'next_cursor': next_cursor}) + '\n'
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def search_available_doctors(request):
     """
     Поиск доступных врачей с использованием сервиса availability.
-    Возвращает врачей со свободными слотами на 7 дней вперед.
+    Возвращает врачей со свободными слотами на 3 дня вперед.
+    
+    sort='slots' (по умолчанию) — все врачи, больше свободных слотов в начале;
+    sort='earliest' — top врачей (по умолчанию 10) с самым ранним свободным приёмом.
+    
+    stream=true — ответ в формате NDJSON (application/x-ndjson): врачи отдаются по мере
+    расчёта в порядке id, без сортировки; limit ограничивает число врачей, cursor —
+    next_cursor из строки {"type": "end"} предыдущей страницы.
+    
+    ?slots_format=ranges|bitmap (или Accept: application/json; slots=ranges) —
+    компактная кодировка слотов, см. slot_formats.py.
     """
     service_id = request.data.get('service')
     city = request.data.get('city')
     search_date_str = request.data.get('date')
+    sort_mode = request.data.get('sort') or 'slots'
+    
+    if sort_mode not in ('slots', 'earliest'):
+        return Response(
+            {'error': "Параметр sort должен быть 'slots' или 'earliest'"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        top = int(request.data.get('top') or SEARCH_TOP_DEFAULT)
+    except (TypeError, ValueError):
+        top = 0
+    if not 1 <= top <= SEARCH_TOP_MAX:
+        return Response(
+            {'error': f'Параметр top должен быть числом от 1 до {SEARCH_TOP_MAX}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    slots_format = negotiate_slots_format(request)
+    if slots_format is None:
+        return Response(
+            {'error': f"Неизвестный формат слотов. Допустимые: {', '.join(SLOT_FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    stream = str(request.data.get('stream', '')).lower() in ('1', 'true')
+    try:
+        limit = int(request.data.get('limit') or 0) or None
+        cursor = int(request.data.get('cursor') or 0) or None
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'Параметры limit и cursor должны быть числами'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if (limit is not None and not 1 <= limit <= SEARCH_STREAM_LIMIT_MAX) or (cursor is not None and cursor < 0):
+        return Response(
+            {'error': f'Параметр limit должен быть от 1 до {SEARCH_STREAM_LIMIT_MAX}, cursor — неотрицательным'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     if not all([service_id, city, search_date_str]):
         logger.debug(f"Неполные данные для поиска врачей: {request.data}")
@@ -137,6 +238,15 @@ def search_available_doctors(request):
         available_for_booking=True
     ).select_related('clinic').prefetch_related('services').distinct()
     
+    if stream:
+        response = StreamingHttpResponse(
+            _stream_search_results(doctors.prefetch_related(None), search_date, service, slots_format, limit=limit, cursor=cursor),
+            content_type='application/x-ndjson; charset=utf-8'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
     if not doctors.exists():
         logger.debug(f"Врачи для услуги {service.name} в городе {city} не найдены")
         return Response(
@@ -144,44 +254,49 @@ def search_available_doctors(request):
             status=status.HTTP_200_OK
         )
     
-    # Используем сервис availability для получения слотов    
-    results = []
-    for doctor in doctors:
-        # Получаем свободные слоты на 7 дней
-        slots = get_available_slots(
-            doctor=doctor,
+    if sort_mode == 'earliest':
+        # Топ-K врачей по ближайшему свободному слоту: слоты разворачиваем только для них
+        ranked = get_earliest_free_slots(
+            doctors=doctors,
+            start_date=search_date,
+            service=service,
+            days_ahead=3,
+            limit=top
+        )
+        slots_by_doctor = get_free_minutes_bulk(
+            doctors=[doctor for doctor, _, _ in ranked],
+            start_date=search_date,
+            service=service,
+            days_ahead=3
+        )
+        results = []
+        for doctor, first_date, first_time in ranked:
+            doctor_data = _search_doctor_data(doctor, slots_by_doctor[doctor.id], slots_format)
+            doctor_data['next_free_slot'] = {'date': first_date.isoformat(), 'time_start': first_time}
+            results.append(doctor_data)
+    else:
+        # Используем сервис availability: слоты всех врачей одним запросом к записям
+        slots_by_doctor = get_free_minutes_bulk(
+            doctors=doctors,
             start_date=search_date,
             service=service,
             days_ahead=3
         )
         
-        # Проверяем, есть ли хотя бы один свободный слот
-        has_slots = any(day_slots for day_slots in slots.values())
+        found = []
+        for doctor in doctors:
+            slots = slots_by_doctor[doctor.id]
+            
+            # Проверяем, есть ли хотя бы один свободный слот
+            if any(day_slots for day_slots in slots.values()):
+                found.append((doctor, slots))
         
-        if has_slots:
-            # Формируем данные врача
-            doctor_data = {
-                'id': doctor.id,
-                'full_name': doctor.full_name,
-                'specialty': doctor.specialty,
-                'work_experience': doctor.work_experience,
-                'price': float(doctor.price),
-                'rating': doctor.rating,
-                'clinic': {
-                    'id': doctor.clinic.id,
-                    'name': doctor.clinic.name,
-                    'address': doctor.clinic.address,
-                    'city': doctor.clinic.city,
-                },
-                'slots': slots  # Слоты на 7 дней
-            }
-            results.append(doctor_data)
-    
-    # Сортировка: врачи с большим количеством слотов в начале списка
-    results.sort(
-        key=lambda x: sum(len(day_slots) for day_slots in x['slots'].values()),
-        reverse=True
-    )
+        # Сортировка: врачи с большим количеством слотов в начале списка
+        found.sort(
+            key=lambda item: sum(len(day_slots) for day_slots in item[1].values()),
+            reverse=True
+        )
+        results = [_search_doctor_data(doctor, slots, slots_format) for doctor, slots in found]
     
     logger.debug(f"Найдено {len(results)} врачей с доступными слотами для услуги {service.name} в городе {city}")
     return Response({
@@ -189,7 +304,9 @@ def search_available_doctors(request):
         'search_params': {
             'service': service_id,
             'city': city,
-            'date': search_date.isoformat()
+            'date': search_date.isoformat(),
+            'sort': sort_mode,
+            'slots_format': slots_format,
         }
     }, status=status.HTTP_200_OK)
 
@@ -201,33 +318,14 @@ def create_appointment(request):
     serializer = AppointmentCreateSerializer(data=request.data)
     
     if serializer.is_valid():
-        # Используем атомарную транзакцию для защиты от race condition
-        with transaction.atomic():
-            # Получаем данные из валидированного serializer
-            doctor = serializer.validated_data['doctor']
-            appointment_date = serializer.validated_data['date']
-            time_start = serializer.validated_data['time_start']
-            service = serializer.validated_data.get('service')
-            
-            # Определяем длительность приёма
-            duration_minutes = service.duration if service and hasattr(service, 'duration') else doctor.default_duration
-            
-            # Проверяем доступность слота перед созданием
-            is_available, error_message = is_slot_available(
-                doctor=doctor,
-                appointment_date=appointment_date,
-                time_start=time_start,
-                duration_minutes=duration_minutes
+        # Проверка слота и сохранение под блокировкой дня врача (см. booking.py)
+        try:
+            appointment = book_appointment(serializer, created_by='patient', status='pending')
+        except SlotUnavailable as e:
+            return Response(
+                {'error': e.message},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            if not is_available:
-                logger.debug(f"Попытка забронировать занятый слот: Врач {doctor.full_name}, Дата {appointment_date}, Время {time_start}")
-                return Response(
-                    {'error': error_message or 'Выбранный временной слот недоступен'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            appointment = serializer.save(created_by='patient', status='pending')
 
         # Возвращаем полные данные с названиями
         full_serializer = AppointmentSerializer(appointment)
@@ -363,7 +461,14 @@ def update_appointment(request, appointment_id):
 
     serializer = AppointmentUpdateSerializer(appointment, data=data, partial=True)
     if serializer.is_valid():
-        serializer.save()
+        # Перенос на другой слот проверяется под блокировкой дня врача (см. booking.py)
+        try:
+            reschedule_appointment(serializer)
+        except SlotUnavailable as e:
+            return Response(
+                {'error': e.message},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         full_serializer = AppointmentSerializer(appointment)
         logger.debug(f"Успешно обновлена запись: {full_serializer.data}")
         return Response(full_serializer.data, status=status.HTTP_200_OK)
@@ -529,22 +634,8 @@ def create_queue_appointment_by_admin(request, clinic_id=None):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Выбираем врача с наименьшим количеством записей на сегодня
-        today = datetime.now().date()
-        
-        doctor = Doctor.objects.filter(
-            clinic=clinic,
-            services=service,
-            is_active=True
-        ).annotate(
-            today_appointments=_Count(
-                'appointments',
-                filter=Q(
-                    appointments__date=today,
-                    appointments__status__in=['pending', 'invited', 'confirmed']
-                )
-            )
-        ).order_by('today_appointments').first()
+        # Выбираем врача по готовым счётчикам нагрузки (политика QUEUE_ASSIGNMENT_POLICY)
+        doctor = pick_doctor(clinic, service, datetime.now().date())
         
         if not doctor:
             return Response(
@@ -562,44 +653,18 @@ def create_queue_appointment_by_admin(request, clinic_id=None):
     appointment_date = datetime.now().date()
     time_start = datetime.now().replace(second=0, microsecond=0).time()
     
-    # Генерация талона
-    full_name = (doctor.full_name or '').strip()
-    name_parts = full_name.split() if full_name else []
-    
-    if len(name_parts) >= 1:
-        initials = name_parts[0][0].upper()
-    else:
-        initials = ""
-    
-    # Подсчет существующих записей
-    existing_count = Appointment.objects.filter(
-        clinic=clinic,
-        date=appointment_date,
-        number_coupon__startswith=initials
-    ).count()
-    
-    seq = existing_count + 1
-    number_coupon = f"{initials}{seq:02d}"
+    # Генерация талона: атомарный счётчик клиники за день (уникален при параллельной выдаче)
+    number_coupon = issue_coupon(clinic.id, appointment_date, doctor)
     
     # Определение статуса
-    # Проверяем есть ли записи со статусом invited или pending
-    has_active_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        date=appointment_date,
-        status__in=['invited', 'pending', 'confirmed']
-    ).exists()
-    
-    # Проверяем время обеда
-    weekday_map = {0: 'mon', 1: 'tue', 2: 'wed', 3: 'thu', 4: 'fri', 5: 'sat', 6: 'sun'}
-    weekday = weekday_map[appointment_date.weekday()]
-    lunch_time = doctor.lunch_time.get(weekday, [])
-    is_lunch_time = False
-    
-    if lunch_time and len(lunch_time) >= 2:
-        from datetime import datetime as dt
-        lunch_start = dt.strptime(lunch_time[0], "%H:%M").time()
-        lunch_end = dt.strptime(lunch_time[1], "%H:%M").time()
-        is_lunch_time = lunch_start <= time_start < lunch_end
+    # Проверяем есть ли записи со статусом invited, pending или confirmed (счётчик нагрузки врача)
+    load = getattr(doctor, 'queue_load', None)
+    has_active_appointments = (load if load is not None else doctor_load(doctor.id, appointment_date)) > 0
+    
+    # Проверяем время обеда по скомпилированному расписанию врача
+    is_lunch_time = get_doctor_schedule(doctor).is_lunch_time(
+        appointment_date, time_start.hour * 60 + time_start.minute
+    )
     
     # Устанавливаем статус
     if is_urgent:
@@ -631,10 +696,125 @@ def create_queue_appointment_by_admin(request, clinic_id=None):
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def call_next_queue_patient(request, doctor_id, clinic_id=None):
+    """Пригласить следующего пациента врача (срочные первыми, затем по времени) — атомарно"""
+    user = request.user
+
+    clinic, error_response = resolve_admin_clinic(
+        user=user,
+        clinic_id=clinic_id,
+        required_roles=['clinic_admin', 'clinic_queue_admin'],
+    )
+    if error_response:
+        logger.warning("Пользователь %s не смог вызвать пациента clinic_id=%s", user.id, clinic_id)
+        return error_response
+
+    if not clinic.is_electronic_queue:
+        return Response(
+            {'error': 'У клиники нет доступа к электронной очереди'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    try:
+        doctor = Doctor.objects.get(id=doctor_id, clinic=clinic)
+    except Doctor.DoesNotExist:
+        return Response(
+            {'error': 'Врач не найден'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    appointment, called = call_next(doctor)
+    if appointment is None:
+        return Response(
+            {'error': 'Ожидающих пациентов нет'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    logger.info(f"Пользователь {user} вызвал пациента {appointment.pk} к врачу {doctor.full_name} (повторно: {not called})")
+    return Response(
+        {'appointment': AppointmentSerializer(appointment).data, 'called': called},
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_queue_metrics(request, clinic_id=None):
+    """Показатели очереди клиники за день по врачам: ожидание, время приёма, пропускная способность"""
+    user = request.user
+
+    clinic, error_response = resolve_admin_clinic(
+        user=user,
+        clinic_id=clinic_id,
+        required_roles=['clinic_admin', 'clinic_queue_admin'],
+    )
+    if error_response:
+        logger.warning("Пользователь %s не смог получить показатели очереди clinic_id=%s", user.id, clinic_id)
+        return error_response
+
+    date_str = request.query_params.get('date')
+    if date_str:
+        try:
+            day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            logger.debug(f"Неверный формат даты: {date_str}")
+            return Response(
+                {'error': 'Неверный формат даты. Используйте YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    else:
+        day = datetime.now().date()
+
+    return Response(clinic_queue_metrics(clinic.id, day), status=status.HTTP_200_OK)
+
+
+def _iterate_in_own_loop(async_gen):
+    """
+    Синхронный итератор по async-генератору для WSGI.
+
+    Под WSGI Django читает async-итератор StreamingHttpResponse целиком перед
+    отправкой, а бесконечный SSE-поток так и не был бы отправлен. Здесь генератор
+    выполняется в собственном цикле событий потока воркера и кадры отдаются по
+    одному; при отключении клиента генератор закрывается (aclose), срабатывает его finally.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(async_gen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(async_gen.aclose())
+        loop.close()
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
-def queue_appointments_sse(request, clinic_id=None):
-    """SSE поток для получения обновлений очереди в реальном времени (электронная очередь на модели Appointment)"""    
+async def queue_appointments_sse(request, clinic_id=None):
+    """
+    SSE поток для получения обновлений очереди в реальном времени (электронная очередь на модели Appointment).
+
+    Асинхронный: под ASGI (сервис backend-sse, uvicorn) открытый поток не занимает
+    поток воркера — ожидание событий и keep-alive выполняются в цикле событий,
+    а запросы к БД — через sync_to_async только при изменениях очереди.
+    Под WSGI (runserver, основной gunicorn) тот же генератор отдаётся синхронно
+    через _iterate_in_own_loop и, как раньше, занимает поток воркера на время потока.
+
+    Сообщения:
+        connected — подключение установлено;
+        initial — снимок очереди на сегодня: {version, appointments};
+        delta — изменения: {version, upsert: [записи], remove: [id]};
+        voice — готовый голосовой вызов пациента: {voice_announcements: [...]};
+        комментарий ": keep-alive" — пока очередь не меняется.
+
+    Кадры initial и delta несут SSE id "<дата>:<версия>". При переподключении с
+    Last-Event-ID (заголовок или ?last_event_id=) клиент получает одну delta с
+    пропущенными изменениями из журнала событий клиники; если журнал их уже не
+    содержит или наступил другой день — снова initial.
+    """
     # Получаем access token только из auth cookie
     auth_cookie_name = settings.SIMPLE_JWT.get('AUTH_COOKIE', 'access')
     token = request.COOKIES.get(auth_cookie_name)
@@ -647,7 +827,7 @@ def queue_appointments_sse(request, clinic_id=None):
     try:
         access_token = AccessToken(token)
         user_id = access_token['user_id']
-        user = User.objects.get(id=user_id)
+        user = await User.objects.aget(id=user_id)
     except Exception as e:
         logger.warning(f"SSE: недействительный токен — {e}")
         return JsonResponse({'error': 'Недействительный токен'}, status=401)
@@ -657,7 +837,7 @@ def queue_appointments_sse(request, clinic_id=None):
         logger.warning(f"SSE: пользователь {user} не имеет прав для просмотра очереди")
         return JsonResponse({'error': 'У вас нет прав для просмотра записей'}, status=403)
 
-    clinic, error_response = resolve_admin_clinic(
+    clinic, error_response = await sync_to_async(resolve_admin_clinic)(
         user=user,
         clinic_id=clinic_id,
         required_roles=['clinic_admin', 'clinic_queue_admin'],
@@ -667,10 +847,11 @@ def queue_appointments_sse(request, clinic_id=None):
         return JsonResponse(error_response.data, status=error_response.status_code)
 
     clinic_id = clinic.id
+    resume_from = parse_event_id(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
     logger.info(f"SSE: пользователь {user} подключается к очереди клиники {clinic} (ID: {clinic_id})")
 
-    def event_stream():
-        """Генератор событий SSE"""
+    async def event_stream():
+        """Асинхронный генератор событий SSE"""
         client_id = f"{clinic_id}_{user.id}_{time.time()}"
         
         # Регистрируем клиента
@@ -678,141 +859,100 @@ def queue_appointments_sse(request, clinic_id=None):
             sse_clients[clinic_id] = []
         sse_clients[clinic_id].append(client_id)
 
-        # Локальный словарь ожидающих фьючерсов синтеза речи
-        # {appointment_id: {'future': Future, 'coupon': str, ...}}
-        pending_synth = {}
+        # Подписываемся до начальной выборки, чтобы не пропустить изменения между ними
+        subscription = events.subscribe_async(clinic_id)
         
         try:
             # Отправляем начальное подключение
             yield f"data: {json.dumps({'type': 'connected', 'clinic_id': clinic_id})}\n\n"
             
-            # Отправляем текущие данные (электронная очередь на сегодня)
+            # Отправляем текущие данные (электронная очередь на сегодня) — общий для клиники снимок,
+            # сериализованный один раз. События после его версии придут дельтами (повторный upsert безвреден)
             today = datetime.now().date()
-            queue_appointments = _get_queue_appointments(clinic_id, today)
-            
-            # Инициализируем глобальный словарь статусов для этой клиники, если еще не создан
-            clinic_key = f"clinic_{clinic_id}_{today}"
-            if clinic_key not in appointment_statuses:
-                appointment_statuses[clinic_key] = {}
+            today_iso = today.isoformat()
+            snapshot = await sync_to_async(get_queue_snapshot)(clinic_id, today)
+            version = snapshot.version
+            known_ids = snapshot.ids
+
+            missed = None
+            if resume_from and resume_from[0] == today_iso:
+                missed = await sync_to_async(events.events_since)(clinic_id, resume_from[1])
             
-            # Сохраняем начальные статусы в глобальный словарь
-            for apt in queue_appointments:
-                appointment_statuses[clinic_key][apt.id] = apt.status
-            
-            serializer = AppointmentSerializer(queue_appointments, many=True)
-            yield f"data: {json.dumps({'type': 'initial', 'appointments': serializer.data})}\n\n"
+            if missed is None:
+                yield snapshot.initial_payload
+            else:
+                # Возобновление: состояние клиента отстаёт только на события журнала
+                replay_ids = {
+                    event['appointment_id'] for event in missed
+                    if event.get('type') == 'appointment'
+                    and today_iso in (event.get('date'), event.get('previous_date'))
+                }
+                version = max([version, resume_from[1]] + [event['version'] for event in missed])
+                logger.info(f"SSE: клиент {client_id} возобновил поток с версии {resume_from[1]}, пропущено событий: {len(missed)}")
+                if replay_ids:
+                    yield snapshot.delta_payload(
+                        upsert_ids=replay_ids & snapshot.ids,
+                        removed_ids=sorted(replay_ids - snapshot.ids),
+                        version=version,
+                    )
             
-            # Держим соединение открытым и отправляем обновления с фиксированным интервалом
+            # Держим соединение открытым и ждём событий клиники вместо опроса БД:
+            # пока записи не меняются, поток не делает ни одного запроса и ничего не сериализует.
+            # Клиенту уходят только дельты: upsert изменённых записей и remove исчезнувших
             while True:
-                loop_started = time.monotonic()
-
-                # Отправляем актуальные данные
-                queue_appointments = _get_queue_appointments(clinic_id, today)
-                
-                # --- Собираем готовые результаты синтеза речи (неблокирующе) ---
-                voice_announcements = []
-                completed_ids = []
-                for apt_id, synth_info in pending_synth.items():
-                    future = synth_info['future']
-                    if future.done():
-                        completed_ids.append(apt_id)
-                        try:
-                            audio_base64 = future.result()
-                            synth_elapsed = time.monotonic() - synth_info['submitted_at']
-                            if audio_base64:
-                                voice_announcements.append({
-                                    'appointment_id': apt_id,
-                                    'audio_base64': audio_base64,
-                                    'number_coupon': synth_info['coupon'] or (
-                                        synth_info['time_start'].strftime("%H:%M") if synth_info['time_start'] else ''
-                                    ),
-                                    'patient_name': synth_info['patient_name'],
-                                    'cabinet_number': synth_info['cabinet_number'],
-                                })
-                                logger.info(
-                                    f"[CALL] Синтезировано аудио для пациента: {synth_info['patient_name']}, "
-                                    f"талон: {synth_info['coupon'] or 'без талона'}, "
-                                    f"размер base64: {len(audio_base64)} символов, "
-                                    f"время синтеза: {synth_elapsed:.3f}с"
-                                )
-                            else:
-                                logger.warning(
-                                    f"[CALL] Не удалось синтезировать аудио для {synth_info['patient_name']}, "
-                                    f"время ожидания синтеза: {synth_elapsed:.3f}с"
-                                )
-                        except Exception as exc:
-                            logger.error(f"[CALL] Ошибка синтеза для appointment {apt_id}: {exc}")
-                for apt_id in completed_ids:
-                    del pending_synth[apt_id]
-
-                # --- Проверяем изменения статусов и отправляем новые задачи синтеза ---
-                for apt in queue_appointments:
-                    current_status = apt.status
-                    previous_status = appointment_statuses[clinic_key].get(apt.id)
-                    
-                    # Логируем все изменения статусов
-                    if previous_status and current_status != previous_status:
-                        logger.info(f"[STATUS_CHANGE] Клиника {clinic_id}, ID:{apt.id}, {apt.patient_full_name}: {previous_status} -> {current_status}")
-                    
-                    # Если статус изменился на "invited" - отправляем синтез в фоновый поток
-                    if current_status == 'invited' and previous_status != 'invited':
-                        if apt.id not in pending_synth:  # не отправлять повторно
-                            coupon = apt.number_coupon or ''
-                            cabinet_number = getattr(apt.doctor, 'cabinet_number', '') if apt.doctor else ''
-                            logger.info(f"[VOICE_TRIGGER] Запускаем синтез (async) для пациента: {apt.patient_full_name}, талон: {coupon or 'без талона'}")
-                            logger.debug(f"[VOICE_DEBUG] Параметры: patient={apt.patient_full_name}, coupon={coupon or 'нет'}, cabinet={cabinet_number or 'нет'}")
-
-                            future = _synth_executor.submit(
-                                patient_call_synthesis_in_memory,
-                                patient_name=apt.patient_full_name,
-                                number_coupon=coupon,
-                                cabinet_number=cabinet_number,
-                            )
-                            pending_synth[apt.id] = {
-                                'future': future,
-                                'coupon': coupon,
-                                'patient_name': apt.patient_full_name,
-                                'cabinet_number': cabinet_number,
-                                'time_start': apt.time_start,
-                                'submitted_at': time.monotonic(),
-                            }
-
-                    # Обновляем статус в глобальном словаре
-                    if previous_status is None or current_status != previous_status:
-                        appointment_statuses[clinic_key][apt.id] = current_status
-                
-                serializer = AppointmentSerializer(queue_appointments, many=True)
-                response_data = {
-                    'type': 'update',
-                    'appointments': serializer.data
+                received = await subscription.wait(timeout=QUEUE_SSE_KEEPALIVE)
+                if not received:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                version = max([version] + [event.get('version') or 0 for event in received])
+                resync = any(event.get('type') == 'resync' for event in received)
+                # События других дат очередь на сегодня не меняют
+                changed_ids = {
+                    event['appointment_id'] for event in received
+                    if event.get('type') == 'appointment'
+                    and today_iso in (event.get('date'), event.get('previous_date'))
                 }
-                
-                # Если есть голосовые объявления, добавляем их в ответ
-                if voice_announcements:
-                    response_data['voice_announcements'] = voice_announcements
-                    logger.info(f"[SSE_SEND] Отправляем {len(voice_announcements)} голосовых объявлений клиенту {client_id}")
-                
-                yield f"data: {json.dumps(response_data)}\n\n"
 
-                # Ждём до следующего тика (1 секунда), чтобы не нагружать CPU
-                elapsed = time.monotonic() - loop_started
-                sleep_time = max(0, 1.0 - elapsed)
-                time.sleep(sleep_time)
+                upserted = []
+                removed_ids = []
+                if resync or changed_ids:
+                    snapshot = await sync_to_async(get_queue_snapshot)(clinic_id, today)
+                    if resync:
+                        # Могли быть пропущены события — сверяем всю очередь
+                        changed_ids = known_ids | snapshot.ids
+                    upserted = [apt for apt in snapshot.appointments if apt.id in changed_ids]
+                    removed_ids = sorted(changed_ids & (known_ids - snapshot.ids))
+                    known_ids = snapshot.ids
                 
-        except GeneratorExit:
-            # Клиент отключился — отменяем незавершённые задачи синтеза
-            for synth_info in pending_synth.values():
-                synth_info['future'].cancel()
-            pending_synth.clear()
+                if upserted or removed_ids:
+                    yield snapshot.delta_payload(
+                        upsert_ids=(apt.id for apt in upserted),
+                        removed_ids=removed_ids,
+                        version=version,
+                    )
+
+                # Голосовые вызовы синтезирует announcer один раз на клинику — поток только пересылает аудио
+                for event in received:
+                    if event.get('type') == 'voice':
+                        yield voice_payload(event['announcement'])
+                
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            # Клиент отключился (CancelledError/GeneratorExit)
+            subscription.close()
             if clinic_id in sse_clients and client_id in sse_clients[clinic_id]:
                 sse_clients[clinic_id].remove(client_id)
                 if not sse_clients[clinic_id]:
                     del sse_clients[clinic_id]
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+
+    stream = event_stream()
+    if isinstance(request, WSGIRequest):
+        stream = _iterate_in_own_loop(stream)
 
     response = StreamingHttpResponse(
-        event_stream(),
+        stream,
         content_type='text/event-stream'
     )
     response['Cache-Control'] = 'no-cache'
@@ -22,6 +22,13 @@ app.conf.beat_schedule = {
             'queue': 'backup',
         },
     },
+    'refresh-slot-inventory-nightly': {
+        'task': 'appointment.tasks.refresh_slot_inventory',
+        'schedule': crontab(hour=0, minute=30),  # каждый день в 00:30, после бэкапа
+        'options': {
+            'queue': 'maintenance',
+        },
+    },
 }
 
 app.conf.timezone = 'Asia/Dushambe'
@@ -236,6 +236,22 @@ CACHES = {
     }
 }
 
+# Время жизни кэша свободных слотов врачей (секунды); инвалидация — по изменению записей
+AVAILABILITY_CACHE_TIMEOUT = int(os.getenv('AVAILABILITY_CACHE_TIMEOUT', '600'))
+# На сколько дней вперёд поддерживается материализованный инвентарь слотов (SlotInventory)
+SLOT_INVENTORY_HORIZON_DAYS = int(os.getenv('SLOT_INVENTORY_HORIZON_DAYS', '30'))
+
+# Шина событий очереди (Redis pub/sub): изменения записей рассылаются SSE-потокам всех воркеров.
+# Без Redis события доставляются только внутри процесса
+QUEUE_EVENTS_REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}' if os.getenv('USE_REDIS', 'False') == 'True' else None
+# Интервал keep-alive комментариев в SSE-потоке очереди, когда изменений нет (секунды)
+QUEUE_SSE_KEEPALIVE = int(os.getenv('QUEUE_SSE_KEEPALIVE', '15'))
+# Сколько последних событий очереди клиники хранить для возобновления SSE по Last-Event-ID
+QUEUE_EVENT_LOG_SIZE = int(os.getenv('QUEUE_EVENT_LOG_SIZE', '500'))
+# Выбор врача при записи в электронную очередь по услуге (appointment/queue_load.py):
+# least_busy — меньше всего активных записей, shortest_wait — меньше ожидаемое время ожидания
+QUEUE_ASSIGNMENT_POLICY = os.getenv('QUEUE_ASSIGNMENT_POLICY', 'least_busy')
+
 # Session в Redis для production
 if os.getenv('USE_REDIS', 'False') == 'True':
     SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
@@ -252,6 +268,8 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 # Отдельная очередь для бэкапа — не мешает основным задачам
 CELERY_TASK_ROUTES = {
     'core.tasks.backup_database': {'queue': 'backup'},
+    'appointment.tasks.refresh_slot_inventory': {'queue': 'maintenance'},
+    'appointment.tasks.prefetch_queue_announcements': {'queue': 'speech'},
 }
 
 
@@ -371,4 +389,20 @@ SPEECHKIT_API_KEY = os.getenv('SPEECHKIT_API_KEY', '')
 SPEECHKIT_API_KEY_V3 = os.getenv('SPEECHKIT_API_KEY_V3', '')
 SPEECHKIT_FOLDER_ID_V3 = os.getenv('SPEECHKIT_FOLDER_ID_V3', '')
 SPEECHKIT_URL = os.getenv('SPEECHKIT_URL', '')
-SPEECHKIT_URL_V3 = os.getenv('SPEECHKIT_URL_V3', '')
\ No newline at end of file
+SPEECHKIT_URL_V3 = os.getenv('SPEECHKIT_URL_V3', '')
+# Клиент SpeechKit (core/speechkit.py): размер пула соединений и автоматический выключатель —
+# после SPEECHKIT_FAILURE_THRESHOLD ошибок подряд запросы не отправляются SPEECHKIT_COOLDOWN секунд
+SPEECHKIT_POOL_SIZE = int(os.getenv('SPEECHKIT_POOL_SIZE', '8'))
+SPEECHKIT_FAILURE_THRESHOLD = int(os.getenv('SPEECHKIT_FAILURE_THRESHOLD', '5'))
+SPEECHKIT_COOLDOWN = int(os.getenv('SPEECHKIT_COOLDOWN', '30'))
+# Дисковый кэш синтезированной речи (core/tts_cache.py): повторяющиеся вызовы не обращаются к API
+TTS_CACHE_DIR = Path(os.getenv('TTS_CACHE_DIR', str(BASE_DIR / 'tts_cache')))
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+# Сколько секунд хранится аудио вызова, адрес которого разослан экранам очереди (вне лимита кэша)
+TTS_CALL_AUDIO_TTL = int(os.getenv('TTS_CALL_AUDIO_TTL', str(24 * 60 * 60)))
+# Предсинтез вызовов ближайших пациентов (Celery-очередь speech); по умолчанию — когда есть Redis-брокер
+TTS_PREFETCH_ENABLED = os.getenv('TTS_PREFETCH_ENABLED', os.getenv('USE_REDIS', 'False')) == 'True'
+# Сколько ближайших ожидающих пациентов каждого врача синтезировать заранее
+TTS_PREFETCH_AHEAD = int(os.getenv('TTS_PREFETCH_AHEAD', '3'))
+# Одновременных запросов к SpeechKit на клинику при предсинтезе
+TTS_PREFETCH_CONCURRENCY = int(os.getenv('TTS_PREFETCH_CONCURRENCY', '2'))
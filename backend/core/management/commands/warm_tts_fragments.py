@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from appointment.coupons import coupon_prefix
+from core import tts_fragments
+from core.models import Doctor
+
+
+class Command(BaseCommand):
+    help = 'Заранее синтезирует библиотеку фрагментов для голосовых вызовов пациентов (только отсутствующие)'
+
+    def handle(self, *args, **options):
+        # Буквы талонов всех врачей (см. appointment.coupons.coupon_prefix)
+        letters = sorted({coupon_prefix(doctor) for doctor in Doctor.objects.only('full_name')} - {''})
+        texts = tts_fragments.library_texts(letters)
+        missing = [text for text in texts if not tts_fragments.fragment_available(text)]
+        self.stdout.write(f'Фрагментов в библиотеке: {len(texts)}, отсутствует: {len(missing)}')
+
+        failed = [text for text in missing if tts_fragments.load_fragment(text) is None]
+        if failed:
+            self.stdout.write(self.style.WARNING(f"Не удалось синтезировать: {', '.join(failed)}"))
+        self.stdout.write(self.style.SUCCESS(f'Готово: синтезировано {len(missing) - len(failed)}'))
@@ -0,0 +1,136 @@
+"""
+Простые счётчики производительности, общие для всех процессов.
+
+Значения хранятся в настроенном кэше (Redis в production), поэтому счётчики
+gunicorn-воркеров, бота и Celery суммируются. Без Redis (LocMemCache) счётчики
+видны только внутри процесса.
+
+Гистограммы (observe) хранят число наблюдений по фиксированным границам в
+миллисекундах, а также их количество и сумму — так же, в кэше.
+"""
+import logging
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional
+
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = 'metrics'
+
+# Верхние границы корзин гистограмм, миллисекунды (последняя корзина — всё, что больше)
+HISTOGRAM_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Имена всех зарегистрированных счётчиков и гистограмм — для вывода в metrics-эндпоинте
+_registered: set = set()
+_histograms: set = set()
+
+
+def register(*names: str) -> None:
+    """Зарегистрировать счётчики, чтобы они выводились даже с нулевым значением."""
+    _registered.update(names)
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Увеличить счётчик name на amount. Ошибки кэша не должны ломать основной запрос."""
+    if amount <= 0:
+        return
+    _registered.add(name)
+    _incr_key(f"{METRICS_KEY_PREFIX}:{name}", amount)
+
+
+def _incr_key(key: str, amount: int) -> None:
+    try:
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # Ключа ещё нет: создаём атомарно, при гонке — повторяем incr
+            if not cache.add(key, amount, timeout=None):
+                cache.incr(key, amount)
+    except Exception as exc:
+        logger.debug(f"Не удалось обновить метрику {key}: {exc}")
+
+
+def register_histogram(*names: str) -> None:
+    """Зарегистрировать гистограммы, чтобы они выводились даже без наблюдений."""
+    _histograms.update(names)
+
+
+def _histogram_keys(name: str) -> Dict[str, str]:
+    keys = {str(bound): f"{METRICS_KEY_PREFIX}:{name}:le:{bound}" for bound in HISTOGRAM_BUCKETS_MS}
+    keys['+Inf'] = f"{METRICS_KEY_PREFIX}:{name}:le:inf"
+    keys['count'] = f"{METRICS_KEY_PREFIX}:{name}:count"
+    keys['sum_ms'] = f"{METRICS_KEY_PREFIX}:{name}:sum_ms"
+    return keys
+
+
+def observe(name: str, value_ms: float) -> None:
+    """Добавить наблюдение (длительность в миллисекундах) в гистограмму name."""
+    _histograms.add(name)
+    keys = _histogram_keys(name)
+    index = bisect_left(HISTOGRAM_BUCKETS_MS, value_ms)
+    bucket = str(HISTOGRAM_BUCKETS_MS[index]) if index < len(HISTOGRAM_BUCKETS_MS) else '+Inf'
+    _incr_key(keys[bucket], 1)
+    _incr_key(keys['count'], 1)
+    _incr_key(keys['sum_ms'], max(1, round(value_ms)))
+
+
+def _quantile(buckets: Dict[str, int], count: int, q: float) -> Optional[int]:
+    """Верхняя граница корзины, в которую попадает квантиль q (None — больше последней границы)."""
+    if not count:
+        return 0
+    threshold = q * count
+    for bound in HISTOGRAM_BUCKETS_MS:
+        if buckets[str(bound)] >= threshold:
+            return bound
+    return None
+
+
+def get_histograms() -> Dict[str, dict]:
+    """Гистограммы: накопительные корзины (le), количество, сумма, среднее и оценки p50/p95."""
+    result = {}
+    for name in sorted(_histograms):
+        keys = _histogram_keys(name)
+        values = cache.get_many(list(keys.values()))
+        raw = {label: int(values.get(key, 0)) for label, key in keys.items()}
+        count = raw.pop('count')
+        sum_ms = raw.pop('sum_ms')
+        cumulative, total = {}, 0
+        for label, value in raw.items():
+            total += value
+            cumulative[label] = total
+        result[name] = {
+            'count': count,
+            'sum_ms': sum_ms,
+            'avg_ms': round(sum_ms / count, 1) if count else 0.0,
+            'p50_ms': _quantile(cumulative, count, 0.5),
+            'p95_ms': _quantile(cumulative, count, 0.95),
+            'buckets': cumulative,
+        }
+    return result
+
+
+def get_counters(names: Iterable[str] = None) -> Dict[str, int]:
+    """Текущие значения счётчиков (по умолчанию — всех зарегистрированных в процессе)."""
+    names = sorted(set(names) if names is not None else _registered)
+    keys = {f"{METRICS_KEY_PREFIX}:{name}": name for name in names}
+    values = cache.get_many(list(keys))
+    return {name: int(values.get(key, 0)) for key, name in keys.items()}
+
+
+def hit_ratio(hits: int, misses: int) -> float:
+    """Доля попаданий в кэш (0.0, если обращений не было)."""
+    total = hits + misses
+    return round(hits / total, 4) if total else 0.0
+
+
+def snapshot() -> Dict[str, object]:
+    """Все зарегистрированные счётчики, доли попаданий для пар *_hits / *_misses и гистограммы."""
+    counters = get_counters()
+    ratios = {}
+    for name, value in counters.items():
+        if name.endswith('_hits'):
+            base = name[:-len('_hits')]
+            ratios[f"{base}_hit_ratio"] = hit_ratio(value, counters.get(f"{base}_misses", 0))
+    return {'counters': counters, 'ratios': ratios, 'histograms': get_histograms()}
@@ -0,0 +1,233 @@
+"""
+Клиент Yandex SpeechKit API v3 (utteranceSynthesis).
+
+- Одна requests.Session на процесс с пулом до SPEECHKIT_POOL_SIZE соединений:
+  TLS-рукопожатие не повторяется на каждый вызов пациента.
+- Ответ (JSON-стрим, по строке на audioChunk) декодируется по мере получения,
+  без буферизации всего тела.
+- Автоматический выключатель: после SPEECHKIT_FAILURE_THRESHOLD ошибок подряд
+  (таймауты, сетевые ошибки, 5xx, 429) запросы не отправляются SPEECHKIT_COOLDOWN
+  секунд — вызов сразу возвращает None и не занимает поток синтеза. Затем
+  проходит один пробный запрос; если он тоже неудачен, пауза удваивается
+  (не больше MAX_COOLDOWN). Состояние выключателя — своё в каждом процессе.
+- Сетевые ошибки и ответы 5xx/429 повторяются один раз с небольшой задержкой;
+  таймаут чтения не повторяется, чтобы не удваивать ожидание.
+
+Метрики: speechkit_requests / speechkit_failures / speechkit_retries /
+speechkit_circuit_rejected и гистограммы speechkit_latency (весь синтез) и
+speechkit_first_chunk (до первого аудио-чанка).
+"""
+import base64
+import json
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 5
+POOL_SIZE = getattr(settings, 'SPEECHKIT_POOL_SIZE', 8)
+FAILURE_THRESHOLD = getattr(settings, 'SPEECHKIT_FAILURE_THRESHOLD', 5)
+COOLDOWN = getattr(settings, 'SPEECHKIT_COOLDOWN', 30)
+MAX_COOLDOWN = 300
+# Попыток на один синтез и базовая задержка перед повтором (секунды, с джиттером)
+MAX_ATTEMPTS = 2
+RETRY_DELAY = 0.2
+
+REQUESTS_METRIC = 'speechkit_requests'
+FAILURES_METRIC = 'speechkit_failures'
+RETRIES_METRIC = 'speechkit_retries'
+REJECTED_METRIC = 'speechkit_circuit_rejected'
+LATENCY_HISTOGRAM = 'speechkit_latency'
+FIRST_CHUNK_HISTOGRAM = 'speechkit_first_chunk'
+metrics.register(REQUESTS_METRIC, FAILURES_METRIC, RETRIES_METRIC, REJECTED_METRIC)
+metrics.register_histogram(LATENCY_HISTOGRAM, FIRST_CHUNK_HISTOGRAM)
+
+
+class _TransientError(Exception):
+    """Ошибка, после которой запрос имеет смысл повторить (сеть, 5xx, 429)."""
+
+
+class CircuitBreaker:
+    """Автоматический выключатель: closed → open (после серии ошибок) → half-open (одна проба)."""
+
+    def __init__(self, failure_threshold: int, cooldown: float, max_cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас."""
+        with self._lock:
+            if self._failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._open_until or self._probe_in_flight:
+                return False
+            # Пауза истекла: пропускаем один пробный запрос
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._failures >= self.failure_threshold:
+                logger.info("[SPEECHKIT] Сервис снова отвечает, выключатель закрыт")
+            self._failures = 0
+            self._cooldown = self.base_cooldown
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._probe_in_flight:
+                # Неудачная проба: следующая пауза вдвое длиннее
+                self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+                self._probe_in_flight = False
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self._cooldown
+                logger.warning(
+                    f"[SPEECHKIT] Ошибок подряд: {self._failures}, запросы приостановлены на {self._cooldown} с"
+                )
+
+
+breaker = CircuitBreaker(FAILURE_THRESHOLD, COOLDOWN, MAX_COOLDOWN)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def _request(data: dict, headers: dict) -> Optional[bytes]:
+    """Один запрос синтеза. None — ошибка запроса (повтор не поможет), _TransientError — можно повторить."""
+    started = time.monotonic()
+    metrics.incr(REQUESTS_METRIC)
+    try:
+        with _get_session().post(
+            settings.SPEECHKIT_URL_V3,
+            headers=headers,
+            json=data,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            stream=True,
+        ) as response:
+            if response.status_code == 429 or response.status_code >= 500:
+                raise _TransientError(f"{response.status_code} - {response.text[:200]}")
+            if response.status_code != 200:
+                logger.error(f"[ERROR] Ошибка синтеза речи: {response.status_code} - {response.text}")
+                if response.status_code == 401:
+                    logger.error("[ERROR] Проверьте SPEECHKIT_API_KEY и права доступа в Yandex Cloud")
+                return None
+
+            # v3 API возвращает JSON-стрим: каждая строка — JSON с audioChunk.data (base64)
+            audio_chunks = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                    b64 = chunk.get('result', {}).get('audioChunk', {}).get('data', '')
+                    if b64:
+                        if not audio_chunks:
+                            metrics.observe(FIRST_CHUNK_HISTOGRAM, (time.monotonic() - started) * 1000)
+                        audio_chunks.append(base64.b64decode(b64))
+                except Exception:
+                    continue
+    except requests.exceptions.Timeout:
+        raise
+    except requests.exceptions.ConnectionError as e:
+        # Таймаут чтения при потоковом ответе requests оборачивает в ConnectionError
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(e) from e
+        raise _TransientError(f"сетевая ошибка: {e}") from e
+    except requests.exceptions.ChunkedEncodingError as e:
+        raise _TransientError(f"обрыв ответа: {e}") from e
+
+    if not audio_chunks:
+        logger.error("[ERROR] Не удалось извлечь аудио-чанки из ответа SpeechKit")
+        return None
+    metrics.observe(LATENCY_HISTOGRAM, (time.monotonic() - started) * 1000)
+    return b''.join(audio_chunks)
+
+
+def synthesize(data: dict) -> Optional[bytes]:
+    """
+    Синтезировать речь по телу запроса v3 (text, hints, outputAudioSpec).
+
+    Returns:
+        Аудио (склеенные audioChunk ответа) или None при ошибке или открытом выключателе — ошибки логируются
+    """
+    # Проверяем наличие API ключа
+    api_key = getattr(settings, 'SPEECHKIT_API_KEY_V3')
+    folder_id = getattr(settings, 'SPEECHKIT_FOLDER_ID_V3')
+
+    if not api_key:
+        logger.warning("SPEECHKIT_API_KEY_V3 не настроен в settings")
+        return None
+    if not folder_id:
+        logger.warning("SPEECHKIT_FOLDER_ID_V3 не настроен в settings")
+        return None
+
+    headers = {
+        "Authorization": f"Api-Key {api_key}",
+        "x-folder-id": f"{folder_id}",
+    }
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if not breaker.allow():
+            metrics.incr(REJECTED_METRIC)
+            logger.warning("[SPEECHKIT] Выключатель открыт — синтез пропущен")
+            return None
+        try:
+            audio = _request(data, headers)
+        except requests.exceptions.Timeout:
+            # Таймаут не повторяем: ждать ещё раз столько же — не быстрее, чем отказать
+            breaker.record_failure()
+            metrics.incr(FAILURES_METRIC)
+            logger.error("[ERROR] Таймаут при обращении к SpeechKit API")
+            return None
+        except _TransientError as e:
+            breaker.record_failure()
+            metrics.incr(FAILURES_METRIC)
+            logger.error(f"[ERROR] Ошибка SpeechKit (попытка {attempt}/{MAX_ATTEMPTS}): {e}")
+            if attempt < MAX_ATTEMPTS:
+                metrics.incr(RETRIES_METRIC)
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1) * (1 + random.random()))
+            continue
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure()
+            metrics.incr(FAILURES_METRIC)
+            logger.error(f"[ERROR] Сетевая ошибка при синтезе речи: {str(e)}")
+            return None
+        except Exception:
+            # Непредвиденная ошибка не должна оставить пробный запрос «в полёте» навсегда
+            breaker.record_failure()
+            raise
+        # Сервис ответил (в том числе ошибкой запроса 4xx) — он доступен
+        breaker.record_success()
+        return audio
+    return None
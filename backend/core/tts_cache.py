@@ -0,0 +1,215 @@
+"""
+Дисковый кэш синтезированной речи (SpeechKit).
+
+Фразы вызова пациентов повторяются (буква и номер талона, кабинет), поэтому
+аудио хранится по содержимому запроса: ключ — sha256 от текста и параметров
+голоса. Файлы лежат в TTS_CACHE_DIR (общий volume для backend, SSE-сервиса и
+бота), размер каталога ограничен TTS_CACHE_MAX_BYTES: при превышении удаляются
+файлы, к которым дольше всего не обращались (mtime обновляется при каждом
+попадании), пока размер не опустится до 90% лимита. Размер каталога процесс
+ведёт в памяти и прибавляет к нему каждую запись; полный обход каталога
+(и вытеснение) — только когда счёт превысил лимит или прошло
+_RESCAN_INTERVAL секунд (другие процессы пишут в тот же каталог).
+
+Готовое аудио вызовов хранится по хэшу содержимого (put_audio) в отдельном
+подкаталоге calls/ и отдаётся экранам очереди по постоянному адресу
+(core.views.tts_audio). LRU-вытеснение его не трогает — адрес уже разослан
+экранам, и файл должен дожить до запроса; такие файлы удаляются по возрасту
+(TTS_CALL_AUDIO_TTL секунд с последней записи).
+
+Попадания, промахи и вытеснения считаются в core.metrics (tts_cache_*).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(getattr(settings, 'TTS_CACHE_DIR', settings.BASE_DIR / 'tts_cache'))
+MAX_BYTES = getattr(settings, 'TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+# После вытеснения каталог занимает не больше этой доли лимита — чтобы не чистить на каждой записи
+_LOW_WATERMARK = 0.9
+# Не реже чем раз в столько секунд размер каталога пересчитывается обходом (записи других процессов)
+_RESCAN_INTERVAL = 300
+
+# Аудио вызовов по адресам, разосланным экранам: вне LRU, удаляется по возрасту
+CALLS_DIR = CACHE_DIR / 'calls'
+CALL_AUDIO_TTL = getattr(settings, 'TTS_CALL_AUDIO_TTL', 24 * 60 * 60)
+
+HITS_METRIC = 'tts_cache_hits'
+MISSES_METRIC = 'tts_cache_misses'
+EVICTIONS_METRIC = 'tts_cache_evictions'
+metrics.register(HITS_METRIC, MISSES_METRIC, EVICTIONS_METRIC)
+
+_evict_lock = threading.Lock()
+# Оценка размера LRU-части каталога (байт) и время последнего обхода; None — ещё не считали
+_tracked_bytes = None
+_scanned_at = 0.0
+_calls_purged_at = 0.0
+
+
+def cache_key(text: str, params: dict) -> str:
+    """Ключ аудио: хэш текста и параметров синтеза (голос, скорость, адрес API)."""
+    payload = json.dumps({'text': text, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _path(key: str) -> Path:
+    return CACHE_DIR / key[:2] / f'{key}.audio'
+
+
+def _call_path(key: str) -> Path:
+    return CALLS_DIR / key[:2] / f'{key}.audio'
+
+
+def path_for(key: str) -> Optional[Path]:
+    """Путь к файлу аудио вызова (put_audio) или None; ключ — 64 hex-символа (защита от обхода каталогов)."""
+    if len(key) != 64 or any(c not in '0123456789abcdef' for c in key):
+        return None
+    return _call_path(key)
+
+
+def contains(key: str) -> bool:
+    """Есть ли аудио в кэше (не учитывается в метриках попаданий)."""
+    return _path(key).exists()
+
+
+def get(key: str) -> Optional[bytes]:
+    """Аудио из кэша или None (промах)."""
+    path = _path(key)
+    try:
+        audio = path.read_bytes()
+    except FileNotFoundError:
+        metrics.incr(MISSES_METRIC)
+        return None
+    except OSError as e:
+        logger.warning(f"[TTS_CACHE] Не удалось прочитать {path}: {e}")
+        metrics.incr(MISSES_METRIC)
+        return None
+
+    try:
+        # Отметка последнего использования для LRU-вытеснения
+        os.utime(path)
+    except OSError:
+        pass
+    metrics.incr(HITS_METRIC)
+    return audio
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Записать файл через временный и атомарную замену: параллельные читатели не увидят недописанный файл."""
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def put(key: str, audio: bytes) -> None:
+    """Сохранить аудио; ошибки диска не должны мешать воспроизведению вызова."""
+    global _tracked_bytes
+    try:
+        write_atomic(_path(key), audio)
+    except OSError as e:
+        logger.warning(f"[TTS_CACHE] Не удалось сохранить аудио {key}: {e}")
+        return
+
+    with _evict_lock:
+        if _tracked_bytes is not None:
+            _tracked_bytes += len(audio)
+        need_scan = (
+            _tracked_bytes is None
+            or _tracked_bytes > MAX_BYTES
+            or time.monotonic() - _scanned_at > _RESCAN_INTERVAL
+        )
+    if need_scan:
+        _evict()
+
+
+def put_audio(audio: bytes) -> str:
+    """Сохранить аудио вызова по хэшу содержимого (если его ещё нет) и вернуть ключ для tts_audio."""
+    key = hashlib.sha256(audio).hexdigest()
+    path = _call_path(key)
+    if path.exists():
+        try:
+            # Продлеваем срок хранения: адрес снова разослан экранам
+            os.utime(path)
+        except OSError:
+            pass
+    else:
+        try:
+            write_atomic(path, audio)
+        except OSError as e:
+            logger.warning(f"[TTS_CACHE] Не удалось сохранить аудио вызова {key}: {e}")
+    _purge_calls()
+    return key
+
+
+def _purge_calls() -> None:
+    """Удалить аудио вызовов старше CALL_AUDIO_TTL (не чаще раза в _RESCAN_INTERVAL секунд)."""
+    global _calls_purged_at
+    now = time.monotonic()
+    with _evict_lock:
+        if now - _calls_purged_at < _RESCAN_INTERVAL:
+            return
+        _calls_purged_at = now
+
+    expire_before = time.time() - CALL_AUDIO_TTL
+    purged = 0
+    for path in CALLS_DIR.glob('*/*.audio'):
+        try:
+            if path.stat().st_mtime < expire_before:
+                path.unlink()
+                purged += 1
+        except FileNotFoundError:
+            continue
+    if purged:
+        logger.info(f"[TTS_CACHE] Удалено устаревших аудио вызовов: {purged}")
+
+
+def _evict() -> None:
+    """Пересчитать размер каталога и удалить давно не использованные файлы, если он превысил лимит."""
+    global _tracked_bytes, _scanned_at
+    with _evict_lock:
+        entries = []
+        total = 0
+        # Только файлы вида <xx>/<key>.audio: аудио вызовов (calls/<xx>/...) сюда не попадает
+        for path in CACHE_DIR.glob('*/*.audio'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        _scanned_at = time.monotonic()
+        _tracked_bytes = total
+        if total <= MAX_BYTES:
+            return
+
+        entries.sort()
+        evicted = 0
+        for _, size, path in entries:
+            if total <= MAX_BYTES * _LOW_WATERMARK:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= size
+            evicted += 1
+        _tracked_bytes = total
+        metrics.incr(EVICTIONS_METRIC, evicted)
+        logger.info(f"[TTS_CACHE] Вытеснено файлов: {evicted}, размер кэша: {total} байт")
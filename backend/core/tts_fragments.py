@@ -0,0 +1,213 @@
+"""
+Сборка вызова пациента из заранее синтезированных фрагментов.
+
+Фраза вызова почти целиком постоянна: меняются только буква талона, число и
+номер кабинета. Каждая часть («Пациент с талоном номер», буква, слово числа,
+«пожалуйста подойдите в кабинет» …) синтезируется через SpeechKit один раз в
+сыром PCM (LINEAR16, 22050 Гц) и хранится в TTS_CACHE_DIR/fragments — без
+LRU-вытеснения, библиотека небольшая. Вызов собирается локально: тишина по
+краям фрагментов обрезается, между ними вставляются короткие паузы, результат
+упаковывается в WAV. Сеть нужна только для ещё не синтезированных фрагментов.
+
+Фразы, которые нельзя разложить на фрагменты (кабинет «3а», числа больше
+999), синтезируются целиком, как раньше.
+"""
+import array
+import io
+import logging
+import re
+import sys
+import wave
+from pathlib import Path
+from typing import List, Optional
+
+from . import metrics, speechkit, tts_cache
+
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 22050
+FRAGMENTS_DIR = tts_cache.CACHE_DIR / 'fragments'
+
+HITS_METRIC = 'tts_fragment_hits'
+MISSES_METRIC = 'tts_fragment_misses'
+ASSEMBLED_METRIC = 'tts_fragment_assembled'
+metrics.register(HITS_METRIC, MISSES_METRIC, ASSEMBLED_METRIC)
+
+# Паузы между фрагментами, миллисекунды
+_WORD_PAUSE_MS = 60
+_CLAUSE_PAUSE_MS = 250
+# Порог тишины при обрезке краёв фрагмента (амплитуда 16-битного сэмпла) и оставляемый запас
+_SILENCE_THRESHOLD = 300
+_EDGE_PADDING_MS = 20
+
+_HINTS = [
+    {"voice": "lera"},
+    {"role": "neutral"},
+    {"speed": 0.9},
+]
+_OUTPUT_SPEC = {"rawAudio": {"audioEncoding": "LINEAR16_PCM", "sampleRateHertz": SAMPLE_RATE}}
+
+_ONES = [
+    'ноль', 'один', 'два', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять',
+    'десять', 'одиннадцать', 'двенадцать', 'тринадцать', 'четырнадцать', 'пятнадцать',
+    'шестнадцать', 'семнадцать', 'восемнадцать', 'девятнадцать',
+]
+_TENS = ['', '', 'двадцать', 'тридцать', 'сорок', 'пятьдесят', 'шестьдесят', 'семьдесят', 'восемьдесят', 'девяносто']
+_HUNDREDS = ['', 'сто', 'двести', 'триста', 'четыреста', 'пятьсот', 'шестьсот', 'семьсот', 'восемьсот', 'девятьсот']
+
+_PAUSE = None  # маркер паузы между частями фразы
+
+
+def number_words(digits: str) -> Optional[List[str]]:
+    """
+    Слова числа из строки цифр: ведущие нули читаются как «ноль» («05» — «ноль пять»).
+
+    Returns:
+        Список слов или None, если это не число до 999
+    """
+    if not digits.isdigit():
+        return None
+    stripped = digits.lstrip('0')
+    words = ['ноль'] * (len(digits) - len(stripped))
+    if not stripped:
+        return words
+    value = int(stripped)
+    if value > 999:
+        return None
+    hundreds, rest = divmod(value, 100)
+    if hundreds:
+        words.append(_HUNDREDS[hundreds])
+    if rest >= 20:
+        words.append(_TENS[rest // 10])
+        if rest % 10:
+            words.append(_ONES[rest % 10])
+    elif rest:
+        words.append(_ONES[rest])
+    return words
+
+
+def patient_call_fragments(number_coupon: str, cabinet_number: str = "") -> Optional[list]:
+    """
+    Фрагменты фразы вызова (тексты и маркеры пауз) или None, если фразу нельзя собрать.
+    """
+    match = re.fullmatch(r'([^\W\d_]?)(\d+)', (number_coupon or '').strip())
+    if not match:
+        return None
+    letter, digits = match.groups()
+    coupon_words = number_words(digits)
+    if coupon_words is None:
+        return None
+
+    fragments = ['Пациент с талоном номер']
+    if letter:
+        fragments += [letter.upper(), _PAUSE]
+    fragments += coupon_words + [_PAUSE]
+
+    cabinet_number = (cabinet_number or '').strip()
+    if not cabinet_number:
+        return fragments + ['пожалуйста подойдите к врачу']
+    cabinet_words = number_words(cabinet_number)
+    if cabinet_words is None:
+        return None
+    return fragments + ['пожалуйста подойдите в кабинет'] + cabinet_words
+
+
+def _fragment_path(text: str) -> Path:
+    key = tts_cache.cache_key(text, {'hints': _HINTS, 'output': _OUTPUT_SPEC})
+    return FRAGMENTS_DIR / f'{key}.pcm'
+
+
+def _trim(pcm: bytes) -> bytes:
+    """Обрезать тишину по краям фрагмента, оставив небольшой запас."""
+    samples = array.array('h')
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    start = next((i for i, s in enumerate(samples) if abs(s) > _SILENCE_THRESHOLD), None)
+    if start is None:
+        return pcm
+    end = next(i for i in range(len(samples) - 1, -1, -1) if abs(samples[i]) > _SILENCE_THRESHOLD)
+    padding = SAMPLE_RATE * _EDGE_PADDING_MS // 1000
+    start, end = max(0, start - padding), min(len(samples), end + 1 + padding)
+    return pcm[start * 2:end * 2]
+
+
+def _silence(ms: int) -> bytes:
+    return b'\x00\x00' * (SAMPLE_RATE * ms // 1000)
+
+
+def fragment_available(text: str) -> bool:
+    return _fragment_path(text).exists()
+
+
+def load_fragment(text: str) -> Optional[bytes]:
+    """PCM фрагмента из библиотеки; отсутствующий синтезируется через SpeechKit и сохраняется."""
+    path = _fragment_path(text)
+    try:
+        pcm = path.read_bytes()
+        metrics.incr(HITS_METRIC)
+        return pcm
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"[TTS_FRAGMENTS] Не удалось прочитать фрагмент «{text}»: {e}")
+
+    metrics.incr(MISSES_METRIC)
+    logger.info(f"[TTS_FRAGMENTS] Синтез фрагмента: {text}")
+    pcm = speechkit.synthesize({"text": text, "hints": _HINTS, "outputAudioSpec": _OUTPUT_SPEC})
+    if not pcm:
+        return None
+    pcm = _trim(pcm)
+    try:
+        tts_cache.write_atomic(path, pcm)
+    except OSError as e:
+        logger.warning(f"[TTS_FRAGMENTS] Не удалось сохранить фрагмент «{text}»: {e}")
+    return pcm
+
+
+def library_texts(letters=()) -> List[str]:
+    """Все фрагменты библиотеки: постоянные части фразы, слова чисел до 999 и указанные буквы талонов."""
+    texts = ['Пациент с талоном номер', 'пожалуйста подойдите к врачу', 'пожалуйста подойдите в кабинет']
+    texts += [letter.upper() for letter in letters]
+    texts += _ONES + [word for word in _TENS + _HUNDREDS if word]
+    return list(dict.fromkeys(texts))
+
+
+def can_assemble_offline(number_coupon: str, cabinet_number: str = "") -> bool:
+    """Можно ли собрать вызов без обращения к SpeechKit."""
+    fragments = patient_call_fragments(number_coupon, cabinet_number)
+    return fragments is not None and all(fragment_available(text) for text in fragments if text is not _PAUSE)
+
+
+def assemble_patient_call(number_coupon: str, cabinet_number: str = "") -> Optional[bytes]:
+    """
+    Собрать вызов пациента в WAV из фрагментов.
+
+    Returns:
+        WAV или None — фразу нельзя разложить на фрагменты или фрагмент не синтезировался
+    """
+    fragments = patient_call_fragments(number_coupon, cabinet_number)
+    if fragments is None:
+        return None
+
+    parts = []
+    for index, text in enumerate(fragments):
+        if text is _PAUSE:
+            parts.append(_silence(_CLAUSE_PAUSE_MS))
+            continue
+        pcm = load_fragment(text)
+        if pcm is None:
+            return None
+        if parts and fragments[index - 1] is not _PAUSE:
+            parts.append(_silence(_WORD_PAUSE_MS))
+        parts.append(pcm)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(b''.join(parts))
+    metrics.incr(ASSEMBLED_METRIC)
+    return buffer.getvalue()
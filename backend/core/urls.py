@@ -4,6 +4,8 @@ from .views import *
 
 urlpatterns = [
     path('health/', health_check, name='health_check'),
+    path('metrics/', performance_metrics, name='performance_metrics'),
+    path('tts/<str:key>/', tts_audio, name='tts_audio'),
 
     path('document/commercial/full/', document_commercial_proposal_full, name='document_commercial_proposal_full'),
     path('document/commercial/life/', document_commercial_proposal_life, name='document_commercial_proposal_life'),
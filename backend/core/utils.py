@@ -1,7 +1,6 @@
 import os
 import logging
 import requests
-import base64
 import asyncio
 from datetime import datetime
 from django.conf import settings
@@ -17,6 +16,8 @@ from aiogram.types import (
 )
 from aiogram.filters import Command
 
+from . import speechkit, tts_cache, tts_fragments
+
 
 logger = logging.getLogger(__name__)
 
@@ -95,93 +96,77 @@ def user_verification(user, role_user, text_error):
         )
     return True
 
-def patient_call_synthesis_in_memory(patient_name, number_coupon, cabinet_number=""):
+def patient_call_speech(number_coupon, cabinet_number=""):
     """
-    Синтез речи для вызова пациента через Yandex SpeechKit (возвращает аудио в памяти)
+    Текст и параметры синтеза вызова пациента.
+
+    Returns:
+        (data для SpeechKit v3, ключ аудио в core.tts_cache)
     """
-    try:
-        # Проверяем наличие API ключа
-        api_key = getattr(settings, 'SPEECHKIT_API_KEY_V3')
-        folder_id = getattr(settings, 'SPEECHKIT_FOLDER_ID_V3')
+    # Форматируем номер талона для произношения (если талон есть)
+    number_coupon_res = ''
+    if number_coupon:
+        number_coupon1 = number_coupon[:1] if len(number_coupon) >= 1 else ''
+        number_coupon2 = number_coupon[1:] if len(number_coupon) > 1 else ''
+        number_coupon_res = f'{number_coupon1} sil<[1]>{number_coupon2}'
+
+    if not cabinet_number:
+        text = f"Пациент с талоном номер {number_coupon_res}, пожалуйста подойдите к врачу."
+    else:
+        text = f"Пациент с талоном номер {number_coupon_res}, пожалуйста подойдите в кабинет {cabinet_number}."
+
+    data = {
+        "text": text,
+        "hints": [
+            { "voice": "lera" },
+            { "role": "neutral" },
+            { "speed": 0.9 }
+        ]
+    }
 
-        if not api_key:
-            logger.warning("SPEECHKIT_API_KEY_V3 не настроен в settings")
-            return None
-        if not folder_id:
-            logger.warning("SPEECHKIT_FOLDER_ID_V3 не настроен в settings")
-            return None
-        
-        headers = {
-            "Authorization": f"Api-Key {api_key}",
-            "x-folder-id": f"{folder_id}",
-        }
-
-        # Форматируем номер талона для произношения (если талон есть)
-        number_coupon_res = ''
-        if number_coupon:
-            number_coupon1 = number_coupon[:1] if len(number_coupon) >= 1 else ''
-            number_coupon2 = number_coupon[1:] if len(number_coupon) > 1 else ''
-            number_coupon_res = f'{number_coupon1} sil<[1]>{number_coupon2}'
-
-        if not cabinet_number:
-            text = f"Пациент с талоном номер {number_coupon_res}, пожалуйста подойдите к врачу."
-        else:
-            text = f"Пациент с талоном номер {number_coupon_res}, пожалуйста подойдите в кабинет {cabinet_number}."
+    cache_key = tts_cache.cache_key(text, {'url': settings.SPEECHKIT_URL_V3, 'hints': data['hints']})
+    return data, cache_key
 
-        data = {
-            "text": text,
-            "hints": [
-                { "voice": "lera" },
-                { "role": "neutral" },
-                { "speed": 0.9 }
-            ]
-        }
 
-        logger.info(f"[SPEECH] Синтез речи в памяти: {text}")
+def patient_call_audio_cached(number_coupon, cabinet_number=""):
+    """Можно ли получить вызов без обращения к SpeechKit: из фрагментов или из кэша фраз."""
+    if tts_fragments.can_assemble_offline(number_coupon, cabinet_number):
+        return True
+    _, cache_key = patient_call_speech(number_coupon, cabinet_number)
+    return tts_cache.contains(cache_key)
 
-        response = requests.post(
-            settings.SPEECHKIT_URL_V3,
-            headers=headers,
-            json=data,
-            timeout=5
-        )
 
-        if response.status_code == 200:
-            # v3 API возвращает JSON-стрим: каждая строка — JSON с audioChunk.data (base64)
-            import json as _json
-            audio_chunks = []
-            for line in response.content.decode('utf-8').strip().split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    chunk = _json.loads(line)
-                    b64 = chunk.get('result', {}).get('audioChunk', {}).get('data', '')
-                    if b64:
-                        audio_chunks.append(base64.b64decode(b64))
-                except Exception:
-                    continue
-            if not audio_chunks:
-                logger.error("[ERROR] Не удалось извлечь аудио-чанки из ответа SpeechKit")
-                return None
-            combined = b''.join(audio_chunks)
-            audio_base64 = base64.b64encode(combined).decode('utf-8')
-            logger.info(f"[OK] Аудио синтезировано для {patient_name} (размер: {len(combined)} байт)")
-            return audio_base64
-        else:
-            error_msg = f"Ошибка синтеза речи: {response.status_code}"
-            logger.error(f"[ERROR] {error_msg} - {response.text}")
-            
-            if response.status_code == 401:
-                logger.error("[ERROR] Проверьте SPEECHKIT_API_KEY и права доступа в Yandex Cloud")
-            
+def patient_call_synthesis_in_memory(patient_name, number_coupon, cabinet_number=""):
+    """
+    Синтез речи для вызова пациента через Yandex SpeechKit.
+
+    Вызов собирается из библиотеки фрагментов (core.tts_fragments) без обращения к API;
+    фразы, которые нельзя разложить на фрагменты, берутся из дискового кэша
+    (core.tts_cache) или синтезируются целиком.
+
+    Returns:
+        Аудио (WAV или OGG) или None при ошибке
+    """
+    try:
+        assembled = tts_fragments.assemble_patient_call(number_coupon, cabinet_number)
+        if assembled is not None:
+            logger.info(f"[SPEECH] Вызов собран из фрагментов: талон {number_coupon}, кабинет {cabinet_number or '-'}")
+            return assembled
+
+        data, cache_key = patient_call_speech(number_coupon, cabinet_number)
+        text = data['text']
+        cached_audio = tts_cache.get(cache_key)
+        if cached_audio is not None:
+            logger.info(f"[SPEECH] Аудио из кэша: {text}")
+            return cached_audio
+
+        logger.info(f"[SPEECH] Синтез речи в памяти: {text}")
+        combined = speechkit.synthesize(data)
+        if combined is None:
             return None
-    except requests.exceptions.Timeout:
-        logger.error("[ERROR] Таймаут при обращении к SpeechKit API")
-        return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"[ERROR] Сетевая ошибка при синтезе речи: {str(e)}")
-        return None
+        tts_cache.put(cache_key, combined)
+        logger.info(f"[OK] Аудио синтезировано для {patient_name} (размер: {len(combined)} байт)")
+        return combined
     except Exception as e:
         logger.exception(f"[ERROR] Исключение при синтезе речи для {patient_name}: {str(e)}")
         return None
@@ -228,6 +213,11 @@ async def run_bot_async():
             ).order_by('time_start')
         )
 
+    @sync_to_async
+    def call_next(doctor):
+        from appointment.queue_calls import call_next as call_next_patient
+        return call_next_patient(doctor)
+
     @sync_to_async
     def get_appointment(appointment_id):
         from appointment.models import Appointment
@@ -236,7 +226,13 @@ async def run_bot_async():
     @sync_to_async
     def set_status(appointment_id, new_status):
         from appointment.models import Appointment
-        return Appointment.objects.filter(id=appointment_id).update(status=new_status) > 0
+        # Сохраняем через экземпляр (а не queryset.update), чтобы сработали сигналы модели
+        appointment = Appointment.objects.filter(id=appointment_id).first()
+        if not appointment or not appointment.can_change_status(new_status):
+            return False
+        appointment.status = new_status
+        appointment.save(update_fields=['status', 'updated_at'])
+        return True
 
     # --------------- UI helpers ---------------
 
@@ -335,20 +331,14 @@ async def run_bot_async():
         if not doctor:
             await callback.answer("❌ Доступ запрещён", show_alert=True)
             return
-        appointments = await get_today_queue(doctor.id)
-        next_apt = next(
-            (a for a in appointments if a.status in ('pending', 'confirmed')), None
-        )
+        # Выбор и приглашение — одной атомарной операцией на сервере (общей с вебом)
+        next_apt, called = await call_next(doctor)
         if not next_apt:
             await callback.answer("Ожидающих пациентов нет", show_alert=True)
             return
-        ok = await set_status(next_apt.id, 'invited')
-        if ok:
-            coupon = next_apt.number_coupon or next_apt.time_start.strftime('%H:%M')
-            await callback.answer(f"✅ Приглашён: {coupon}")
-            await send_queue(callback, doctor)
-        else:
-            await callback.answer("Ошибка обновления", show_alert=True)
+        coupon = next_apt.number_coupon or next_apt.time_start.strftime('%H:%M')
+        await callback.answer(f"✅ Приглашён: {coupon}" if called else f"Уже приглашён: {coupon}")
+        await send_queue(callback, doctor)
 
     @dp.callback_query(F.data.startswith('invite:'))
     async def cb_invite(callback: CallbackQuery):
@@ -2,11 +2,13 @@ import logging
 
 from datetime import datetime
 
+from django.http import FileResponse, HttpResponseNotModified
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from . import metrics, tts_cache
 from .models import *
 from .serializers import *
 from .utils import *
@@ -23,6 +25,46 @@ def health_check(request):
     return Response({'status': 'healthy', 'service': 'backend'}, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def performance_metrics(request):
+    """Счётчики производительности (кэши, внешние сервисы) — только для суперадминистраторов"""
+    user = request.user
+    if not (user.is_staff or user.role == 'super_admin'):
+        logger.warning(f"Пользователь {user} пытается получить метрики без прав")
+        return Response({'error': 'У вас нет прав для просмотра метрик'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(metrics.snapshot(), status=status.HTTP_200_OK)
+
+
+# Аудио по хэшу содержимого не меняется — браузер и прокси кэшируют его бессрочно
+TTS_AUDIO_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def tts_audio(request, key):
+    """Аудио голосового вызова по ключу (sha256 содержимого) из core.tts_cache"""
+    path = tts_cache.path_for(key)
+    if path is None:
+        return Response({'error': 'Некорректный ключ аудио'}, status=status.HTTP_400_BAD_REQUEST)
+
+    etag = f'"{key}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            audio_file = open(path, 'rb')
+        except FileNotFoundError:
+            return Response({'error': 'Аудио не найдено'}, status=status.HTTP_404_NOT_FOUND)
+        # Вызовы, собранные из фрагментов, — WAV (заголовок RIFF), синтезированные целиком — OGG
+        content_type = 'audio/wav' if audio_file.read(4) == b'RIFF' else 'audio/ogg'
+        audio_file.seek(0)
+        response = FileResponse(audio_file, content_type=content_type)
+    response['Cache-Control'] = TTS_AUDIO_CACHE_CONTROL
+    response['ETag'] = etag
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def document_commercial_proposal_full(request):
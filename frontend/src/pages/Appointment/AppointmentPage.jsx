@@ -114,7 +114,7 @@ const AppointmentPage = () => {
                 minDate={getTodayDate()}
             />
 
-            {search.searched && !search.loading && (
+            {search.searched && (
                 <DoctorsList
                     doctors={search.doctors}
                     onSlotClick={booking.openModal}
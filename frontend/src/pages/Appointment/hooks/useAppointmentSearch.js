@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import appointmentAPI from '../../../services/appointment';
 
 /**
@@ -19,6 +19,10 @@ export function useAppointmentSearch({ notify }) {
     const [doctors, setDoctors] = useState([]);
     const [loading, setLoading] = useState(false);
     const [searched, setSearched] = useState(false);
+    // Контроллер текущего потокового поиска: новый поиск и размонтирование прерывают предыдущий
+    const searchAbortRef = useRef(null);
+
+    useEffect(() => () => searchAbortRef.current?.abort(), []);
 
     // Загрузка услуг и городов при монтировании
     useEffect(() => {
@@ -64,31 +68,44 @@ export function useAppointmentSearch({ notify }) {
             return;
         }
 
+        searchAbortRef.current?.abort();
+        const controller = new AbortController();
+        searchAbortRef.current = controller;
+
         const loadingId = notify.loading('Поиск врачей...');
         setLoading(true);
         setSearched(true);
+        setDoctors([]);
 
         try {
-            const result = await appointmentAPI.searchDoctors(
+            // Врачи появляются в списке по мере расчёта, не дожидаясь конца поиска
+            const result = await appointmentAPI.searchDoctorsStream(
                 params.service,
                 params.city,
-                params.date
+                params.date,
+                (doctor) => setDoctors((prev) => [...prev, doctor]),
+                { signal: controller.signal }
             );
 
-            setDoctors(result.doctors || []);
             notify.hide(loadingId);
 
-            if (result.doctors.length === 0) {
+            if (result.count === 0) {
                 notify.error('К сожалению, свободных слотов не найдено. Попробуйте другую дату или услугу.');
             } else {
-                notify.success(`Найдено врачей: ${result.doctors.length}`);
+                notify.success(`Найдено врачей: ${result.count}`);
             }
         } catch (err) {
-            console.error('Ошибка поиска:', err);
             notify.hide(loadingId);
+            if (err.name === 'AbortError') {
+                return;
+            }
+            console.error('Ошибка поиска:', err);
             notify.error('Произошла ошибка при поиске. Попробуйте еще раз.');
         } finally {
-            setLoading(false);
+            if (searchAbortRef.current === controller) {
+                searchAbortRef.current = null;
+                setLoading(false);
+            }
         }
     };
 
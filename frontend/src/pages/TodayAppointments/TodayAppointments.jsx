@@ -28,44 +28,25 @@ const TodayAppointments = () => {
         });
     };
 
-    // Функция воспроизведения аудио из base64
-    const playAudioFromBase64 = (base64Audio) => {
+    // Функция воспроизведения аудио по ссылке (аудио кэшируется браузером по хэшу содержимого)
+    const playAudioFromUrl = (audioUrl) => {
         if (!audioEnabled) {
             console.warn('⚠️ Аудио не активировано. Нажмите кнопку "Включить звук"');
             return;
         }
 
         try {
-            // Декодируем base64 в binary
-            const binaryString = atob(base64Audio);
-            const bytes = new Uint8Array(binaryString.length);
-            for (let i = 0; i < binaryString.length; i++) {
-                bytes[i] = binaryString.charCodeAt(i);
-            }
-            
-            // Создаем blob из binary data
-            const blob = new Blob([bytes], { type: 'audio/ogg; codecs=opus' });
-            const url = URL.createObjectURL(blob);
-            
             // Останавливаем предыдущее аудио если играет
             if (audioRef.current) {
                 audioRef.current.pause();
-                if (audioRef.current.src.startsWith('blob:')) {
-                    URL.revokeObjectURL(audioRef.current.src);
-                }
             }
             
             // Создаем новый Audio объект
-            const audio = new Audio(url);
+            const audio = new Audio(audioUrl);
             audio.volume = 1.0;
             audioRef.current = audio;
             
-            audio.onloadedmetadata = () => {
-            };
-            
             audio.onended = () => {
-                // Очищаем ресурсы после воспроизведения
-                URL.revokeObjectURL(url);
                 isPlayingRef.current = false;
                 
                 // Проигрываем следующее аудио из очереди
@@ -75,7 +56,6 @@ const TodayAppointments = () => {
             audio.onerror = (e) => {
                 console.error('❌ Ошибка воспроизведения аудио:', e);
                 console.error('Audio error details:', audio.error);
-                URL.revokeObjectURL(url);
                 isPlayingRef.current = false;
                 playNextAudio();
             };
@@ -85,13 +65,12 @@ const TodayAppointments = () => {
             audio.play().then(() => {
             }).catch(error => {
                 console.error('❌ Не удалось воспроизвести аудио:', error);
-                URL.revokeObjectURL(url);
                 isPlayingRef.current = false;
                 playNextAudio();
             });
             
         } catch (error) {
-            console.error('❌ Ошибка при обработке base64 аудио:', error);
+            console.error('❌ Ошибка при воспроизведении аудио:', error);
             isPlayingRef.current = false;
             playNextAudio();
         }
@@ -101,16 +80,16 @@ const TodayAppointments = () => {
     const playNextAudio = () => {
         if (audioQueueRef.current.length > 0 && !isPlayingRef.current) {
             const nextAudio = audioQueueRef.current.shift();
-            playAudioFromBase64(nextAudio);
+            playAudioFromUrl(nextAudio);
         }
     };
 
     // Обработчик голосовых объявлений из SSE
     const handleVoiceAnnouncement = (announcement) => {
-        if (announcement.audio_base64) {
+        if (announcement.audio_url) {
             
             // Добавляем в очередь
-            audioQueueRef.current.push(announcement.audio_base64);
+            audioQueueRef.current.push(announcement.audio_url);
             
             // Если ничего не играет, начинаем воспроизведение
             if (!isPlayingRef.current) {
@@ -2,6 +2,17 @@ import { useState, useEffect, useRef } from 'react';
 import axios from '../../../services/axios';
 import { useAuth } from '../../../contexts/AuthContext';
 
+/**
+ * Применяет дельту SSE к списку записей (порядок — по времени начала, как на сервере)
+ */
+const applyQueueDelta = (appointments, upsert, remove) => {
+    const changedIds = new Set([...remove, ...upsert.map(apt => apt.id)]);
+    return appointments
+        .filter(apt => !changedIds.has(apt.id))
+        .concat(upsert)
+        .sort((a, b) => (a.time_start || '').localeCompare(b.time_start || '') || a.id - b.id);
+};
+
 /**
  * Хук для отображения электронной очереди с SSE обновлениями
  * 
@@ -16,6 +27,8 @@ export const useElectronicQueue = (clinicId, onVoiceAnnouncement) => {
     const [isElectronicQueue, setIsElectronicQueue] = useState(false);
     const [reconnectTrigger, setReconnectTrigger] = useState(0);
     const eventSourceRef = useRef(null);
+    // Последний SSE id ("<дата>:<версия>") — при переподключении сервер пришлёт только пропущенные изменения
+    const lastEventIdRef = useRef({ clinicId: null, id: null });
     const onVoiceAnnouncementRef = useRef(onVoiceAnnouncement);
 
     // Обновляем ref при изменении callback
@@ -39,7 +52,12 @@ export const useElectronicQueue = (clinicId, onVoiceAnnouncement) => {
             eventSourceRef.current.close();
         }
 
-        const url = `${axios.defaults.baseURL}appointment/clinic/${clinicId}/queue/sse/`;
+        if (lastEventIdRef.current.clinicId !== clinicId) {
+            lastEventIdRef.current = { clinicId, id: null };
+        }
+        const lastEventId = lastEventIdRef.current.id;
+        const url = `${axios.defaults.baseURL}appointment/clinic/${clinicId}/queue/sse/`
+            + (lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '');
         const eventSource = new EventSource(url);
 
         eventSource.onopen = () => {
@@ -48,6 +66,9 @@ export const useElectronicQueue = (clinicId, onVoiceAnnouncement) => {
 
         eventSource.onmessage = (event) => {
             const data = JSON.parse(event.data);
+            if (event.lastEventId) {
+                lastEventIdRef.current.id = event.lastEventId;
+            }
             
             if (data.type === 'connected') {
                 // console.log('Connected to SSE:', data);
@@ -55,30 +76,27 @@ export const useElectronicQueue = (clinicId, onVoiceAnnouncement) => {
                 // Начальная загрузка всех записей на сегодня
                 setAppointments(data.appointments || []);
                 setIsElectronicQueue(true);
-            } else if (data.type === 'update') {
-                // Обновление всех записей
-                setAppointments(data.appointments || []);
-                
-                // Обработка голосовых объявлений
+            } else if (data.type === 'delta') {
+                // Изменения очереди: обновлённые/новые записи и удалённые id
+                const upsert = data.upsert || [];
+                const remove = data.remove || [];
+                if (upsert.length > 0 || remove.length > 0) {
+                    setAppointments(prev => applyQueueDelta(prev, upsert, remove));
+                }
+            } else if (data.type === 'voice') {
+                // Голосовые объявления (синтезируются сервером один раз на клинику)
                 if (data.voice_announcements && data.voice_announcements.length > 0) {
+                    // Сервер присылает путь к аудио; baseURL может указывать на другой хост (dev)
+                    const apiOrigin = new URL(axios.defaults.baseURL, window.location.origin);
                     data.voice_announcements.forEach(announcement => {
                         if (onVoiceAnnouncementRef.current) {
-                            onVoiceAnnouncementRef.current(announcement);
+                            onVoiceAnnouncementRef.current({
+                                ...announcement,
+                                audio_url: announcement.audio_url && new URL(announcement.audio_url, apiOrigin).href,
+                            });
                         }
                     });
                 }
-            } else if (data.type === 'new') {
-                // Новая запись (может быть создана другим админом)
-                setAppointments(prev => {
-                    // Проверяем, чтобы не добавить дубликат
-                    if (prev.some(apt => apt.id === data.appointment.id)) {
-                        return prev;
-                    }
-                    return [data.appointment, ...prev];
-                });
-            } else if (data.type === 'delete') {
-                // Удаление записи
-                setAppointments(prev => prev.filter(apt => apt.id !== data.appointment_id));
             }
         };
 
@@ -1,4 +1,6 @@
 import api from './api';
+import { getCSRFToken } from './axios';
+import { API_BASE_URL } from '../config';
 
 
 const appointmentAPI = {
@@ -30,6 +32,55 @@ const appointmentAPI = {
         return response.data;
     },
 
+    // Потоковый поиск врачей (NDJSON): onDoctor вызывается для каждого врача по мере расчёта.
+    // Возвращает { count, next_cursor } — next_cursor передаётся в cursor для следующей страницы
+    searchDoctorsStream: async (service, city, date, onDoctor, { limit, cursor, signal } = {}) => {
+        const headers = { 'Content-Type': 'application/json' };
+        const csrfToken = getCSRFToken();
+        if (csrfToken) {
+            headers['X-CSRFToken'] = csrfToken;
+        }
+        const response = await fetch(`${API_BASE_URL.replace(/\/$/, '')}/appointment/search/`, {
+            method: 'POST',
+            credentials: 'include',
+            headers,
+            signal,
+            body: JSON.stringify({ service, city, date, stream: true, limit, cursor }),
+        });
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.error || `Ошибка поиска: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = { count: 0, next_cursor: null };
+
+        const handleLine = (line) => {
+            if (!line.trim()) return;
+            const message = JSON.parse(line);
+            if (message.type === 'doctor') {
+                onDoctor(message.doctor);
+            } else if (message.type === 'end') {
+                result = { count: message.count, next_cursor: message.next_cursor };
+            } else if (message.type === 'error') {
+                throw new Error(message.message);
+            }
+        };
+
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer + decoder.decode());
+        return result;
+    },
+
     // Создание новой записи на приём
     createAppointment: async (appointmentData) => {
         const response = await api.post('/appointment/create/', {
@@ -13,7 +13,7 @@ const apiClient = axios.create({
 
 
 // Функция для получения CSRF токена из cookie
-const getCSRFToken = () => {
+export const getCSRFToken = () => {
     const name = 'csrftoken';
     let cookieValue = null;
     if (document.cookie && document.cookie !== '') {